@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+渲染性能基准测试 (合成素材 + 离线 TTS 替身)
+
+用 ffmpeg lavfi (testsrc2 + sine) 生成不同时长/分辨率/GOP 的源视频，
+随机生成 10~1000 个场景的脚本 (混合变速、多子片段)，
+直接调用 render_core.render (render_engine.py / narrato.py 共用的实现)，
+对每组渲染参数 (并行数、切割方式、分辨率等) 测量吞吐量 = 输出秒数 / 墙钟秒数，结果存为 JSON。
+
+用法:
+  python bench_render.py --quick                          # 小矩阵，几分钟内完成
+  python bench_render.py                                  # 完整矩阵
+  python bench_render.py --compare bench_results/base.json  # 与基线对比，退化超阈值返回 1
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (时长秒, 分辨率, GOP)
+SOURCES_QUICK = [(60, "640x360", 50)]
+SOURCES_FULL = [(60, "640x360", 50), (300, "1280x720", 250), (600, "1920x1080", 25)]
+
+SCENES_QUICK = [10]
+SCENES_FULL = [10, 100, 1000]
+
+# workers 显式给出，结果不随 RENDER_WORKERS 环境变量变化
+SETTINGS_QUICK = [
+    {"resolution": "native", "cut_method": "pad", "workers": 1},
+    {"resolution": "native", "cut_method": "cut", "workers": 4},
+]
+SETTINGS_FULL = [
+    {"resolution": "native", "cut_method": "pad", "workers": 1},
+    {"resolution": "native", "cut_method": "cut", "workers": 1},
+    {"resolution": "native", "cut_method": "pad", "workers": 2},
+    {"resolution": "native", "cut_method": "pad", "workers": 4},
+    {"resolution": "native", "cut_method": "cut", "workers": 4},
+    {"resolution": "360p", "cut_method": "cut", "workers": 1},
+    {"resolution": "720p", "cut_method": "pad", "workers": 1, "burn_subtitles": True},
+    {"resolution": "native", "cut_method": "pad", "workers": 1, "renditions": ["360p", "720p"]},
+]
+
+SPEEDS = [0.5, 1.0, 1.0, 1.0, 1.5, 2.0]
+TTS_SECONDS_PER_CHAR = 0.22
+FILLER_CHARS = "今天我们来看一部关于时间与记忆的电影主角在城市中寻找失落的答案"
+
+
+def run(cmd):
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def probe_duration(path):
+    out = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration",
+         "-of", "default=noprint_wrappers=1:nokey=1", path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+    ).stdout.strip()
+    return float(out) if out else 0.0
+
+
+def make_source(work_dir, duration, size, gop):
+    """testsrc2 画面 + sine 原声，按参数缓存"""
+    path = os.path.join(work_dir, f"src_{duration}s_{size}_g{gop}.mp4")
+    if not os.path.exists(path):
+        run([
+            "ffmpeg", "-y",
+            "-f", "lavfi", "-i", f"testsrc2=size={size}:rate=25:duration={duration}",
+            "-f", "lavfi", "-i", f"sine=frequency=220:sample_rate=44100:duration={duration}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-g", str(gop),
+            "-c:a", "aac", "-shortest", path
+        ])
+    return path
+
+
+def make_script(num_scenes, source_duration, seed):
+    """随机脚本: 1~3 个子片段、混合变速、5~40 字配音"""
+    rng = random.Random(seed)
+    scenes = []
+    for _ in range(num_scenes):
+        fragments = []
+        for _ in range(rng.choice([1, 1, 2, 3])):
+            length = rng.uniform(1.0, 4.0)
+            start = rng.uniform(0, max(0.0, source_duration - length))
+            fragments.append({
+                "start": f"{start:.2f}",
+                "end": f"{start + length:.2f}",
+                "speed": rng.choice(SPEEDS)
+            })
+        text = "".join(rng.choice(FILLER_CHARS) for _ in range(rng.randint(5, 40)))
+        scenes.append({"fragments": fragments, "voiceover": text})
+    return scenes
+
+
+def make_offline_tts(work_dir, script):
+    """
+    离线 TTS 替身: 按字数生成等长的正弦音频，并写出均匀分布的逐词计时
+
+    相同时长 (0.1s 粒度) 的音频共用一个文件，千场景脚本也只需少量 ffmpeg 调用。
+    """
+    audio_dir = os.path.join(work_dir, "tts")
+    os.makedirs(audio_dir, exist_ok=True)
+    audio_files = {}
+    word_timings = {}
+    for idx, scene in enumerate(script):
+        text = scene["voiceover"]
+        dur = round(len(text) * TTS_SECONDS_PER_CHAR, 1)
+        path = os.path.join(audio_dir, f"tts_{int(dur * 10)}.mp3")
+        if not os.path.exists(path):
+            run([
+                "ffmpeg", "-y", "-f", "lavfi",
+                "-i", f"sine=frequency=660:sample_rate=24000:duration={dur}",
+                "-ac", "1", "-b:a", "48k", path
+            ])
+        audio_files[str(idx)] = path
+        words = [text[i:i + 2] for i in range(0, len(text), 2)]
+        step = dur / len(words)
+        word_timings[str(idx)] = [
+            {"start": i * step, "end": (i + 1) * step, "text": w} for i, w in enumerate(words)
+        ]
+    return audio_files, word_timings
+
+
+def render_once(source, script, audio_files, word_timings, setting):
+    """执行一次渲染，返回 (输出路径, 剖析汇总)"""
+    import render_core
+    profiler = render_core.RenderProfiler()
+    final_path = render_core.render(
+        source, script, audio_files,
+        resolution=setting.get("resolution", "native"),
+        cut_method=setting.get("cut_method", "pad"),
+        renditions=setting.get("renditions"),
+        burn_subtitles=setting.get("burn_subtitles", False),
+        word_timings=word_timings,
+        profiler=profiler,
+        workers=setting.get("workers")
+    )
+    summary = {f"{cat}:{name}": round(row[1], 3) for (cat, name), row in profiler.summary().items()}
+    return final_path, summary
+
+
+def setting_key(setting):
+    return ",".join(f"{k}={setting[k]}" for k in sorted(setting))
+
+
+def ffmpeg_version():
+    try:
+        out = subprocess.run(["ffmpeg", "-version"], stdout=subprocess.PIPE, text=True).stdout
+        return out.splitlines()[0] if out else "unknown"
+    except OSError:
+        return "unavailable"
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=REPO_DIR,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        ).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def compare(results, baseline_path, threshold):
+    """与基线逐项对比吞吐量，返回退化项列表"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r["key"]: r for r in json.load(f)["results"]}
+    regressions = []
+    print(f"\n与基线对比: {baseline_path} (阈值 {threshold:.0%})")
+    for r in results:
+        base = baseline.get(r["key"])
+        if not base or not base["throughput"]:
+            continue
+        change = r["throughput"] / base["throughput"] - 1
+        flag = "退化" if change < -threshold else "ok"
+        print(f"  [{flag}] {r['key']}: {base['throughput']:.2f} -> {r['throughput']:.2f} ({change:+.1%})")
+        if change < -threshold:
+            regressions.append(r["key"])
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NarratoAI 渲染基准测试")
+    parser.add_argument("--quick", action="store_true", help="只跑小矩阵")
+    parser.add_argument("--scenes", type=int, action="append", help="覆盖场景数矩阵 (可重复)")
+    parser.add_argument("--work-dir", default=os.path.join(REPO_DIR, "bench_work"), help="合成素材与渲染临时目录")
+    parser.add_argument("--output", "-o", help="结果 JSON 路径 (默认 bench_results/<时间戳>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="与基线结果 JSON 对比")
+    parser.add_argument("--threshold", type=float, default=0.10, help="吞吐量下降超过该比例视为退化")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    sources = SOURCES_QUICK if args.quick else SOURCES_FULL
+    scene_counts = args.scenes or (SCENES_QUICK if args.quick else SCENES_FULL)
+    settings = SETTINGS_QUICK if args.quick else SETTINGS_FULL
+
+    work_dir = os.path.abspath(args.work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    output_path = os.path.abspath(args.output or os.path.join(
+        REPO_DIR, "bench_results", datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + ".json"))
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    # 相对路径按启动目录解析 (下面会切换工作目录)；基线不存在时在渲染前就报错
+    baseline_path = os.path.abspath(args.compare) if args.compare else None
+    if baseline_path and not os.path.isfile(baseline_path):
+        parser.error(f"基线文件不存在: {baseline_path}")
+
+    # 中间文件目录 (temp_render) 建在工作目录下，避免影响仓库目录
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(work_dir)
+    from render_core import config
+    config.prepare_temp_dir()
+
+    results = []
+    for duration, size, gop in sources:
+        print(f"[素材] {duration}s {size} GOP={gop}")
+        source = make_source(work_dir, duration, size, gop)
+        for num_scenes in scene_counts:
+            script = make_script(num_scenes, duration, args.seed)
+            audio_files, word_timings = make_offline_tts(work_dir, script)
+            for setting in settings:
+                key = f"{duration}s_{size}_g{gop}|{num_scenes}|{setting_key(setting)}"
+                start = time.perf_counter()
+                try:
+                    final_path, stages = render_once(source, script, audio_files, word_timings, setting)
+                except Exception as e:
+                    print(f"  [失败] {key}: {e}")
+                    results.append({"key": key, "error": str(e), "throughput": 0.0})
+                    continue
+                wall = time.perf_counter() - start
+                out_seconds = probe_duration(final_path)
+                throughput = out_seconds / wall if wall > 0 else 0.0
+                print(f"  {key}: {out_seconds:.1f}s 输出 / {wall:.1f}s = {throughput:.2f}x")
+                results.append({
+                    "key": key,
+                    "source": {"duration": duration, "size": size, "gop": gop},
+                    "scenes": num_scenes,
+                    "setting": setting,
+                    "wall_seconds": round(wall, 3),
+                    "output_seconds": round(out_seconds, 3),
+                    "throughput": round(throughput, 4),
+                    "stages": stages
+                })
+
+    report = {
+        "version": git_revision(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "ffmpeg": ffmpeg_version(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "results": results
+    }
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n[导出] 结果: {output_path}")
+
+    if baseline_path:
+        regressions = compare(results, baseline_path, args.threshold)
+        if regressions:
+            print(f"\n❌ {len(regressions)} 项性能退化")
+            sys.exit(1)
+        print("\n✅ 无性能退化")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,11 @@
-import sqlite3
-import json
+import os
 
-try:
-    con = sqlite3.connect("instance/database.sqlite")
-    cur = con.cursor()
-    # Correctly query the database based on the schema in database.py
-    res = cur.execute("SELECT value FROM app_data WHERE key = 'main_db'")
-    row = res.fetchone()
+from project.database import open_db
 
-    if row:
-        json_data_str = row[0]
-        data = json.loads(json_data_str)
+try:
+    if os.path.exists("instance/database.sqlite"):
+        # Read through project.database so the per-entity table layout is handled
+        data = open_db("instance/database.sqlite")
 
         articles = data.get("articles", {})
         print(f"Found {len(articles)} articles.")
@@ -23,8 +18,6 @@ try:
                  print(f"Content: {article_data.get('content')}")
             print("-" * (len(article_id) + 20))
     else:
-        print("No data found for key 'main_db'.")
-
-    con.close()
+        print("No database found at instance/database.sqlite.")
 except Exception as e:
     print(f"An error occurred: {e}")
\ No newline at end of file
@@ -1,13 +1,10 @@
 """Check pro_plans in database"""
-import sqlite3
-import json
+import os
 
-conn = sqlite3.connect('instance/database.sqlite')
-cursor = conn.cursor()
-cursor.execute("SELECT value FROM app_data WHERE key = 'main_db';")
-row = cursor.fetchone()
-if row:
-    db = json.loads(row[0])
+from project.database import open_db
+
+if os.path.exists('instance/database.sqlite'):
+    db = open_db('instance/database.sqlite')
     pro_plans = db.get('pro_plans', [])
     print(f"Number of pro_plans: {len(pro_plans)}")
     if pro_plans:
@@ -17,4 +14,3 @@ if row:
         print("  pro_plans is EMPTY - Pro popup will NOT show!")
 else:
     print("No database found")
-conn.close()
@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 """Check and initialize database for websocket space"""
 import os
-import json
 import sqlite3
 import uuid
 
+from project import database
+
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 def check_db_files():
@@ -33,23 +34,11 @@ def check_db_files():
     return None
 
 def load_db(db_path):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cur = conn.cursor()
-    cur.execute("SELECT value FROM app_data WHERE key = 'main_db'")
-    row = cur.fetchone()
-    conn.close()
-    if row:
-        return json.loads(row['value'])
-    return {"spaces": {}, "users": {}}
+    return database.open_db(db_path)
 
 def save_db(db_path, data):
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    db_json = json.dumps(data, indent=4, ensure_ascii=False)
-    cur.execute("INSERT OR REPLACE INTO app_data (key, value) VALUES (?, ?)", ('main_db', db_json))
-    conn.commit()
-    conn.close()
+    # data is the Database returned by load_db(), which knows its own path
+    database.save_db(data)
 
 def create_websocket_space(db_path, name, description):
     db = load_db(db_path)
@@ -1,14 +1,8 @@
-import json
-import sqlite3
+from project.database import open_db
 
 
 def main():
-    con = sqlite3.connect('instance/database.sqlite')
-    cur = con.cursor()
-    row = cur.execute("SELECT value FROM app_data WHERE key = 'main_db'").fetchone()
-    con.close()
-
-    data = json.loads(row[0]) if row else {}
+    data = open_db('instance/database.sqlite')
     spaces = data.get('spaces', {}) or {}
 
     ws = []
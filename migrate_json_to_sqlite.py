@@ -3,7 +3,7 @@ import json
 import sys
 from flask import Flask
 import project.config as config
-from project.database import save_db, get_db_path
+from project.database import save_db, get_db_path, open_db, LEGACY_BLOB_KEY
 
 # Create a Flask app context to access the configuration
 app = Flask(__name__)
@@ -11,6 +11,13 @@ app.config.from_object(config)
 app.instance_path = os.path.join(os.path.dirname(__file__), 'instance')
 app.root_path = os.path.join(os.path.dirname(__file__), 'project')
 
+def print_summary(db):
+    print(f"- {len(db.get('users', {}))} users")
+    print(f"- {len(db.get('spaces', {}))} spaces")
+    print(f"- {len(db.get('uploaded_files', {}))} uploaded files")
+    print(f"- {len(db.get('chat_history', [])) + len(db.get('chat_messages', []))} chat messages")
+    print(f"- {len(db.get('orders', []))} orders")
+
 def migrate_json_to_sqlite():
     """Migrate data from a JSON file to the SQLite database."""
 
@@ -27,10 +34,7 @@ def migrate_json_to_sqlite():
             json_data = json.load(f)
 
         print("Loaded JSON data with:")
-        print(f"- {len(json_data.get('users', {}))} users")
-        print(f"- {len(json_data.get('spaces', {}))} spaces")
-        print(f"- {len(json_data.get('uploaded_files', {}))} uploaded files")
-        print(f"- {len(json_data.get('chat_messages', []))} chat messages")
+        print_summary(json_data)
 
         # Save the data to SQLite within an application context
         print("Migrating data to SQLite...")
@@ -41,6 +45,7 @@ def migrate_json_to_sqlite():
                 os.remove(sqlite_path)
                 print(f"Removed existing SQLite database at {sqlite_path}")
 
+            # save_db() splits the data into the per-entity tables
             save_db(json_data)
 
             print("Migration completed successfully!")
@@ -51,12 +56,42 @@ def migrate_json_to_sqlite():
         print(f"Error during migration: {e}")
         return False
 
+def migrate_sqlite_blob():
+    """Split an existing SQLite database that still keeps everything in app_data['main_db'].
+
+    The application does this automatically on startup; this runs it ahead of time.
+    A copy of the old blob is written to instance/backups/ first.
+    """
+    with app.app_context():
+        sqlite_path = get_db_path()
+    if not os.path.exists(sqlite_path):
+        print(f"Error: SQLite database not found at {sqlite_path}")
+        return False
+
+    try:
+        # open_db() runs the pending schema migrations
+        db = open_db(sqlite_path)
+        if LEGACY_BLOB_KEY in db:
+            print(f"Error: app_data['{LEGACY_BLOB_KEY}'] is still present after migrating")
+            return False
+        print("Database now stored in per-entity tables:")
+        print_summary(db)
+        return True
+
+    except Exception as e:
+        print(f"Error during migration: {e}")
+        return False
+
 if __name__ == '__main__':
-    print("Starting migration from JSON to SQLite...")
-    success = migrate_json_to_sqlite()
+    if '--from-blob' in sys.argv[1:]:
+        print("Migrating the SQLite main_db blob to per-entity tables...")
+        success = migrate_sqlite_blob()
+    else:
+        print("Starting migration from JSON to SQLite...")
+        success = migrate_json_to_sqlite()
     if success:
         print("\nMigration completed! You can now run your application with the local SQLite database.")
-        print("Note: Your original JSON file remains intact as a backup.")
+        print("Note: Your original data remains intact as a backup.")
     else:
         print("\nMigration failed. Please check the error messages above.")
         sys.exit(1)
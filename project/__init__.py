@@ -1,5 +1,4 @@
 import os
-import json
 import logging
 from logging.handlers import RotatingFileHandler
 from flask import Flask, request, session
@@ -92,6 +91,9 @@ def create_app(test_config=None):
     from . import webhook_kofi
     app.register_blueprint(webhook_kofi.payment_bp)
 
+    from . import render_farm
+    app.register_blueprint(render_farm.render_farm_bp)
+
     # Register custom Jinja2 filters
     app.jinja_env.filters['format_datetime'] = format_datetime
 
@@ -99,9 +101,12 @@ def create_app(test_config=None):
     from markupsafe import Markup
     app.jinja_env.filters['markdown'] = lambda text: Markup(markdown.markdown(text, extensions=['fenced_code', 'tables']))
 
-    from .database import load_db, save_db
+    from .database import load_db, load_db_copy, release_request_db, get_db_path
+    from .activity import activity_tracker
     from flask import session
-    from datetime import timedelta
+
+    # load_db() is request-scoped (save_db() commits right away); drop it when the request ends
+    app.teardown_request(release_request_db)
 
     @app.before_request
     def before_request_handler():
@@ -111,44 +116,18 @@ def create_app(test_config=None):
 
         if 'username' in session:
             db = load_db()
-            user = db.get('users', {}).get(session['username'])
-            if user:
-                now = datetime.utcnow()
-                last_seen_iso = user.get('last_seen')
-
-                update_threshold_seconds = 60 # Only update every 60 seconds
-
-                needs_update = True
-                if last_seen_iso:
-                    try:
-                        last_seen_dt = datetime.fromisoformat(last_seen_iso)
-                        if now - last_seen_dt < timedelta(seconds=update_threshold_seconds):
-                            needs_update = False
-                    except (ValueError, TypeError):
-                        pass # If format is invalid, update it anyway
-
-                # Track daily active users
-                today_str = now.strftime('%Y-%m-%d')
-                if 'daily_active_users' not in db:
-                    db['daily_active_users'] = {}
-
-                if today_str not in db['daily_active_users']:
-                    db['daily_active_users'][today_str] = []
-
-                if session['username'] not in db['daily_active_users'][today_str]:
-                    db['daily_active_users'][today_str].append(session['username'])
-                    needs_update = True
-
-                if needs_update:
-                    user['last_seen'] = now.isoformat()
-                    save_db(db)
+            # Only the key list is needed here, the user row itself is not read
+            if session['username'] in db.get('users', {}):
+                # last_seen and daily_active_users are buffered and written in batches
+                activity_tracker.record(get_db_path(), session['username'])
 
     # A context processor to inject settings into all templates
     @app.context_processor
     def inject_settings():
         # Using a try-except block to prevent errors during initial setup
         try:
-            db = load_db()
+            # A copy: is_pro below is derived for display and must never be saved
+            db = load_db_copy()
             settings = db.get('settings', {})
             pro_settings = db.get('pro_settings', {})
             pro_plans = db.get('pro_plans', [])
@@ -173,7 +152,7 @@ def create_app(test_config=None):
         except Exception:
             return dict(settings={}, pro_settings={}, pro_plans=[], current_user=None)
 
-    from .s3_utils import get_public_s3_url
+    from .s3_utils import get_public_s3_url, get_s3_config
     @app.context_processor
     def inject_s3_url_processor():
         def to_s3_url(key):
@@ -181,18 +160,10 @@ def create_app(test_config=None):
         return dict(to_s3_url=to_s3_url)
 
     # Context processor to inject S3 settings globally
+    # (get_s3_config keeps the parsed file until its mtime changes)
     @app.context_processor
     def inject_s3_settings():
-        s3_settings = {}
-        S3_CONFIG_FILE = app.config.get('S3_CONFIG_FILE')
-        if S3_CONFIG_FILE and os.path.exists(S3_CONFIG_FILE):
-            try:
-                with open(S3_CONFIG_FILE, 'r') as f:
-                    s3_settings = json.load(f)
-            except (IOError, json.JSONDecodeError):
-                # In case of error, s3_settings remains empty
-                pass
-        return dict(s3_settings=s3_settings)
+        return dict(s3_settings=get_s3_config() or {})
 
     # Context processor to inject get_locale for templates
     @app.context_processor
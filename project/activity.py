@@ -0,0 +1,84 @@
+"""
+Write-behind tracking of user activity (last_seen and daily active users).
+
+before_request records every logged-in request here, in memory. The events are
+written in one small transaction (database.write_activity) at most every
+FLUSH_INTERVAL seconds, so page views no longer rewrite the user's row.
+"""
+import time
+import logging
+import threading
+from datetime import datetime
+from .database import write_activity, load_last_seen
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityTracker:
+    """Buffers last-seen times and (day, username) activity until the next flush"""
+
+    FLUSH_INTERVAL = 30     # seconds between batches
+    MAX_PENDING = 1000      # flush early once this many users are waiting
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.db_path = None
+        self.last_seen = {}         # {username: ISO time} not yet written
+        self.active = {}            # {(day, username): None} not yet written, in arrival order
+        self.recorded_day = None
+        self.recorded = set()       # usernames already counted as active on recorded_day
+        self.last_flush = time.monotonic()
+
+    def record(self, db_path, username, now=None):
+        """Notes a request by `username`; flushes when a batch is due"""
+        now = now or datetime.utcnow()
+        day = now.strftime('%Y-%m-%d')
+        with self.lock:
+            self.db_path = db_path
+            self.last_seen[username] = now.isoformat()
+            if day != self.recorded_day:
+                self.recorded_day = day
+                self.recorded = set()
+            if username not in self.recorded:
+                self.recorded.add(username)
+                self.active[(day, username)] = None
+            due = (time.monotonic() - self.last_flush >= self.FLUSH_INTERVAL
+                   or len(self.last_seen) >= self.MAX_PENDING)
+        if due:
+            try:
+                self.flush()
+            except Exception as e:
+                # The batch was put back; the next request or the scheduler retries
+                logger.warning(f"Activity flush failed: {e}")
+
+    def flush(self):
+        """Writes everything buffered so far; returns the number of users written"""
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if not self.last_seen and not self.active:
+                return 0
+            db_path, last_seen, active = self.db_path, self.last_seen, list(self.active)
+            self.last_seen, self.active = {}, {}
+        try:
+            write_activity(db_path, last_seen, active)
+        except Exception:
+            with self.lock:
+                for username, seen in last_seen.items():
+                    if seen > self.last_seen.get(username, ''):
+                        self.last_seen[username] = seen
+                for pair in active:
+                    self.active.setdefault(pair)
+            raise
+        return len(last_seen)
+
+    def get_last_seen(self, db_path=None):
+        """{username: ISO time} including what has not been flushed yet"""
+        last_seen = load_last_seen(db_path)
+        with self.lock:
+            for username, seen in self.last_seen.items():
+                if seen > last_seen.get(username, ''):
+                    last_seen[username] = seen
+        return last_seen
+
+# Global instance
+activity_tracker = ActivityTracker()
@@ -9,8 +9,12 @@ from flask import (
 )
 from werkzeug.utils import secure_filename
 from flask import current_app
-from .database import load_db, save_db
-from .s3_utils import get_public_s3_url
+from .database import load_db, save_db, find_space_ids
+from .activity import activity_tracker
+from .chat import post_message
+from .gpu_allocator import allocate_gpus_to_chat_users
+from .sensitive_words import sensitive_word_filter
+from .s3_utils import get_public_s3_url, invalidate_s3_config
 from .utils import allowed_file, slugify
 from .netmind_config import (
     DEFAULT_NETMIND_RATE_LIMIT_MAX_REQUESTS,
@@ -136,9 +140,8 @@ def ensure_netmind_settings(db):
 def sync_netmind_aliases(db):
     settings = ensure_netmind_settings(db)
     alias_map = {}
-    for space in db.get('spaces', {}).values():
-        if space.get('card_type') != 'netmind':
-            continue
+    for space_id in find_space_ids(db, card_type='netmind'):
+        space = db['spaces'][space_id]
         alias = (space.get('netmind_model') or '').strip()
         upstream = (space.get('netmind_upstream_model') or alias or '').strip()
         if alias and upstream:
@@ -595,9 +598,11 @@ def generate_test_orders():
 
 @admin_bp.route('/users')
 def manage_users():
+    activity_tracker.flush()  # so today's active users are complete
     db = load_db()
     users = db.get('users', {})
     daily_active_users = db.get('daily_active_users', {})
+    last_seen_by_user = activity_tracker.get_last_seen()
     pro_settings = ensure_pro_settings(db)
 
     # Date filter
@@ -622,7 +627,7 @@ def manage_users():
         user_info['is_online'] = False
         user_info['last_seen_relative'] = "从未"
 
-        last_seen_iso = user_data.get('last_seen')
+        last_seen_iso = last_seen_by_user.get(username)
         if last_seen_iso:
             try:
                 last_seen_dt = datetime.fromisoformat(last_seen_iso)
@@ -706,23 +711,7 @@ def add_user_custom_gpu_config(username):
             f"Added {name} for user @{username}, other users please wait patiently."
         )
 
-        new_message = {
-            'id': str(uuid.uuid4()),
-            'username': admin_username,
-            'content': msg_content,
-            'timestamp': time.time()
-        }
-
-        if 'chat_messages' not in db:
-            db['chat_messages'] = []
-
-        db['chat_messages'].append(new_message)
-
-        # Archiving logic (keep last 100 messages)
-        if len(db['chat_messages']) > 99:
-            if 'chat_history' not in db:
-                db['chat_history'] = []
-            db['chat_history'].append(db['chat_messages'].pop(0))
+        post_message(admin_username, msg_content)
 
     save_db(db)
     flash('已添加新的 GPU 配置。', 'success')
@@ -877,6 +866,9 @@ def add_gpu_to_pool():
     db['gpu_pool'].append(new_gpu)
     save_db(db)
     flash(f'GPU {name} 已添加到池中。', 'success')
+    # Users waiting in the chat no longer poll for a GPU, so hand the new one out now
+    if allocate_gpus_to_chat_users(db):
+        flash(f'GPU {name} 已自动分配给聊天室中等待的用户。', 'success')
     return redirect(url_for('admin.manage_gpu_pool'))
 
 @admin_bp.route('/gpu-pool/delete/<pool_id>', methods=['POST'])
@@ -1452,7 +1444,9 @@ def manage_s3_settings():
         try:
             with open(S3_CONFIG_FILE, 'w') as f:
                 json.dump(s3_config, f, indent=4)
-            flash('S3 设置已成功保存。应用需要重启以使更改生效。', 'success')
+            # The cached settings and the shared client pick up the new values right away
+            invalidate_s3_config()
+            flash('S3 设置已成功保存。', 'success')
         except IOError as e:
             flash(f'写入 S3 配置文件时出错: {e}', 'error')
         return redirect(url_for('admin.manage_s3_settings'))
@@ -1584,6 +1578,7 @@ def add_sensitive_word():
         if word not in db['sensitive_words']:
             db['sensitive_words'].append(word)
             save_db(db)
+            sensitive_word_filter.rebuild(db['sensitive_words'])
             flash(f"敏感词 '{word}' 已添加。", 'success')
         else:
             flash(f"敏感词 '{word}' 已存在。", 'info')
@@ -1597,6 +1592,7 @@ def delete_sensitive_word(word):
     if 'sensitive_words' in db and word in db['sensitive_words']:
         db['sensitive_words'].remove(word)
         save_db(db)
+        sensitive_word_filter.rebuild(db['sensitive_words'])
         flash(f"敏感词 '{word}' 已删除。", 'success')
     return redirect(url_for('admin.manage_sensitive_words'))
 
@@ -1766,15 +1762,15 @@ def websocket_status():
     
     # Get all WebSocket spaces (including disconnected)
     all_ws_spaces = []
-    for space_id, space in db.get('spaces', {}).items():
-        if space.get('card_type') == 'websockets':
-            is_connected = space_id in connected_space_ids
-            all_ws_spaces.append({
-                'space_id': space_id,
-                'space_name': space.get('name'),
-                'is_connected': is_connected,
-                'queue_size': ws_manager.get_queue_size(space_id) if is_connected else 0
-            })
+    for space_id in find_space_ids(db, card_type='websockets'):
+        space = db['spaces'][space_id]
+        is_connected = space_id in connected_space_ids
+        all_ws_spaces.append({
+            'space_id': space_id,
+            'space_name': space.get('name'),
+            'is_connected': is_connected,
+            'queue_size': ws_manager.get_queue_size(space_id) if is_connected else 0
+        })
     
     return jsonify({
         'success': True,
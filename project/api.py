@@ -18,9 +18,14 @@ import shutil
 import base64
 import json
 import secrets
-from .database import load_db, save_db, backup_db
+from .database import (
+    load_db, save_db, backup_db, get_db_path, find_username_by_api_key, find_space_ids, find_template_id,
+    get_chat_messages as read_chat_messages, count_chat_messages_since, CHAT_PAGE_SIZE
+)
 from .utils import allowed_file, get_user_by_token, predict_output_filename, slugify
 from . import tasks
+from . import chat
+from .sensitive_words import sensitive_word_filter
 from .s3_utils import (
     generate_presigned_url,
     get_public_s3_url,
@@ -45,7 +50,7 @@ from .netmind_config import (
     get_rate_limit_config
 )
 from .gpu_allocator import try_allocate_gpu_from_pool
-from .usage_limiter import check_and_increment_usage, decrement_usage
+from .usage_limiter import reserve_usage
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -236,11 +241,7 @@ def api_upload():
         if not api_key:
             return jsonify({'error': 'Missing API key'}), 401
 
-        for username, user_data in db.get('users', {}).items():
-            if user_data.get('api_key') == api_key:
-                found_user = username
-                break
-
+        found_user = find_username_by_api_key(db, api_key)
         if not found_user:
             return jsonify({'error': 'Invalid API key'}), 403
 
@@ -1400,15 +1401,20 @@ def get_chat_messages():
     if not db.get('settings', {}).get('chat_enabled', True) and not session.get('is_admin'):
         return jsonify({'success': False, 'error': 'Chat is disabled'}), 403
 
-    # Return the last 50 messages
-    messages = db.get('chat_messages', [])[-50:]
+    # The newest page, or the messages after/before a seq cursor
+    after, before, limit = _chat_cursor_args(CHAT_PAGE_SIZE)
+    messages = read_chat_messages(get_db_path(), after=after, before=before, limit=limit)
     # Enrich messages with user info
-    for msg in messages:
-        user_info = db['users'].get(msg['username'], {})
-        msg['avatar'] = user_info.get('avatar', 'default.png')
+    chat.with_avatars(db, messages)
 
     return jsonify({'success': True, 'messages': messages})
 
+def _chat_cursor_args(default_limit, max_limit=200):
+    """(after, before, limit) from ?after=&before=&limit= (seq cursors of the chat log)"""
+    limit = request.args.get('limit', default_limit, type=int)
+    return (request.args.get('after', type=int), request.args.get('before', type=int),
+            max(1, min(limit, max_limit)))
+
 @api_bp.route('/chat/messages', methods=['POST'])
 def post_chat_message():
     if not session.get('logged_in'):
@@ -1434,50 +1440,25 @@ def post_chat_message():
     if db.get('settings', {}).get('chat_is_muted', False) and not session.get('is_admin'):
         return jsonify({'success': False, 'error': '聊天室当前处于禁言状态。'}), 403
 
-    sensitive_words = db.get('sensitive_words', [])
-    for word in sensitive_words:
-        if word in message_content:
-            return jsonify({'success': False, 'error': f'消息包含敏感词: {word}'}), 400
-
-    username = session['username']
-
-    new_message = {
-        'id': str(uuid.uuid4()),
-        'username': username,
-        'content': message_content,
-        'timestamp': time.time()
-    }
-
-    db['chat_messages'].append(new_message)
+    matches = sensitive_word_filter.find_all(db, message_content)
+    if matches:
+        return jsonify({'success': False, 'error': f'消息包含敏感词: {matches[0]}'}), 400
 
-    # Archiving logic
-    if len(db['chat_messages']) > 99:
-        if 'chat_history' not in db:
-            db['chat_history'] = []
-        # Move the oldest message to history
-        db['chat_history'].append(db['chat_messages'].pop(0))
-
-    save_db(db)
+    # Stored and pushed to everyone in the chat room
+    message = chat.post_message(session['username'], message_content)
 
     session['last_message_time'] = time.time()
 
-    return jsonify({'success': True, 'message': 'Message posted'})
+    return jsonify({'success': True, 'message': 'Message posted', 'seq': message['seq']})
 
 @api_bp.route('/chat/messages/<message_id>', methods=['DELETE'])
 def delete_chat_message(message_id):
     if not session.get('logged_in') or not session.get('is_admin'):
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
 
-    db = load_db()
-
-    initial_len = len(db.get('chat_messages', []))
-    db['chat_messages'] = [msg for msg in db.get('chat_messages', []) if msg.get('id') != message_id]
-
-    if len(db['chat_messages']) == initial_len:
+    if not chat.delete_message(message_id):
         return jsonify({'success': False, 'error': 'Message not found'}), 404
 
-    save_db(db)
-
     return jsonify({'success': True, 'message': 'Message deleted'})
 
 @api_bp.route('/chat/toggle_enabled', methods=['POST'])
@@ -1521,9 +1502,11 @@ def get_chat_history():
     if not session.get('logged_in'):
         return jsonify({'success': False, 'error': 'Unauthorized'}), 403
 
-    db = load_db()
-    history = db.get('chat_history', [])
-    return jsonify({'success': True, 'history': history})
+    # Pages back from ?before= (a seq); next_before is the cursor of the page before this one
+    _, before, limit = _chat_cursor_args(100)
+    history = read_chat_messages(get_db_path(), before=before, limit=limit)
+    next_before = history[0]['seq'] if len(history) == limit else None
+    return jsonify({'success': True, 'history': history, 'next_before': next_before})
 
 @api_bp.route('/chat/unread-count', methods=['GET'])
 def get_unread_chat_count():
@@ -1538,12 +1521,8 @@ def get_unread_chat_count():
 
     last_read_time = user.get('last_chat_read_time', 0)
 
-    # Count messages newer than the last read time
-    unread_count = 0
-    for msg in db.get('chat_messages', []):
-        # Ensure the message has a timestamp and it's a number
-        if isinstance(msg.get('timestamp'), (int, float)) and msg['timestamp'] > last_read_time:
-            unread_count += 1
+    # Count messages newer than the last read time (capped: the badge shows 99+)
+    unread_count = count_chat_messages_since(get_db_path(), last_read_time)
 
     return jsonify({'success': True, 'unread_count': unread_count})
 
@@ -1599,17 +1578,17 @@ def run_space_api():
     if not all([space_name, template_name]):
         return jsonify({'error': 'Missing required parameters: space_name, gpu_template'}), 400
 
-    space = next((s for s in db.get('spaces', {}).values() if s['name'] == space_name), None)
-    if not space:
+    space_ids = find_space_ids(db, name=space_name)
+    if not space_ids:
         return jsonify({'error': f'Space "{space_name}" not found'}), 404
+    space = db['spaces'][space_ids[0]]
 
     ai_project_id = space['id']
 
-    template = next((t for t in space.get('templates', {}).values() if t['name'] == template_name), None)
-    if not template:
+    template_id = find_template_id(db, space_ids[0], template_name)
+    if template_id is None:
         return jsonify({'error': f'Template "{template_name}" not found in space "{space_name}"'}), 404
-
-    template_id = next((k for k, v in space.get('templates', {}).items() if v['name'] == template_name), None)
+    template = space['templates'][template_id]
 
     user_api_key = user.get('api_key')
     if not user_api_key:
@@ -1641,11 +1620,9 @@ def run_space_api():
         if not prompt:
             return jsonify({'error': 'Missing required parameter: prompt for this space'}), 400
 
-        sensitive_words = db.get('sensitive_words', [])
-        if sensitive_words:
-            for word in sensitive_words:
-                if word in prompt:
-                    return jsonify({'error': f'Your prompt contains a sensitive word: "{word}"'}), 400
+        matches = sensitive_word_filter.find_all(db, prompt)
+        if matches:
+            return jsonify({'error': f'Your prompt contains a sensitive word: "{matches[0]}"'}), 400
         full_cmd += f' --prompt {shlex.quote(prompt)}'
 
     preset_params = template.get("preset_params", "").strip()
@@ -1777,13 +1754,7 @@ def netmind_chat_completions():
         return jsonify({'error': 'Invalid token'}), 403
 
     db = load_db()
-
-    # Check Usage Limit
     username = user['username']
-    allowed, error_msg = check_and_increment_usage(db, username, 'chat')
-    if not allowed:
-        return jsonify({'error': error_msg, 'code': 'usage_limit_exceeded'}), 403
-    save_db(db) # Persist usage increment
 
     max_requests, window_seconds = get_rate_limit_config(db.get('netmind_settings'))
     allowed, retry_after = _check_netmind_rate_limit(user['username'], max_requests, window_seconds)
@@ -1837,6 +1808,12 @@ def netmind_chat_completions():
     if not extra_params:
         extra_params = None
 
+    # Check Usage Limit: the reserved unit is committed once the answer is delivered,
+    # released if the call fails or the answer is an error (rejected requests above never count)
+    usage, error_msg = reserve_usage(db, username, 'chat')
+    if not usage:
+        return jsonify({'error': error_msg, 'code': 'usage_limit_exceeded'}), 403
+
     client = NetMindClient()
 
     try:
@@ -1874,7 +1851,7 @@ def netmind_chat_completions():
                                     pass
                 except Exception as e:
                     print(f"Stream error, refunding usage: {e}")
-                    decrement_usage(username, 'chat')
+                    usage.release()
 
                     err_text = str(e)
                     if isinstance(err_text, str) and '<html' in err_text.lower() and '403' in err_text:
@@ -1902,10 +1879,18 @@ def netmind_chat_completions():
                 # User request: "带Error字样" (contains 'Error' text)
                 if "error" in full_content.lower():
                     print(f"Error detected in stream content, refunding usage for {username}")
-                    decrement_usage(username, 'chat')
+                    usage.release()
+
+            def commit_usage_when_closed(chunks):
+                # Unless released above, the unit is used once the stream ends,
+                # including when the client disconnects part-way
+                try:
+                    yield from chunks
+                finally:
+                    usage.commit()
 
             resp = Response(
-                stream_with_context(stream_with_refund(response)),
+                stream_with_context(commit_usage_when_closed(stream_with_refund(response))),
                 mimetype='text/event-stream'
             )
             resp.headers['Cache-Control'] = 'no-cache, no-transform'
@@ -1925,14 +1910,16 @@ def netmind_chat_completions():
 
             if "error" in content.lower():
                 print(f"Error detected in sync response, refunding usage for {username}")
-                decrement_usage(username, 'chat')
+                usage.release()
+            else:
+                usage.commit()
 
             return jsonify(resp_json)
 
     except Exception as e:
         # If API call fails immediately
         print(f"API call failed, refunding usage: {e}")
-        decrement_usage(username, 'chat')
+        usage.release()
 
         import traceback
         traceback.print_exc()
@@ -0,0 +1,113 @@
+"""
+Chat room over the shared Socket.IO server
+
+The chat page joins the 'chat' room with the last seq it has seen and gets the
+messages it missed; every post and deletion is then pushed to the room as it
+happens, so the page no longer polls /api/chat/messages.
+
+Joining is also when a waiting user is handed a GPU from the pool; users who
+stay in the room get one when an admin refills the pool (see chat_usernames).
+"""
+import threading
+from flask import session, request
+from flask_socketio import emit, join_room, leave_room
+from .database import (
+    load_db, get_db_path, add_chat_message, get_chat_messages, delete_chat_message, CHAT_PAGE_SIZE
+)
+
+CHAT_ROOM = 'chat'
+
+socketio = None
+
+# {sid: username} of the logged-in clients that joined the chat room, in join order
+members = {}
+members_lock = threading.Lock()
+
+
+def with_avatars(db, messages):
+    """Adds each sender's avatar (one user lookup per sender)"""
+    avatars = {}
+    for msg in messages:
+        username = msg.get('username')
+        if username not in avatars:
+            avatars[username] = (db['users'].get(username) or {}).get('avatar', 'default.png')
+        msg['avatar'] = avatars[username]
+    return messages
+
+
+def post_message(username, content, **fields):
+    """Stores a chat message and pushes it to the chat room; returns it"""
+    message = add_chat_message(get_db_path(), username, content, **fields)
+    if socketio:
+        socketio.emit('chat_message', with_avatars(load_db(), [dict(message)])[0], to=CHAT_ROOM)
+    return message
+
+
+def delete_message(message_id):
+    """Deletes a chat message and tells the chat room; returns whether it existed"""
+    if not delete_chat_message(get_db_path(), message_id):
+        return False
+    if socketio:
+        socketio.emit('chat_deleted', {'id': message_id}, to=CHAT_ROOM)
+    return True
+
+
+def chat_usernames():
+    """Usernames currently in the chat room, each once, in the order they joined"""
+    if not socketio:
+        return []
+    # Disconnected clients leave the room without telling us; drop them here
+    in_room = {sid for sid, _ in socketio.server.manager.get_participants('/', CHAT_ROOM)}
+    with members_lock:
+        for sid in [sid for sid in members if sid not in in_room]:
+            del members[sid]
+        return list(dict.fromkeys(members.values()))
+
+
+def sync_messages(after=None):
+    """(messages, reset) bringing a client that has seen up to seq `after` up to date
+
+    reset means the client was too far behind (or new): drop what it shows and
+    display the newest page instead.
+    """
+    if after is not None:
+        messages = get_chat_messages(get_db_path(), after=after, limit=CHAT_PAGE_SIZE + 1)
+        if len(messages) <= CHAT_PAGE_SIZE:
+            return messages, False
+    return get_chat_messages(get_db_path()), True
+
+
+def init_chat(app, socketio_instance):
+    """Registers the chat room events on the Socket.IO server"""
+    global socketio
+    socketio = socketio_instance
+
+    @socketio.on('chat_join')
+    def handle_chat_join(data=None):
+        if not session.get('logged_in'):
+            emit('chat_error', {'error': 'Unauthorized'})
+            return
+        db = load_db()
+        if not db.get('settings', {}).get('chat_enabled', True) and not session.get('is_admin'):
+            emit('chat_error', {'error': 'Chat is disabled'})
+            return
+
+        # Joining the chat is the online heartbeat that used to come with every poll
+        username = session.get('username')
+        if username:
+            from .gpu_allocator import try_allocate_gpu_from_pool  # it posts through this module
+            try_allocate_gpu_from_pool(db, username)
+
+        join_room(CHAT_ROOM)
+        if username:
+            with members_lock:
+                members[request.sid] = username
+        after = (data or {}).get('after')
+        messages, reset = sync_messages(after if isinstance(after, int) else None)
+        emit('chat_sync', {'messages': with_avatars(db, messages), 'reset': reset})
+
+    @socketio.on('chat_leave')
+    def handle_chat_leave():
+        leave_room(CHAT_ROOM)
+        with members_lock:
+            members.pop(request.sid, None)
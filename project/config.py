@@ -69,3 +69,12 @@ except (TypeError, ValueError):
     CLOUD_TERMINAL_DEPLOY_TIMEOUT = 900
 
 CEREBRIUM_PROJECT_ID = os.environ.get('CEREBRIUM_PROJECT_ID')
+
+# --- Render Farm Configuration ---
+# Shared secret render workers must present on registration (unset = every worker is refused)
+RENDER_FARM_TOKEN = os.environ.get('RENDER_FARM_TOKEN')
+# Directories a render job's source_path may point into, separated by os.pathsep (e.g. the
+# render engine's source_store); the upload folder is always allowed
+RENDER_FARM_SOURCE_DIRS = [d for d in os.environ.get('RENDER_FARM_SOURCE_DIRS', '').split(os.pathsep) if d]
+# Base URL workers use to reach the blob endpoints (defaults to the submitting request's host)
+RENDER_FARM_PUBLIC_URL = os.environ.get('RENDER_FARM_PUBLIC_URL')
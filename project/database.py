@@ -1,9 +1,16 @@
 import os
+import gzip
 import json
 import uuid
+import hashlib
+import hmac
+import marshal
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from flask import current_app
+from flask import current_app, g, has_request_context
 from .netmind_config import (
     DEFAULT_NETMIND_RATE_LIMIT_MAX_REQUESTS,
     DEFAULT_NETMIND_RATE_LIMIT_WINDOW_SECONDS,
@@ -11,47 +18,1565 @@ from .netmind_config import (
     sanitize_rate_limit_window
 )
 
+# --- Storage layout ---
+# The large collections live in their own tables, one row per entry, so a request
+# that touches one user or one space only reads and parses those rows. Every other
+# top-level key is a single JSON row in app_data. load_db() still returns the
+# familiar nested dict (see Database), and save_db() writes back only the rows
+# that changed. Keyed rows carry a version, so a save never silently overwrites
+# a row that someone else changed after it was read; db_transaction() is there
+# for code that needs the read and the write to be atomic. The chat is an
+# append-only log kept outside that dict (see add_chat_message).
+#
+# Schema versions are tracked with PRAGMA user_version; append new migrations to
+# SCHEMA_MIGRATIONS, never edit an old one.
+
+LEGACY_BLOB_KEY = 'main_db'
+
+
+def _encode(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+_MISSING = object()
+
+def _merge(base, ours, theirs):
+    """Three-way merge of two changes made to the same decoded entry.
+
+    Dicts are merged key by key, so changes to different fields both survive;
+    where both sides changed the same field, ours wins. _MISSING stands for an
+    absent key.
+    """
+    if ours == base:
+        return theirs
+    if theirs == base or ours == theirs:
+        return ours
+    if not (isinstance(ours, dict) and isinstance(theirs, dict)):
+        return ours
+    if not isinstance(base, dict):
+        base = {}
+    merged = {}
+    for key in list(theirs) + [key for key in ours if key not in theirs]:
+        value = _merge(base.get(key, _MISSING), ours.get(key, _MISSING), theirs.get(key, _MISSING))
+        if value is not _MISSING:
+            merged[key] = value
+    return merged
+
+
+class _MapTable:
+    """A dict collection ({key: entry}) stored as one JSON row per entry.
+
+    Versioned tables carry a version column that every write bumps, so a save
+    can tell whether the row changed since it was read (see upsert).
+    """
+
+    def __init__(self, table, key_column, versioned=True, data_column='data', order_column='pos'):
+        self.table = table
+        self.key_column = key_column
+        self.versioned = versioned
+        self.data_column = data_column
+        self.order_column = order_column
+        self._version_sql = 'version' if versioned else 'NULL'
+
+    def create(self, conn):
+        version = ",\n                version INTEGER NOT NULL DEFAULT 0" if self.versioned else ""
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                pos INTEGER PRIMARY KEY,
+                {self.key_column} TEXT NOT NULL UNIQUE,
+                data TEXT NOT NULL{version}
+            );
+        """)
+
+    def fetch_keys(self, conn):
+        return [row[0] for row in conn.execute(
+            f"SELECT {self.key_column} FROM {self.table} ORDER BY {self.order_column};")]
+
+    def fetch_one(self, conn, key):
+        """(stored form, version) of one entry, or None."""
+        row = conn.execute(f"SELECT {self.data_column}, {self._version_sql} FROM {self.table} "
+                           f"WHERE {self.key_column} = ?;", (key,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def fetch_all(self, conn):
+        """[(key, stored form, version)] in insertion order."""
+        return conn.execute(f"SELECT {self.key_column}, {self.data_column}, {self._version_sql} "
+                            f"FROM {self.table} ORDER BY {self.order_column};").fetchall()
+
+    def decode(self, raw):
+        return json.loads(raw)
+
+    def encode(self, value):
+        return _encode(value)
+
+    def upsert(self, conn, key, raw, old_raw, version=None):
+        """Writes one entry; returns (new version, merged stored form or None).
+
+        `old_raw` and `version` describe the row as it was read. If the row has
+        been changed by someone else since, both changes are merged (_merge)
+        and the merged form is written and returned instead of `raw`.
+        """
+        if not self.versioned:
+            # ON CONFLICT keeps the row's pos, so entries keep their insertion order
+            conn.execute(
+                f"INSERT INTO {self.table} ({self.key_column}, {self.data_column}) VALUES (?, ?) "
+                f"ON CONFLICT({self.key_column}) DO UPDATE SET {self.data_column} = excluded.{self.data_column};",
+                (key, raw)
+            )
+            return None, None
+        if version is not None:
+            updated = conn.execute(
+                f"UPDATE {self.table} SET {self.data_column} = ?, version = version + 1 "
+                f"WHERE {self.key_column} = ? AND version = ?;",
+                (raw, key, version)
+            )
+            if updated.rowcount:
+                return version + 1, None
+        current = self.fetch_one(conn, key)
+        if current is None:
+            conn.execute(f"INSERT INTO {self.table} ({self.key_column}, {self.data_column}) VALUES (?, ?);",
+                         (key, raw))
+            return 0, None
+        current_raw, current_version = current
+        merged = None
+        if current_raw != old_raw:
+            base = _MISSING if old_raw is None else json.loads(old_raw)
+            merged = _encode(_merge(base, json.loads(raw), json.loads(current_raw)))
+        conn.execute(
+            f"UPDATE {self.table} SET {self.data_column} = ?, version = ? WHERE {self.key_column} = ?;",
+            (raw if merged is None else merged, current_version + 1, key)
+        )
+        return current_version + 1, None if merged == raw else merged
+
+    def delete(self, conn, key, old_raw):
+        conn.execute(f"DELETE FROM {self.table} WHERE {self.key_column} = ?;", (key,))
+
+    def clear(self, conn):
+        conn.execute(f"DELETE FROM {self.table};")
+
+
+def _token_hash(api_key):
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+class _UsersTable(_MapTable):
+    """Users, plus the user_tokens index from sha256(api_key) to username.
+
+    The index is written together with the user row, so it follows every key
+    that is issued, regenerated or removed with its user. Email and
+    case-insensitive username lookups use expression indexes that SQLite
+    maintains by itself.
+    """
+
+    def __init__(self):
+        super().__init__('users', 'username')
+
+    def create(self, conn):
+        super().create(conn)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS user_tokens (
+                token_hash TEXT PRIMARY KEY,
+                username TEXT NOT NULL
+            );
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS user_tokens_username ON user_tokens (username);")
+        conn.execute("CREATE INDEX IF NOT EXISTS users_email ON users (json_extract(data, '$.email'));")
+        conn.execute("CREATE INDEX IF NOT EXISTS users_username_nocase ON users (username COLLATE NOCASE);")
+
+    @staticmethod
+    def _api_key(raw):
+        return json.loads(raw).get('api_key') if raw is not None else None
+
+    def index_token(self, conn, username, api_key):
+        conn.execute("DELETE FROM user_tokens WHERE username = ?;", (username,))
+        if api_key and isinstance(api_key, str):
+            conn.execute("INSERT OR REPLACE INTO user_tokens (token_hash, username) VALUES (?, ?);",
+                         (_token_hash(api_key), username))
+
+    def find_token(self, conn, token_hash):
+        rows = conn.execute("SELECT username FROM user_tokens WHERE token_hash = ?;", (token_hash,))
+        return [row[0] for row in rows]
+
+    def find_by_email(self, conn, email):
+        # The expression must match users_email for the index to be used
+        rows = conn.execute("SELECT username FROM users WHERE json_extract(data, '$.email') = ? ORDER BY pos;",
+                            (email,))
+        return [row[0] for row in rows]
+
+    def find_by_name(self, conn, name):
+        # NOCASE folds ASCII only, which is all registration allows in usernames
+        rows = conn.execute("SELECT username FROM users WHERE username = ? COLLATE NOCASE ORDER BY pos;", (name,))
+        return [row[0] for row in rows]
+
+    def upsert(self, conn, key, raw, old_raw, version=None):
+        version, merged = super().upsert(conn, key, raw, old_raw, version)
+        api_key = self._api_key(merged if merged is not None else raw)
+        # A merge means the stored row was not old_raw, so its old key is unknown
+        if merged is not None or old_raw is None or api_key != self._api_key(old_raw):
+            self.index_token(conn, key, api_key)
+        return version, merged
+
+    def delete(self, conn, key, old_raw):
+        super().delete(conn, key, old_raw)
+        conn.execute("DELETE FROM user_tokens WHERE username = ?;", (key,))
+
+    def clear(self, conn):
+        super().clear(conn)
+        conn.execute("DELETE FROM user_tokens;")
+
+
+class _SpacesTable(_MapTable):
+    """Spaces, with each space's 'templates' dict split out into the templates table.
+
+    A row's raw form is (space_json, ((template_id, template_json), ...)).
+    Spaces are indexed by name and by card_type, templates by (space, name).
+    """
+
+    def __init__(self):
+        super().__init__('spaces', 'id')
+
+    def create(self, conn):
+        super().create(conn)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS templates (
+                pos INTEGER PRIMARY KEY,
+                space_id TEXT NOT NULL,
+                id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                UNIQUE (space_id, id)
+            );
+        """)
+        self.create_indexes(conn)
+
+    def create_indexes(self, conn):
+        # find() and find_template() must use these exact expressions for the indexes to apply
+        conn.execute("CREATE INDEX IF NOT EXISTS spaces_name ON spaces (json_extract(data, '$.name'));")
+        conn.execute("CREATE INDEX IF NOT EXISTS spaces_card_type ON spaces (json_extract(data, '$.card_type'));")
+        conn.execute("CREATE INDEX IF NOT EXISTS templates_name "
+                     "ON templates (space_id, json_extract(data, '$.name'));")
+
+    def find(self, conn, name=None, card_type=None):
+        # By name when given (the more selective index); callers re-check the rest
+        if name is not None:
+            rows = conn.execute("SELECT id FROM spaces WHERE json_extract(data, '$.name') = ? ORDER BY pos;", (name,))
+        elif card_type is not None:
+            rows = conn.execute("SELECT id FROM spaces WHERE json_extract(data, '$.card_type') = ? ORDER BY pos;",
+                                (card_type,))
+        else:
+            rows = conn.execute("SELECT id FROM spaces ORDER BY pos;")
+        return [row[0] for row in rows]
+
+    def find_template(self, conn, space_id, name):
+        rows = conn.execute("SELECT id FROM templates WHERE space_id = ? AND json_extract(data, '$.name') = ? "
+                            "ORDER BY pos;", (space_id, name))
+        return [row[0] for row in rows]
+
+    def _templates(self, conn, space_id=None):
+        if space_id is None:
+            rows = conn.execute("SELECT space_id, id, data FROM templates ORDER BY pos;")
+        else:
+            rows = conn.execute("SELECT space_id, id, data FROM templates WHERE space_id = ? ORDER BY pos;",
+                                (space_id,))
+        grouped = {}
+        for sid, template_id, data in rows:
+            grouped.setdefault(sid, []).append((template_id, data))
+        return grouped
+
+    def fetch_one(self, conn, key):
+        row = super().fetch_one(conn, key)
+        if row is None:
+            return None
+        space_raw, version = row
+        return (space_raw, tuple(self._templates(conn, key).get(key, ()))), version
+
+    def fetch_all(self, conn):
+        templates = self._templates(conn)
+        return [(key, (space_raw, tuple(templates.get(key, ()))), version)
+                for key, space_raw, version in super().fetch_all(conn)]
+
+    def decode(self, raw):
+        space_raw, template_rows = raw
+        space = json.loads(space_raw)
+        # The space row keeps an empty 'templates' placeholder so key order survives
+        if isinstance(space.get('templates'), dict):
+            space['templates'] = {template_id: json.loads(data) for template_id, data in template_rows}
+        return space
+
+    def encode(self, value):
+        templates = value.get('templates') if isinstance(value, dict) else None
+        if not isinstance(templates, dict):
+            return _encode(value), ()
+        space = dict(value)
+        space['templates'] = {}
+        return _encode(space), tuple((str(template_id), _encode(template))
+                                     for template_id, template in templates.items())
+
+    def upsert(self, conn, key, raw, old_raw, version=None):
+        # Only the space row is versioned; templates are written row by row below
+        space_raw, template_rows = raw
+        merged = None
+        if old_raw is None or old_raw[0] != space_raw:
+            version, merged = super().upsert(conn, key, space_raw, old_raw and old_raw[0], version)
+        if old_raw is None:
+            conn.execute("DELETE FROM templates WHERE space_id = ?;", (key,))
+            old_templates = {}
+        else:
+            old_templates = dict(old_raw[1])
+        current = dict(template_rows)
+        for template_id in old_templates:
+            if template_id not in current:
+                conn.execute("DELETE FROM templates WHERE space_id = ? AND id = ?;", (key, template_id))
+        for template_id, data in template_rows:
+            if old_templates.get(template_id) != data:
+                conn.execute(
+                    "INSERT INTO templates (space_id, id, data) VALUES (?, ?, ?) "
+                    "ON CONFLICT(space_id, id) DO UPDATE SET data = excluded.data;",
+                    (key, template_id, data)
+                )
+        return version, None if merged is None else (merged, template_rows)
+
+    def delete(self, conn, key, old_raw):
+        super().delete(conn, key, old_raw)
+        conn.execute("DELETE FROM templates WHERE space_id = ?;", (key,))
+
+    def clear(self, conn):
+        super().clear(conn)
+        conn.execute("DELETE FROM templates;")
+
+
+class _DailyActivityTable(_MapTable):
+    """daily_active_users ({'YYYY-MM-DD': [username, ...]}) as one row per (day, user)."""
+
+    def __init__(self):
+        super().__init__('daily_active_users', 'day', versioned=False)
+
+    def create(self, conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS daily_active_users (
+                pos INTEGER PRIMARY KEY,
+                day TEXT NOT NULL,
+                username TEXT NOT NULL,
+                UNIQUE (day, username)
+            );
+        """)
+
+    def fetch_keys(self, conn):
+        rows = conn.execute("SELECT day FROM daily_active_users GROUP BY day ORDER BY MIN(pos);")
+        return [row[0] for row in rows]
+
+    def fetch_one(self, conn, key):
+        rows = conn.execute("SELECT username FROM daily_active_users WHERE day = ? ORDER BY pos;", (key,))
+        usernames = tuple(row[0] for row in rows)
+        return (usernames, None) if usernames else None
+
+    def fetch_all(self, conn):
+        grouped = {}
+        for day, username in conn.execute("SELECT day, username FROM daily_active_users ORDER BY pos;"):
+            grouped.setdefault(day, []).append(username)
+        return [(day, tuple(usernames), None) for day, usernames in grouped.items()]
+
+    def decode(self, raw):
+        return list(raw)
+
+    def encode(self, value):
+        return tuple(dict.fromkeys(value))
+
+    def upsert(self, conn, key, raw, old_raw, version=None):
+        # Set semantics per user row: concurrent check-ins of different users never conflict
+        if old_raw is None:
+            old_raw = (self.fetch_one(conn, key) or ((),))[0]
+        for username in set(old_raw) - set(raw):
+            conn.execute("DELETE FROM daily_active_users WHERE day = ? AND username = ?;", (key, username))
+        conn.executemany("INSERT OR IGNORE INTO daily_active_users (day, username) VALUES (?, ?);",
+                         [(key, username) for username in raw if username not in old_raw])
+        return None, None
+
+    def delete(self, conn, key, old_raw):
+        conn.execute("DELETE FROM daily_active_users WHERE day = ?;", (key,))
+
+
+class _ListTable:
+    """An ordered list of dict entries stored as one row per entry.
+
+    Rows are keyed by the entry's 'id' (or a content hash when it has none) and
+    ordered by seq. Appending, prepending, popping from either end and editing in
+    place only touch the affected rows; anything else renumbers the list.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def create(self, conn):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                id TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+        """)
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_seq ON {self.table} (seq);")
+
+    def fetch(self, conn):
+        """Returns the stored rows as [(key, seq, raw)] in list order."""
+        rows = conn.execute(f"SELECT id, seq, data FROM {self.table} ORDER BY seq;")
+        return [tuple(row) for row in rows]
+
+    def _rows(self, items):
+        keys, raws, seen = [], [], set()
+        for item in items:
+            raw = _encode(item)
+            item_id = item.get('id') if isinstance(item, dict) else None
+            if item_id in (None, ''):
+                base = 'sha1:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+            else:
+                base = str(item_id)
+            key, n = base, 1
+            while key in seen:
+                n += 1
+                key = f"{base}#{n}"
+            seen.add(key)
+            keys.append(key)
+            raws.append(raw)
+        return keys, raws
+
+    def _sequence(self, keys, old):
+        """Assigns seq numbers that reuse the stored ones wherever the order allows."""
+        seqs = [old[key][0] if key in old else None for key in keys]
+        kept = [i for i, seq in enumerate(seqs) if seq is not None]
+        if not kept:
+            return list(range(len(keys)))
+        for a, b in zip(kept, kept[1:]):
+            if seqs[b] - seqs[a] < b - a:
+                return list(range(len(keys)))  # reordered, or no room left in between
+            for i in range(a + 1, b):
+                seqs[i] = seqs[a] + (i - a)
+        first, last = kept[0], kept[-1]
+        for i in range(first):
+            seqs[i] = seqs[first] - (first - i)
+        for i in range(last + 1, len(keys)):
+            seqs[i] = seqs[last] + (i - last)
+        return seqs
+
+    def write(self, conn, old_rows, items):
+        """Writes the difference between old_rows and items; returns the new rows."""
+        old = {key: (seq, raw) for key, seq, raw in old_rows}
+        keys, raws = self._rows(items)
+        seqs = self._sequence(keys, old)
+        current = set(keys)
+        for key in old:
+            if key not in current:
+                conn.execute(f"DELETE FROM {self.table} WHERE id = ?;", (key,))
+        for key, seq, raw in zip(keys, seqs, raws):
+            if old.get(key) == (seq, raw):
+                continue
+            conn.execute(
+                f"INSERT INTO {self.table} (id, seq, data) VALUES (?, ?, ?) "
+                f"ON CONFLICT(id) DO UPDATE SET seq = excluded.seq, data = excluded.data;",
+                (key, seq, raw)
+            )
+        return list(zip(keys, seqs, raws))
+
+    def clear(self, conn):
+        conn.execute(f"DELETE FROM {self.table};")
+
+
+MAP_COLLECTIONS = {
+    'users': _UsersTable(),
+    'spaces': _SpacesTable(),
+    'uploaded_files': _MapTable('uploaded_files', 'id'),
+    'invitation_codes': _MapTable('invitation_codes', 'code'),
+    'daily_active_users': _DailyActivityTable(),
+}
+
+# Every other top-level key: one JSON row in app_data
+_APP_DATA = _MapTable('app_data', 'key', data_column='value', order_column='rowid')
+
+LIST_COLLECTIONS = {
+    'orders': _ListTable('orders'),
+    'webhook_events': _ListTable('webhook_events'),
+}
+
+
+def _migrate_to_tables(conn, db_path):
+    """v1: one row per entry instead of the whole database in app_data['main_db']."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS app_data (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+    """)
+    for table in list(MAP_COLLECTIONS.values()) + list(LIST_COLLECTIONS.values()):
+        table.create(conn)
+    _add_row_versions(conn, db_path)
+    _create_chat_log(conn)
+
+    row = conn.execute("SELECT value FROM app_data WHERE key = ?;", (LEGACY_BLOB_KEY,)).fetchone()
+    if not row:
+        return
+    # Keep a copy of the old blob next to the regular backups before splitting it up
+    backup_dir = os.path.join(os.path.dirname(os.path.abspath(db_path)), 'backups')
+    os.makedirs(backup_dir, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    with open(os.path.join(backup_dir, f"main_db_{timestamp}.json"), 'w', encoding='utf-8') as f:
+        f.write(row[0])
+    conn.execute("DELETE FROM app_data WHERE key = ?;", (LEGACY_BLOB_KEY,))
+    _replace_all(conn, db_path, json.loads(row[0]))
+
+
+def _add_generations(conn, db_path):
+    """v2: per-key change counters that invalidate the process read caches (see _ReadCache)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS db_generations (
+            name TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL
+        );
+    """)
+
+
+def _add_row_versions(conn, db_path):
+    """v3: a version column on the keyed tables, bumped by every write (see _MapTable.upsert).
+
+    v1 runs this as well, since it fills the tables of databases that predate the column.
+    """
+    for table in [_APP_DATA] + list(MAP_COLLECTIONS.values()):
+        if not table.versioned:
+            continue
+        columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table.table});")}
+        if 'version' not in columns:
+            conn.execute(f"ALTER TABLE {table.table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0;")
+
+
+def _add_user_tokens(conn, db_path):
+    """v4: the user_tokens index for API-key lookups (see find_username_by_api_key)."""
+    users = MAP_COLLECTIONS['users']
+    users.create(conn)
+    for username, raw, _ in users.fetch_all(conn):
+        users.index_token(conn, username, users._api_key(raw))
+
+
+def _add_user_lookup_indexes(conn, db_path):
+    """v5: indexes for email and case-insensitive username lookups (find_usernames_by_email, ...)."""
+    MAP_COLLECTIONS['users'].create(conn)
+
+
+def _add_space_lookup_indexes(conn, db_path):
+    """v6: indexes for finding spaces by name or card_type and templates by name (find_space_ids, ...)."""
+    MAP_COLLECTIONS['spaces'].create_indexes(conn)
+
+
+def _add_user_activity(conn, db_path):
+    """v7: user_activity (username -> last_seen), written in batches by project.activity."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS user_activity (
+            username TEXT PRIMARY KEY,
+            last_seen TEXT NOT NULL
+        ) WITHOUT ROWID;
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO user_activity (username, last_seen)
+        SELECT username, json_extract(data, '$.last_seen') FROM users
+        WHERE json_extract(data, '$.last_seen') IS NOT NULL;
+    """)
+
+
+def _add_usage_counters(conn, db_path):
+    """v8: usage_counters, one row per (user, kind, day) (see project.usage_limiter).
+
+    `used` counts committed units and `reserved` the ones still in flight;
+    today's counts are carried over from the users' daily_usage.
+    """
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS usage_counters (
+            username TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            day TEXT NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0,
+            reserved INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (username, kind, day)
+        ) WITHOUT ROWID;
+    """)
+    for kind in ('chat', 'websocket'):
+        conn.execute(f"""
+            INSERT OR IGNORE INTO usage_counters (username, kind, day, used)
+            SELECT username, '{kind}', json_extract(data, '$.daily_usage.date'),
+                   json_extract(data, '$.daily_usage.{kind}_count')
+            FROM users
+            WHERE json_extract(data, '$.daily_usage.date') IS NOT NULL
+              AND json_extract(data, '$.daily_usage.{kind}_count') > 0;
+        """)
+
+
+def _create_chat_log(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL UNIQUE,
+            username TEXT NOT NULL,
+            timestamp REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS chat_log_timestamp ON chat_log (timestamp);")
+    conn.execute("CREATE INDEX IF NOT EXISTS chat_log_username ON chat_log (username);")
+
+
+def _add_chat_log(conn, db_path):
+    """v9: chat_log, the append-only chat store (see add_chat_message).
+
+    The chat_messages and chat_history lists move out of the list collections,
+    history first, so seq follows the order the messages were posted in.
+    v1 creates the table as well, since it fills it from the legacy blob.
+    """
+    _create_chat_log(conn)
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_messages';").fetchone():
+        for (raw,) in conn.execute("SELECT data FROM chat_messages ORDER BY archived DESC, seq;").fetchall():
+            _append_chat(conn, json.loads(raw))
+        conn.execute("DROP TABLE chat_messages;")
+
+
+SCHEMA_MIGRATIONS = [
+    _migrate_to_tables,
+    _add_generations,
+    _add_row_versions,
+    _add_user_tokens,
+    _add_user_lookup_indexes,
+    _add_space_lookup_indexes,
+    _add_user_activity,
+    _add_usage_counters,
+    _add_chat_log,
+]
+
+
 def get_db_path():
     """Constructs the full path to the SQLite database file within the instance folder."""
     return os.path.join(current_app.instance_path, current_app.config['DB_FILE'])
 
-def get_db_connection():
-    """Establishes a connection to the SQLite database."""
-    conn = sqlite3.connect(get_db_path())
+# Per-connection tuning (journal_mode=WAL is stored in the file, see init_db_schema)
+CACHE_SIZE_KB = 16 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+
+def _connect(db_path, timeout=5.0):
+    # Autocommit mode: writers open their transactions explicitly (see _write_transaction).
+    # Pooled connections move between threads/greenlets, but only one uses a connection at a time.
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=timeout, check_same_thread=False)
     conn.row_factory = sqlite3.Row # This allows accessing columns by name
+    # WAL only has to be fsynced at checkpoints; a power cut can lose the last commits, never corrupt
+    conn.execute("PRAGMA synchronous = NORMAL;")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB};")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
     return conn
 
-def init_db_schema():
-    """Initializes the database schema if it doesn't exist."""
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS app_data (
-                key TEXT PRIMARY KEY,
-                value TEXT
-            );
-        """)
-        conn.commit()
+def get_db_connection():
+    """Establishes a connection to the SQLite database."""
+    return _connect(get_db_path())
+
+
+class _ConnectionPool:
+    """Open connections to one database file, reused across threads and greenlets.
+
+    A connection is checked out for one read or one transaction and then put
+    back; at most MAX_IDLE are kept open, extra ones are closed on return.
+    """
+
+    MAX_IDLE = 8
+
+    def __init__(self, db_path, timeout):
+        self._db_path = db_path
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._idle = []
+
+    @contextmanager
+    def connection(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = _connect(self._db_path, timeout=self._timeout)
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def _release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK;")
+        except sqlite3.Error:
+            conn.close()
+            return
+        with self._lock:
+            if len(self._idle) < self.MAX_IDLE:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def _pool(db_path, writer=False):
+    # Writers don't wait in SQLite's busy handler (timeout=0), see _retry_busy
+    key = (db_path, writer)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = _ConnectionPool(db_path, 0 if writer else 5.0)
+        return pool
+
+def close_db_connections():
+    """Closes every pooled connection; new ones are opened on demand."""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close()
+
+@contextmanager
+def _read_connection(db_path):
+    with _pool(db_path).connection() as conn:
+        yield conn
+
+# How long a writer keeps retrying while another connection holds the write lock
+BUSY_TIMEOUT = 10.0
+
+def _retry_busy(conn, sql):
+    """Runs sql, retrying with backoff while the database is locked by another connection.
+
+    The waiting is done with time.sleep instead of SQLite's busy handler so that,
+    under eventlet, the greenlet holding the lock gets to run and release it.
+    """
+    deadline = time.monotonic() + BUSY_TIMEOUT
+    delay = 0.005
+    while True:
+        try:
+            return conn.execute(sql)
+        except sqlite3.OperationalError as e:
+            message = str(e)
+            if ('locked' not in message and 'busy' not in message) or time.monotonic() >= deadline:
+                raise
+        time.sleep(delay)
+        delay = min(delay * 2, 0.1)
+
+@contextmanager
+def _write_transaction(db_path):
+    """A connection inside BEGIN IMMEDIATE; commits on success, rolls back on error."""
+    with _pool(db_path, writer=True).connection() as conn:
+        _retry_busy(conn, "BEGIN IMMEDIATE;")
+        try:
+            yield conn
+            _retry_busy(conn, "COMMIT;")
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK;")
+            raise
+
+# Database files whose schema is known to be current in this process
+_schema_ready = set()
+
+def init_db_schema(db_path=None):
+    """Creates the tables, runs pending migrations and turns on WAL journaling.
+
+    Runs once per database file and process (init_db() does it at startup);
+    later calls return without touching the database.
+    """
+    db_path = db_path or get_db_path()
+    if db_path in _schema_ready:
+        return
+    with _read_connection(db_path) as conn:
+        # Persistent in the file: readers no longer block behind a writer
+        _retry_busy(conn, "PRAGMA journal_mode = WAL;")
+        current = conn.execute("PRAGMA user_version;").fetchone()[0] >= len(SCHEMA_MIGRATIONS)
+    if not current:
+        with _write_transaction(db_path) as conn:
+            # Re-check under the write lock in case another process migrated meanwhile
+            version = conn.execute("PRAGMA user_version;").fetchone()[0]
+            for number, migrate in enumerate(SCHEMA_MIGRATIONS[version:], start=version + 1):
+                migrate(conn, db_path)
+                conn.execute(f"PRAGMA user_version = {number};")
+    _schema_ready.add(db_path)
+
+
+class _ReadCache:
+    """Process-wide cache of stored entries, shared by every load_db() in this process.
+
+    Entries are grouped by top-level key ('users', 'settings', ...) and every
+    save bumps the changed groups in db_generations. validate() first asks
+    PRAGMA data_version on the cache's own connection, which only changes when
+    some other connection has committed, and only then re-reads the counters
+    and drops the groups that moved. Values are kept as marshal snapshots, so
+    every reader gets private objects: mutating what load_db() returned can
+    never leak into the cache or into another request.
+    """
+
+    MAX_ENTRIES = 20000
+
+    def __init__(self, db_path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+        self._data_version = None
+        self._generations = {}
+        self._groups = {}   # group -> {part: entry}
+        self._size = 0
+
+    def validate(self):
+        """Drops stale groups and returns the generations readers may cache under."""
+        with self._lock:
+            data_version = self._conn.execute("PRAGMA data_version;").fetchone()[0]
+            if data_version != self._data_version:
+                generations = dict(self._conn.execute("SELECT name, generation FROM db_generations;"))
+                for group in list(self._groups):
+                    if generations.get(group) != self._generations.get(group):
+                        self._size -= len(self._groups.pop(group))
+                self._generations = generations
+                self._data_version = data_version
+            return self._generations
+
+    def get(self, generations, group, part, load):
+        with self._lock:
+            entries = self._groups.get(group)
+            if entries is not None and part in entries:
+                return entries[part]
+        entry = load()
+        with self._lock:
+            # Only cache what was read under the generations that are still current
+            if generations is self._generations:
+                if self._size >= self.MAX_ENTRIES:
+                    self._groups.clear()
+                    self._size = 0
+                entries = self._groups.setdefault(group, {})
+                if part not in entries:
+                    self._size += 1
+                entries[part] = entry
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+            self._size = 0
+
+
+_read_caches = {}
+_read_caches_lock = threading.Lock()
+
+def _read_cache(db_path):
+    with _read_caches_lock:
+        cache = _read_caches.get(db_path)
+        if cache is None:
+            cache = _read_caches[db_path] = _ReadCache(db_path)
+        return cache
+
+def _bump_generations(conn, groups):
+    conn.executemany(
+        "INSERT INTO db_generations (name, generation) VALUES (?, 1) "
+        "ON CONFLICT(name) DO UPDATE SET generation = generation + 1;",
+        [(group,) for group in sorted(groups)]
+    )
+
+
+_UNLOADED = object()
+
+class _LazyDict(dict):
+    """A dict whose values are read from the database the first time they are used.
+
+    The keys are read up front (cheap), so `in`, len() and iteration over keys
+    need no further queries. d[key] / d.get(key) read just that entry; values(),
+    items() and friends read everything that is still missing in one query.
+    Reads go through the process-wide _ReadCache unless the dict is bound to a
+    transaction's connection. The stored form of every loaded entry is
+    remembered so a save can write only the entries that changed.
+    """
+
+    # After this many single-entry reads the rest is read in one go
+    POINT_READS = 16
+
+    def __init__(self, db_path, conn=None, generations=None):
+        super().__init__()
+        self._db_path = db_path
+        self._conn = conn
+        self._generations = generations  # None: bypass the read cache
+        self._raw = {}          # key -> stored form as loaded (or last written)
+        self._versions = {}     # key -> row version of that stored form
+        self._deleted = set()   # keys removed since loading
+        self._point_reads = 0
+        for key in self._cached(self._keys_group(), 'keys', self._fetch_keys):
+            dict.__setitem__(self, key, _UNLOADED)
+
+    @contextmanager
+    def _reader(self):
+        if self._conn is not None:
+            yield self._conn
+        else:
+            with _read_connection(self._db_path) as conn:
+                yield conn
+
+    def _cached(self, group, part, load):
+        if self._generations is None:
+            with self._reader() as conn:
+                return load(conn)
+
+        def load_fresh():
+            with self._reader() as conn:
+                return load(conn)
+        return _read_cache(self._db_path).get(self._generations, group, part, load_fresh)
+
+    def _keys_group(self):
+        """Read-cache group of the key list (and of the whole collection)."""
+        raise NotImplementedError
+
+    def _entry_group(self, key):
+        raise NotImplementedError
+
+    def _fetch_keys(self, conn):
+        raise NotImplementedError
+
+    def _fetch_one(self, conn, key):
+        """(stored form, version) of one entry, or None if it no longer exists."""
+        raise NotImplementedError
+
+    def _fetch_all(self, conn):
+        """[(key, stored form, version)] for every stored entry."""
+        raise NotImplementedError
+
+    def _decode(self, raw):
+        raise NotImplementedError
+
+    def _entry(self, raw, version):
+        return raw, version, marshal.dumps(self._decode(raw))
+
+    def _use(self, key, entry):
+        raw, version, snapshot = entry
+        self._raw[key] = raw
+        self._versions[key] = version
+        value = marshal.loads(snapshot)
+        dict.__setitem__(self, key, value)
+        return value
+
+    def _written(self, key, raw, result):
+        """Records a write made by _flush; `result` is the table's (version, merged)."""
+        self._raw[key] = raw
+        version, merged = result
+        self._versions[key] = version
+        if merged is None:
+            return
+        # Someone else changed the entry meanwhile: carry on with the merged value,
+        # updated in place so references the caller still holds see it too
+        self._raw[key] = merged
+        value, fresh = dict.__getitem__(self, key), self._decode(merged)
+        if type(value) is dict and isinstance(fresh, dict):
+            value.clear()
+            value.update(fresh)
+        else:
+            dict.__setitem__(self, key, fresh)
+
+    def _read_one(self, key):
+        def load(conn):
+            row = self._fetch_one(conn, key)
+            return None if row is None else self._entry(*row)
+
+        entry = self._cached(self._entry_group(key), ('entry', key), load)
+        if entry is None:
+            dict.__delitem__(self, key)  # deleted by someone else since the keys were read
+            raise KeyError(key)
+        return self._use(key, entry)
+
+    def _load_all(self):
+        missing = {key for key, value in dict.items(self) if value is _UNLOADED}
+        if not missing:
+            return
+        entries = self._cached(self._keys_group(), 'all', lambda conn: [
+            (key, self._entry(raw, version)) for key, raw, version in self._fetch_all(conn)])
+        for key, entry in entries:
+            if key in missing:
+                missing.discard(key)
+                self._use(key, entry)
+        for key in missing:
+            dict.__delitem__(self, key)
+
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if value is not _UNLOADED:
+            return value
+        self._point_reads += 1
+        if self._point_reads > self.POINT_READS:
+            self._load_all()
+            return dict.__getitem__(self, key)
+        return self._read_one(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, key, value):
+        self._deleted.discard(key)
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._deleted.add(key)
+
+    def pop(self, key, *default):
+        try:
+            value = self[key]
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        del self[key]
+        return value
+
+    def popitem(self):
+        if not dict.__len__(self):
+            raise KeyError('popitem(): dictionary is empty')
+        key = next(reversed(dict.keys(self)))
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return default
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        for key in list(dict.keys(self)):
+            del self[key]
+
+    def __iter__(self):
+        # Overriding __iter__ also keeps dict(d) / {**d} off the C fast path that would
+        # copy unloaded placeholders; they go through keys() and __getitem__ instead
+        return dict.__iter__(self)
+
+    def values(self):
+        self._load_all()
+        return dict.values(self)
+
+    def items(self):
+        self._load_all()
+        return dict.items(self)
+
+    def copy(self):
+        self._load_all()
+        return dict(dict.items(self))
+
+    def __eq__(self, other):
+        self._load_all()
+        if isinstance(other, _LazyDict):
+            other._load_all()
+        return dict.__eq__(self, other)
+
+    __hash__ = None
+
+    def __or__(self, other):
+        return self.copy() | other
+
+    def __repr__(self):
+        self._load_all()
+        return dict.__repr__(self)
+
+    def __reduce__(self):
+        # copy/deepcopy/pickle produce a plain dict
+        return dict, (self.copy(),)
+
+    def _changed(self, encode):
+        """(key, raw, old_raw) for every loaded entry whose stored form differs."""
+        for key, value in dict.items(self):
+            if value is _UNLOADED:
+                continue
+            raw = encode(value)
+            old_raw = self._raw.get(key)
+            if raw != old_raw:
+                yield key, raw, old_raw
+
+
+class _RowMap(_LazyDict):
+    """One MAP_COLLECTIONS collection, e.g. db['users']."""
+
+    def __init__(self, name, db_path, conn=None, generations=None):
+        self._name = name
+        self._table = MAP_COLLECTIONS[name]
+        super().__init__(db_path, conn, generations)
+
+    def _keys_group(self):
+        return self._name
+
+    def _entry_group(self, key):
+        return self._name
+
+    def _fetch_keys(self, conn):
+        return self._table.fetch_keys(conn)
+
+    def _fetch_one(self, conn, key):
+        return self._table.fetch_one(conn, key)
+
+    def _fetch_all(self, conn):
+        return self._table.fetch_all(conn)
+
+    def _decode(self, raw):
+        return self._table.decode(raw)
+
+    def _flush(self, conn):
+        """Writes the changed rows; returns whether anything was written."""
+        changed = bool(self._deleted)
+        for key in self._deleted:
+            self._versions.pop(key, None)
+            self._table.delete(conn, key, self._raw.pop(key, None))
+        self._deleted.clear()
+        for key, raw, old_raw in list(self._changed(self._table.encode)):
+            result = self._table.upsert(conn, key, raw, old_raw, self._versions.get(key))
+            self._written(key, raw, result)
+            changed = True
+        return changed
+
+
+class Database(_LazyDict):
+    """The whole database as the nested dict the application has always used.
+
+    db['settings'] reads one app_data row, db['users'] is a lazy _RowMap so
+    db['users'][name] reads one user, and the list collections (orders,
+    webhook_events) are read in full on first use. Pass it back to save_db() to
+    write what changed.
+    """
+
+    # Read-cache group of the set of app_data keys
+    KEYS_GROUP = '*'
+
+    def _keys_group(self):
+        return self.KEYS_GROUP
+
+    def _entry_group(self, key):
+        return key
+
+    def _fetch_keys(self, conn):
+        keys = [row[0] for row in conn.execute("SELECT key FROM app_data ORDER BY rowid;")]
+        return keys + list(MAP_COLLECTIONS) + list(LIST_COLLECTIONS)
+
+    def _fetch_one(self, conn, key):
+        if key in LIST_COLLECTIONS:
+            return LIST_COLLECTIONS[key].fetch(conn), None
+        return _APP_DATA.fetch_one(conn, key)
+
+    def _decode(self, raw):
+        if isinstance(raw, list):
+            return [json.loads(row[2]) for row in raw]
+        return json.loads(raw)
+
+    def _read_one(self, key):
+        if key in MAP_COLLECTIONS:
+            value = _RowMap(key, self._db_path, self._conn, self._generations)
+            dict.__setitem__(self, key, value)
+            return value
+        return super()._read_one(key)
+
+    def _load_all(self):
+        # A few dozen top-level keys, each cached on its own
+        for key, value in list(dict.items(self)):
+            if value is _UNLOADED:
+                try:
+                    self._read_one(key)
+                except KeyError:
+                    pass
+
+    def _flush(self, conn):
+        """Writes what changed; returns the read-cache groups that were touched."""
+        touched = set()
+        for key in self._deleted:
+            self._raw.pop(key, None)
+            self._versions.pop(key, None)
+            if key in MAP_COLLECTIONS:
+                MAP_COLLECTIONS[key].clear(conn)
+            elif key in LIST_COLLECTIONS:
+                LIST_COLLECTIONS[key].clear(conn)
+            else:
+                conn.execute("DELETE FROM app_data WHERE key = ?;", (key,))
+                touched.add(self.KEYS_GROUP)
+            touched.add(key)
+        self._deleted.clear()
+
+        for key, value in dict.items(self):
+            if value is _UNLOADED:
+                continue
+            if key in MAP_COLLECTIONS:
+                table = MAP_COLLECTIONS[key]
+                if isinstance(value, _RowMap) and value._table is table:
+                    if value._flush(conn):
+                        touched.add(key)
+                    continue
+                # A plain dict assigned over the collection replaces it entirely
+                stored = {entry_key: (raw, version) for entry_key, raw, version in table.fetch_all(conn)}
+                for entry_key, (old_raw, _) in stored.items():
+                    if entry_key not in value:
+                        table.delete(conn, entry_key, old_raw)
+                for entry_key, entry in value.items():
+                    raw = table.encode(entry)
+                    old_raw, version = stored.get(entry_key, (None, None))
+                    if old_raw != raw:
+                        table.upsert(conn, entry_key, raw, old_raw, version)
+                touched.add(key)
+            elif key in LIST_COLLECTIONS:
+                table = LIST_COLLECTIONS[key]
+                old_rows = self._raw.get(key)
+                if old_rows is None:
+                    old_rows = table.fetch(conn)
+                rows = table.write(conn, old_rows, value if isinstance(value, list) else [])
+                if rows != old_rows:
+                    touched.add(key)
+                self._raw[key] = rows
+            else:
+                raw = _encode(value)
+                old_raw = self._raw.get(key)
+                if raw != old_raw:
+                    result = _APP_DATA.upsert(conn, key, raw, old_raw, self._versions.get(key))
+                    self._written(key, raw, result)
+                    touched.add(key)
+                    if old_raw is None:
+                        touched.add(self.KEYS_GROUP)
+        return touched
+
+
+def _find_entries(collection, part, lookup, matches):
+    # Index lookup on a stored collection, a scan of a plain dict; either way
+    # the loaded entries have the last word
+    if isinstance(collection, _RowMap):
+        candidates = collection._cached(collection._name, part, lambda conn: lookup(collection._table, conn))
+    else:
+        candidates = list(collection)
+    return [key for key in candidates if key in collection and matches(key, collection.get(key) or {})]
+
+def find_username_by_api_key(db, api_key):
+    """The username whose api_key is `api_key`, or None.
+
+    With a Database this is one lookup in the user_tokens index plus reading
+    that one user, instead of scanning db['users'].
+    """
+    if not api_key or not isinstance(api_key, str):
+        return None
+    token_hash = _token_hash(api_key)
+    found = _find_entries(db.get('users') or {}, ('token', token_hash),
+                        lambda table, conn: table.find_token(conn, token_hash),
+                        lambda username, user: hmac.compare_digest(str(user.get('api_key') or ''), api_key))
+    return found[0] if found else None
+
+def find_usernames_by_email(db, email):
+    """Usernames of the users whose email is `email`, oldest account first."""
+    if not email:
+        return []
+    return _find_entries(db.get('users') or {}, ('email', email),
+                       lambda table, conn: table.find_by_email(conn, email),
+                       lambda username, user: user.get('email') == email)
+
+def find_username_ignore_case(db, name):
+    """`name` if that user exists, else the user whose name matches it ignoring case, else None."""
+    users = db.get('users') or {}
+    if not name:
+        return None
+    if name in users:
+        return name
+    folded = name.lower()
+    found = _find_entries(users, ('name', folded),
+                        lambda table, conn: table.find_by_name(conn, folded),
+                        lambda username, user: username.lower() == folded)
+    return found[0] if found else None
+
+
+def find_space_ids(db, name=None, card_type=None):
+    """Ids of the spaces with this name and/or card_type, in catalogue order."""
+    return _find_entries(db.get('spaces') or {}, ('find', name, card_type),
+                         lambda table, conn: table.find(conn, name, card_type),
+                         lambda space_id, space: ((name is None or space.get('name') == name) and
+                                                  (card_type is None or space.get('card_type') == card_type)))
+
+def find_template_id(db, space_id, name):
+    """Id of the first template named `name` in the space, or None."""
+    space = (db.get('spaces') or {}).get(space_id) or {}
+    templates = space.get('templates') or {}
+    spaces = db.get('spaces')
+    if isinstance(spaces, _RowMap):
+        candidates = spaces._cached('spaces', ('template', space_id, name),
+                                    lambda conn: spaces._table.find_template(conn, space_id, name))
+    else:
+        candidates = list(templates)
+    for template_id in candidates:
+        if (templates.get(template_id) or {}).get('name') == name:
+            return template_id
+    return None
+
+
+def _replace_all(conn, db_path, data):
+    """Makes the stored database equal to the plain dict `data` (keys missing from it are removed).
+
+    Its chat_history and chat_messages lists, if any, replace the chat log.
+    Returns the read-cache groups that were touched.
+    """
+    if any(key in data for key in CHAT_LISTS):
+        conn.execute("DELETE FROM chat_log;")
+        for key in CHAT_LISTS:
+            for message in data.get(key) or []:
+                _append_chat(conn, message)
+        data = {key: value for key, value in data.items() if key not in CHAT_LISTS}
+    db = Database(db_path, conn)
+    for key in list(db):
+        if key not in data:
+            del db[key]
+    for key, value in data.items():
+        db[key] = value
+    return db._flush(conn)
+
+
+def open_db(db_path):
+    """load_db() for a database file outside the Flask app (maintenance scripts)."""
+    init_db_schema(db_path)
+    return Database(db_path, generations=_read_cache(db_path).validate())
 
 def load_db():
-    """Loads the entire application data from the SQLite database."""
-    init_db_schema() # Ensure table exists
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT value FROM app_data WHERE key = 'main_db';")
-        row = cursor.fetchone()
-        if row:
-            return json.loads(row['value'])
-    return get_default_db_structure()
+    """Loads the application data from the SQLite database (entries are read on first access).
+
+    Inside a request every call returns the same Database, so before_request
+    and the view share one load. Context processors should use load_db_copy().
+    """
+    if not has_request_context():
+        return open_db(get_db_path())
+    db = g.get('_request_db')
+    if db is None:
+        db = g._request_db = open_db(get_db_path())
+    return db
+
+def load_db_copy():
+    """A Database of its own, for code that only reads (or derives values for display).
+
+    Changes made to it never reach the request's Database, so a later
+    save_db() of that one cannot write them.
+    """
+    return open_db(get_db_path())
 
 def save_db(data):
-    """Saves the entire application data to the SQLite database."""
-    init_db_schema() # Ensure table exists
-    db_json = json.dumps(data, indent=4, ensure_ascii=False)
-    with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute("INSERT OR REPLACE INTO app_data (key, value) VALUES (?, ?);", ('main_db', db_json))
-        conn.commit()
+    """Saves the application data to the SQLite database.
+
+    With the Database returned by load_db()/open_db() only changed rows are
+    written; a plain dict replaces the whole database. Either way the changes
+    are committed before save_db() returns, and the changed groups are
+    invalidated in every process's read cache.
+
+    An entry that someone else changed since it was loaded is not overwritten:
+    the two changes are merged field by field (see _merge). Code that must
+    read and write without any interleaving uses db_transaction() instead.
+    """
+    if isinstance(data, Database):
+        with _write_transaction(data._db_path) as conn:
+            _bump_generations(conn, data._flush(conn))
+        return
+    db_path = get_db_path()
+    init_db_schema(db_path)
+    with _write_transaction(db_path) as conn:
+        _bump_generations(conn, _replace_all(conn, db_path, data))
+
+def release_request_db(exc=None):
+    """teardown_request hook: drops the request's Database (nothing is written here)."""
+    g.pop('_request_db', None)
+
+@contextmanager
+def db_transaction():
+    """Read-modify-write under the database write lock:
+
+        with db_transaction() as db:
+            db['users'][username]['points'] += 1
+
+    BEGIN IMMEDIATE is taken before anything is read, so `db` holds the latest
+    data and no other writer can change it until the block ends. The changes
+    are written and committed when the block exits (rolled back if it raises);
+    there is no need to call save_db(). Keep the block short: other writers
+    wait for it.
+    """
+    db_path = get_db_path()
+    init_db_schema(db_path)
+    with _write_transaction(db_path) as conn:
+        db = Database(db_path, conn)
+        yield db
+        _bump_generations(conn, db._flush(conn))
+
+
+def write_activity(db_path, last_seen, active):
+    """Writes one batch of activity: last_seen {username: ISO time} and active [(day, username)].
+
+    A last_seen older than the stored one is ignored; active pairs already
+    stored are skipped.
+    """
+    init_db_schema(db_path)
+    with _write_transaction(db_path) as conn:
+        conn.executemany(
+            "INSERT INTO user_activity (username, last_seen) VALUES (?, ?) "
+            "ON CONFLICT(username) DO UPDATE SET last_seen = excluded.last_seen "
+            "WHERE excluded.last_seen > user_activity.last_seen;",
+            list(last_seen.items())
+        )
+        if active:
+            conn.executemany("INSERT OR IGNORE INTO daily_active_users (day, username) VALUES (?, ?);", active)
+            _bump_generations(conn, {'daily_active_users'})
+
+def load_last_seen(db_path=None):
+    """{username: ISO time of the last request} as last written by write_activity()."""
+    db_path = db_path or get_db_path()
+    init_db_schema(db_path)
+    with _read_connection(db_path) as conn:
+        return dict(conn.execute("SELECT username, last_seen FROM user_activity;").fetchall())
+
+
+def _write_statement(db_path, sql, params):
+    """Runs one write statement in its own transaction; returns the number of rows changed."""
+    init_db_schema(db_path)
+    with _write_transaction(db_path) as conn:
+        return conn.execute(sql, params).rowcount
+
+def reserve_usage_unit(db_path, username, kind, day, limit):
+    """Reserves one unit if used + reserved stays within `limit`; returns whether it did."""
+    return _write_statement(db_path, """
+        INSERT INTO usage_counters (username, kind, day, reserved) SELECT ?, ?, ?, 1 WHERE ? > 0
+        ON CONFLICT (username, kind, day) DO UPDATE SET reserved = reserved + 1
+        WHERE used + reserved < ?;
+    """, (username, kind, day, limit, limit)) > 0
+
+def settle_usage_unit(db_path, username, kind, day, used):
+    """Ends a reservation: counted as used (commit) or given back (release)."""
+    _write_statement(db_path, """
+        UPDATE usage_counters SET reserved = reserved - 1, used = used + ?
+        WHERE username = ? AND kind = ? AND day = ? AND reserved > 0;
+    """, (1 if used else 0, username, kind, day))
+
+def refund_usage_unit(db_path, username, kind, day):
+    """Takes back one committed unit."""
+    _write_statement(db_path, """
+        UPDATE usage_counters SET used = used - 1
+        WHERE username = ? AND kind = ? AND day = ? AND used > 0;
+    """, (username, kind, day))
+
+def get_usage_counts(db_path, username, kind, day):
+    """(used, reserved) for one user, kind and day."""
+    init_db_schema(db_path)
+    with _read_connection(db_path) as conn:
+        row = conn.execute("SELECT used, reserved FROM usage_counters WHERE username = ? AND kind = ? AND day = ?;",
+                           (username, kind, day)).fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+
+# Chat: the append-only chat_log table. seq only ever grows and is the cursor
+# of the chat API; the messages never pass through the Database dict.
+
+# The lists the chat used to be stored in (legacy blobs and plain-dict saves)
+CHAT_LISTS = ('chat_history', 'chat_messages')
+
+CHAT_PAGE_SIZE = 50
+
+def _append_chat(conn, message):
+    """Appends one message; returns its seq, or None if a message with its id is already stored."""
+    message = {key: value for key, value in message.items() if key != 'seq'}
+    if message.get('id') in (None, ''):
+        message['id'] = str(uuid.uuid4())
+    timestamp = message.get('timestamp')
+    cursor = conn.execute(
+        "INSERT OR IGNORE INTO chat_log (id, username, timestamp, data) VALUES (?, ?, ?, ?);",
+        (str(message['id']), str(message.get('username', '')),
+         timestamp if isinstance(timestamp, (int, float)) else 0, _encode(message))
+    )
+    return cursor.lastrowid if cursor.rowcount else None
+
+def _chat_page(rows):
+    messages = []
+    for seq, raw in rows:
+        message = json.loads(raw)
+        message['seq'] = seq
+        messages.append(message)
+    return messages
+
+def add_chat_message(db_path, username, content, **fields):
+    """Posts a message; returns it with its id, timestamp and seq."""
+    message = {'id': str(uuid.uuid4()), 'username': username, 'content': content,
+               'timestamp': time.time(), **fields}
+    init_db_schema(db_path)
+    with _write_transaction(db_path) as conn:
+        message['seq'] = _append_chat(conn, message)
+    return message
+
+def get_chat_messages(db_path, after=None, before=None, limit=CHAT_PAGE_SIZE):
+    """One page of messages, oldest first.
+
+    With `after` (a seq) the first `limit` messages after it, to catch up;
+    otherwise the last `limit` messages before `before`, or the newest ones.
+    """
+    init_db_schema(db_path)
+    with _read_connection(db_path) as conn:
+        if after is not None:
+            rows = conn.execute("SELECT seq, data FROM chat_log WHERE seq > ? ORDER BY seq LIMIT ?;",
+                                (after, limit)).fetchall()
+        elif before is not None:
+            rows = conn.execute("SELECT seq, data FROM chat_log WHERE seq < ? ORDER BY seq DESC LIMIT ?;",
+                                (before, limit)).fetchall()[::-1]
+        else:
+            rows = conn.execute("SELECT seq, data FROM chat_log ORDER BY seq DESC LIMIT ?;",
+                                (limit,)).fetchall()[::-1]
+    return _chat_page(rows)
+
+def get_latest_chat_message(db_path, usernames):
+    """The newest message posted by any of `usernames`, or None."""
+    usernames = list(usernames)
+    if not usernames:
+        return None
+    init_db_schema(db_path)
+    with _read_connection(db_path) as conn:
+        rows = conn.execute(
+            f"SELECT seq, data FROM chat_log WHERE username IN ({', '.join('?' * len(usernames))}) "
+            f"ORDER BY seq DESC LIMIT 1;", usernames
+        ).fetchall()
+    return (_chat_page(rows) or [None])[0]
+
+def count_chat_messages_since(db_path, timestamp, limit=100):
+    """Number of messages posted after `timestamp`, counted up to `limit` (enough for a badge)."""
+    init_db_schema(db_path)
+    with _read_connection(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM (SELECT 1 FROM chat_log WHERE timestamp > ? LIMIT ?);",
+                            (timestamp, limit)).fetchone()[0]
+
+def delete_chat_message(db_path, message_id):
+    """Removes one message; returns whether it existed."""
+    return _write_statement(db_path, "DELETE FROM chat_log WHERE id = ?;", (message_id,)) > 0
+
+def rename_user_rows(db, old_username, new_username):
+    """Moves old_username's rows outside the Database dict (usage counters, last seen, chat log) to new_username.
+
+    `db` must come from db_transaction(): the rows move in the same transaction
+    as the users entry. Counters new_username already has for a kind and day
+    are added to, not overwritten; of two last_seen times the later one is kept.
+    Flush the activity tracker first so its buffered last_seen is moved too.
+    """
+    conn = db._conn
+    conn.execute("""
+        INSERT INTO usage_counters (username, kind, day, used, reserved)
+        SELECT ?, kind, day, used, reserved FROM usage_counters WHERE username = ?
+        ON CONFLICT (username, kind, day) DO UPDATE
+        SET used = used + excluded.used, reserved = reserved + excluded.reserved;
+    """, (new_username, old_username))
+    conn.execute("DELETE FROM usage_counters WHERE username = ?;", (old_username,))
+    conn.execute("""
+        INSERT INTO user_activity (username, last_seen)
+        SELECT ?, last_seen FROM user_activity WHERE username = ?
+        ON CONFLICT (username) DO UPDATE SET last_seen = excluded.last_seen
+        WHERE excluded.last_seen > user_activity.last_seen;
+    """, (new_username, old_username))
+    conn.execute("DELETE FROM user_activity WHERE username = ?;", (old_username,))
+    conn.execute("""
+        UPDATE chat_log SET username = ?, data = json_set(data, '$.username', ?) WHERE username = ?;
+    """, (new_username, new_username, old_username))
+
 
 def get_default_db_structure():
     """Returns the default structure for a new database."""
@@ -61,8 +1586,6 @@ def get_default_db_structure():
         "settings": {},
         "uploaded_files": {},
         "categories": [],
-        "chat_messages": [],
-        "chat_history": [],
         "articles": {},
         "invitation_codes": {},
         "modal_drive_shares": {},
@@ -133,8 +1656,6 @@ def init_db():
         db['settings'] = {}
     if 'uploaded_files' not in db:
         db['uploaded_files'] = {}
-    if 'chat_messages' not in db:
-        db['chat_messages'] = []
     if 'server_domain' not in db['settings'] or not db['settings']['server_domain']:
         db['settings']['server_domain'] = 'https://pumpkinai.it.com'
     if 'chat_is_muted' not in db['settings']:
@@ -327,20 +1848,104 @@ def init_db():
 
     save_db(db)
 
-def backup_db():
-    """Backs up the current SQLite database file with a timestamp."""
-    db_path = get_db_path()
-    backup_dir = os.path.join(current_app.instance_path, 'backups')
-    os.makedirs(backup_dir, exist_ok=True)
+# Backups: sqlite3's backup API copies the database a few pages at a time from
+# one read snapshot, so writers carry on meanwhile and the copy is never torn.
+BACKUP_PREFIX = 'db_backup_'
+BACKUP_PAGES_PER_STEP = 1024        # 4 MB with the default page size
+BACKUP_CHUNK_SIZE = 1024 * 1024     # bytes compressed per step
+BACKUP_KEEP = 14                    # newest backups kept
+BACKUP_MAX_AGE_DAYS = 30            # older ones are removed (the newest always stays)
 
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    backup_filename = f"db_backup_{timestamp}.sqlite"
-    backup_path = os.path.join(backup_dir, backup_filename)
+_backup_lock = threading.Lock()
+
+def _yield_between_steps(*progress):
+    time.sleep(0)  # under eventlet this lets the other greenlets run
 
+class _DigestWriter:
+    """File wrapper that hashes everything written through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+def _compress(src_path, dest_path):
+    """gzips src_path into dest_path chunk by chunk; returns the sha256 of dest_path."""
+    with open(src_path, 'rb') as src, open(dest_path, 'wb') as dest:
+        writer = _DigestWriter(dest)
+        with gzip.GzipFile(filename=os.path.basename(src_path), mode='wb', fileobj=writer) as compressed:
+            while True:
+                chunk = src.read(BACKUP_CHUNK_SIZE)
+                if not chunk:
+                    break
+                compressed.write(chunk)
+                _yield_between_steps()
+    return writer.digest.hexdigest()
+
+def _rotate_backups(backup_dir, keep, max_age_days):
+    """Removes backups beyond the newest `keep` or older than max_age_days; returns their names."""
+    backups = sorted((name for name in os.listdir(backup_dir)
+                      if name.startswith(BACKUP_PREFIX) and name.endswith(('.sqlite', '.sqlite.gz'))),
+                     key=lambda name: os.path.getmtime(os.path.join(backup_dir, name)), reverse=True)
+    cutoff = time.time() - max_age_days * 86400
+    removed = []
+    for n, name in enumerate(backups):
+        path = os.path.join(backup_dir, name)
+        if n == 0 or (n < keep and os.path.getmtime(path) >= cutoff):
+            continue
+        for stale in (path, path + '.sha256'):
+            if os.path.exists(stale):
+                os.remove(stale)
+        removed.append(name)
+    return removed
+
+def backup_db(db_path=None, backup_dir=None, keep=BACKUP_KEEP, max_age_days=BACKUP_MAX_AGE_DAYS):
+    """Takes an online backup of the database and rotates the old ones.
+
+    Writes backups/db_backup_<time>.sqlite.gz and, next to it, a .sha256 file
+    in sha256sum format. Only one backup runs at a time.
+    """
+    db_path = db_path or get_db_path()
+    backup_dir = backup_dir or os.path.join(current_app.instance_path, 'backups')
+    if not _backup_lock.acquire(blocking=False):
+        return {"success": False, "message": "Another backup is still running"}
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    copy_path = os.path.join(backup_dir, f"{BACKUP_PREFIX}{timestamp}.sqlite.tmp")
+    backup_path = os.path.join(backup_dir, f"{BACKUP_PREFIX}{timestamp}.sqlite.gz")
     try:
-        # Copy the SQLite database file
-        import shutil
-        shutil.copy2(db_path, backup_path)
-        return {"success": True, "message": f"Database backed up to {backup_path}"}
+        os.makedirs(backup_dir, exist_ok=True)
+        with _read_connection(db_path) as source:
+            copy = sqlite3.connect(copy_path)
+            try:
+                # One read transaction for the whole copy: commits made meanwhile
+                # do not restart it, they are simply not part of this backup
+                source.execute("BEGIN;")
+                source.execute("SELECT COUNT(*) FROM sqlite_master;").fetchone()
+                source.backup(copy, pages=BACKUP_PAGES_PER_STEP, progress=_yield_between_steps)
+                source.execute("ROLLBACK;")
+                if copy.execute("PRAGMA quick_check;").fetchone()[0] != 'ok':
+                    raise sqlite3.DatabaseError("the backup copy failed PRAGMA quick_check")
+            finally:
+                copy.close()
+        digest = _compress(copy_path, backup_path)
+        with open(backup_path + '.sha256', 'w', encoding='utf-8') as f:
+            f.write(f"{digest}  {os.path.basename(backup_path)}\n")
+        removed = _rotate_backups(backup_dir, keep, max_age_days)
+        return {"success": True, "message": f"Database backed up to {backup_path}",
+                "path": backup_path, "sha256": digest, "removed": removed}
     except Exception as e:
+        for path in (backup_path, backup_path + '.sha256'):
+            if os.path.exists(path):
+                os.remove(path)
         return {"success": False, "message": str(e)}
+    finally:
+        if os.path.exists(copy_path):
+            os.remove(copy_path)
+        _backup_lock.release()
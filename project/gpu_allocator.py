@@ -1,6 +1,6 @@
-import uuid
 import time
 from .database import save_db
+from .chat import post_message, chat_usernames
 
 def try_allocate_gpu_from_pool(db, username):
     """
@@ -48,31 +48,24 @@ def try_allocate_gpu_from_pool(db, username):
             f"Allocated {gpu_name} to @{username}."
         )
 
-        new_message = {
-            'id': str(uuid.uuid4()),
-            'username': 'System', # System sender
-            'content': msg_content,
-            'timestamp': time.time(),
-            'avatar': 'default.png' # Ensure system has an avatar or handle it in frontend
-        }
-
-        # If 'System' isn't a real user, we might want to fake the avatar in frontend or add a System user.
-        # Ideally, we should check if 'System' user exists or just let the frontend handle missing user.
-        # But 'username' field in chat usually links to user profile.
-        # Let's use 'Admin' or a dedicated system name. 'System' is fine if frontend handles it.
-        # Given existing code, let's look at how Admin sends messages.
-
-        if 'chat_messages' not in db:
-            db['chat_messages'] = []
-
-        db['chat_messages'].append(new_message)
-
-        # Archiving logic
-        if len(db['chat_messages']) > 99:
-            if 'chat_history' not in db:
-                db['chat_history'] = []
-            db['chat_history'].append(db['chat_messages'].pop(0))
+        # System sender (not a real user, so it gets the default avatar)
+        post_message('System', msg_content, avatar='default.png')
 
     # 6. Save DB
     save_db(db)
     return True
+
+
+def allocate_gpus_to_chat_users(db):
+    """
+    Hands pooled GPUs to the users waiting in the chat room, in the order they joined.
+    Called when the pool is refilled, since users in the chat no longer poll for one.
+    Returns the number of GPUs allocated.
+    """
+    allocated = 0
+    for username in chat_usernames():
+        if not db.get('gpu_pool'):
+            break
+        if try_allocate_gpu_from_pool(db, username):
+            allocated += 1
+    return allocated
@@ -13,7 +13,11 @@ from flask import (
 from urllib.parse import urlparse, urljoin
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash, generate_password_hash
-from .database import load_db, save_db
+from .database import (
+    load_db, save_db, get_db_path, db_transaction, find_usernames_by_email, get_latest_chat_message, rename_user_rows
+)
+from .activity import activity_tracker
+from .sensitive_words import sensitive_word_filter
 import json
 from .tasks import tasks, execute_inference_task
 from .s3_utils import generate_presigned_url, get_s3_config, get_public_s3_url
@@ -166,14 +170,8 @@ def index():
     ]
 
     # Find the latest message from an admin
-    latest_admin_message = None
-    chat_messages = db.get('chat_messages', [])
     admin_usernames = [u for u, d in db.get('users', {}).items() if d.get('is_admin')]
-
-    for message in reversed(chat_messages):
-        if message.get('username') in admin_usernames:
-            latest_admin_message = message
-            break
+    latest_admin_message = get_latest_chat_message(get_db_path(), admin_usernames)
 
     banner = db.get('banner', {})
 
@@ -227,9 +225,8 @@ def bind_email():
     db = load_db()
 
     # Check if this email is already used by ANOTHER user
-    for u, u_data in db['users'].items():
-        if u != username and u_data.get('email') == email:
-            return jsonify({'success': False, 'error': '该邮箱已被其他账号绑定，请使用其他邮箱。'}), 400
+    if any(u != username for u in find_usernames_by_email(db, email)):
+        return jsonify({'success': False, 'error': '该邮箱已被其他账号绑定，请使用其他邮箱。'}), 400
 
     user = db['users'].get(username)
     if not user:
@@ -456,88 +453,81 @@ def change_username():
     if new_username == old_username:
         return jsonify({'success': False, 'error': '新用户名不能与旧用户名相同'}), 400
 
-    db = load_db()
-
-    # Check if new username exists
-    if new_username in db['users']:
-        return jsonify({'success': False, 'error': '用户名已被占用'}), 400
-
-    user_data = db['users'].get(old_username)
-    if not user_data:
-        return jsonify({'success': False, 'error': '用户未找到'}), 404
-
-    # Check cooldown (30 days)
-    last_change = user_data.get('last_username_change_date')
-    now = datetime.utcnow()
-
-    if last_change:
-        last_change_dt = datetime.fromisoformat(last_change)
-        if (now - last_change_dt).days < 30:
-            days_left = 30 - (now - last_change_dt).days
-            return jsonify({'success': False, 'error': f'您最近修改过用户名，请在 {days_left} 天后再试。'}), 400
+    # Write buffered activity first so the old name's daily_active_users and last_seen rows get renamed below
+    activity_tracker.flush()
 
     try:
-        # Perform Rename Transaction
-        # 1. Update user record
-        user_data['username'] = new_username
-        user_data['last_username_change_date'] = now.isoformat()
-
-        # Ensure S3 folder mapping is preserved
-        if 's3_folder_name' not in user_data:
-            user_data['s3_folder_name'] = old_username
-
-        # 2. Move user entry in DB
-        db['users'][new_username] = user_data
-        del db['users'][old_username]
-
-        # 3. Update References
-
-        # Chat Messages
-        for msg in db.get('chat_messages', []):
-            if msg.get('username') == old_username:
-                msg['username'] = new_username
-
-        # Chat History
-        for msg in db.get('chat_history', []):
-            if msg.get('username') == old_username:
-                msg['username'] = new_username
-
-        # Uploaded Files
-        for file_info in db.get('uploaded_files', {}).values():
-            if file_info.get('username') == old_username:
-                file_info['username'] = new_username
-
-        # Spaces (Likes)
-        for space in db.get('spaces', {}).values():
-            if 'liked_by' in space and old_username in space['liked_by']:
-                space['liked_by'].remove(old_username)
-                space['liked_by'].append(new_username)
-
-        # User States
-        if old_username in db.get('user_states', {}):
-            db['user_states'][new_username] = db['user_states'].pop(old_username)
-
-        # Daily Active Users
-        for date_key, users_list in db.get('daily_active_users', {}).items():
-            if old_username in users_list:
-                users_list.remove(old_username)
-                users_list.append(new_username)
-
-        # Invitation Codes (generated by user)
-        # Assuming prefix logic might be used elsewhere, but DB stores exact keys.
-        # If code generation uses username in key, those keys are now stale but valid objects.
-        # We won't rename keys for invitation codes to avoid breaking shared links,
-        # but we might need to update metadata if it exists.
-
-        # Update Session
-        session['username'] = new_username
-
-        save_db(db)
-        return jsonify({'success': True, 'message': '用户名修改成功', 'new_username': new_username})
+        # Perform Rename Transaction: everything below commits together when the block exits
+        with db_transaction() as db:
+            # Check if new username exists
+            if new_username in db['users']:
+                return jsonify({'success': False, 'error': '用户名已被占用'}), 400
+
+            user_data = db['users'].get(old_username)
+            if not user_data:
+                return jsonify({'success': False, 'error': '用户未找到'}), 404
+
+            # Check cooldown (30 days)
+            last_change = user_data.get('last_username_change_date')
+            now = datetime.utcnow()
+
+            if last_change:
+                last_change_dt = datetime.fromisoformat(last_change)
+                if (now - last_change_dt).days < 30:
+                    days_left = 30 - (now - last_change_dt).days
+                    return jsonify({'success': False, 'error': f'您最近修改过用户名，请在 {days_left} 天后再试。'}), 400
+
+            # 1. Update user record
+            user_data['username'] = new_username
+            user_data['last_username_change_date'] = now.isoformat()
+
+            # Ensure S3 folder mapping is preserved
+            if 's3_folder_name' not in user_data:
+                user_data['s3_folder_name'] = old_username
+
+            # 2. Move user entry in DB
+            db['users'][new_username] = user_data
+            del db['users'][old_username]
+
+            # 3. Update References
+
+            # Uploaded Files
+            for file_info in db.get('uploaded_files', {}).values():
+                if file_info.get('username') == old_username:
+                    file_info['username'] = new_username
+
+            # Spaces (Likes)
+            for space in db.get('spaces', {}).values():
+                if 'liked_by' in space and old_username in space['liked_by']:
+                    space['liked_by'].remove(old_username)
+                    space['liked_by'].append(new_username)
+
+            # User States
+            if old_username in db.get('user_states', {}):
+                db['user_states'][new_username] = db['user_states'].pop(old_username)
+
+            # Daily Active Users
+            for date_key, users_list in db.get('daily_active_users', {}).items():
+                if old_username in users_list:
+                    users_list.remove(old_username)
+                    users_list.append(new_username)
+
+            # Invitation Codes (generated by user)
+            # Assuming prefix logic might be used elsewhere, but DB stores exact keys.
+            # If code generation uses username in key, those keys are now stale but valid objects.
+            # We won't rename keys for invitation codes to avoid breaking shared links,
+            # but we might need to update metadata if it exists.
+
+            # Usage counters, last seen and chat messages (stored in their own tables, not in db)
+            rename_user_rows(db, old_username, new_username)
 
     except Exception as e:
         return jsonify({'success': False, 'error': f'修改失败: {str(e)}'}), 500
 
+    # Update Session
+    session['username'] = new_username
+    return jsonify({'success': True, 'message': '用户名修改成功', 'new_username': new_username})
+
 @main_bp.route('/delete_account', methods=['POST'])
 def delete_account():
     if not session.get('logged_in'):
@@ -928,12 +918,10 @@ def run_inference(ai_project_id):
     db = load_db()
 
     # Sensitive word check
-    sensitive_words = db.get('sensitive_words', [])
     prompt = request.form.get('prompt', '')
-    if sensitive_words:
-        for word in sensitive_words:
-            if word in prompt:
-                return jsonify({'error': f'您的prompt中包含敏感词“{word}”，请修改后再提交。'}), 400
+    matches = sensitive_word_filter.find_all(db, prompt)
+    if matches:
+        return jsonify({'error': f'您的prompt中包含敏感词“{matches[0]}”，请修改后再提交。'}), 400
 
     username = session['username']
 
@@ -1376,7 +1364,7 @@ def submit_websockets_request(ai_project_id):
     username = session.get('username')
     request_id = str(uuid.uuid4())
 
-    from .usage_limiter import check_and_increment_usage
+    from .usage_limiter import reserve_usage
 
     # 1. Check Rate Limit (Cooldown) FIRST to avoid incrementing usage on rejected requests
     websockets_config = ai_project.get('websockets_config', {})
@@ -1402,12 +1390,12 @@ def submit_websockets_request(ai_project_id):
         # Update last request time (will be saved below)
         user_state['last_ws_request_times'][ai_project_id] = now
 
-    # 2. Check Daily Usage Limit
-    allowed, error_msg = check_and_increment_usage(db, username, 'websocket')
-    if not allowed:
+    # 2. Check Daily Usage Limit (a reserved unit, committed once the request is queued)
+    usage, error_msg = reserve_usage(db, username, 'websocket')
+    if not usage:
         return jsonify({'error': error_msg}), 403
 
-    # 3. Save all DB changes (usage increment + rate limit timestamp)
+    # 3. Save the rate limit timestamp
     save_db(db)
 
     payload = {
@@ -1420,6 +1408,7 @@ def submit_websockets_request(ai_project_id):
     if audio_url:
         payload['audio'] = audio_url
     else:
+        usage.release()
         return jsonify({'error': '缺少音频直链'}), 400
 
     # Handle video file upload (TODO)
@@ -1432,7 +1421,9 @@ def submit_websockets_request(ai_project_id):
 
     success, result = ws_manager.queue_inference_request(ai_project_id, request_id, username, payload)
     if not success:
+        usage.release()
         return jsonify({'error': result}), 500
+    usage.commit()
 
     upload = None
     try:
@@ -3,7 +3,7 @@ import random
 import threading
 import json
 from openai import OpenAI, APIError, AuthenticationError, RateLimitError, BadRequestError
-from .database import save_db
+from .database import save_db, find_space_ids
 
 DEFAULT_NETMIND_BASE_URL = 'https://api.netmind.ai/inference-api/openai/v1'
 
@@ -95,9 +95,8 @@ class NetMindClient:
             if alias_key and upstream_value:
                 lookup[alias_key] = upstream_value
 
-        for space in (db.get('spaces') or {}).values():
-            if space.get('card_type') != 'netmind':
-                continue
+        for space_id in find_space_ids(db, card_type='netmind'):
+            space = db['spaces'][space_id]
             alias = space.get('netmind_model')
             upstream = space.get('netmind_upstream_model') or alias
             if not isinstance(alias, str) or not isinstance(upstream, str):
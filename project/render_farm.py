@@ -0,0 +1,660 @@
+"""
+Render farm coordinator.
+
+Shards a render plan by scene and dispatches the shards to remote render
+workers connected over the existing Socket.IO server (see render_worker.py).
+
+Protocol:
+    worker -> server  render_worker_register  {worker_name, slots, token}
+    server -> worker  render_worker_registered {success, worker_id, message}
+    server -> worker  render_shard            {job_id, shard, attempt, source_url, scenes,
+                                               audio_urls, voice, rate, settings, upload_url}
+    worker -> server  render_shard_result     {job_id, shard, attempt, status, duration, srt, error}
+
+Workers read the source through signed, expiring blob URLs that honour HTTP
+Range requests, so ffmpeg only fetches the byte ranges it seeks into, and
+upload finished clips through a signed PUT URL that is bound to one attempt
+of one shard. Shards on a worker that disconnects, fails or times out are
+retried on other workers; uploads and results from a superseded attempt are
+refused. Workers must present RENDER_FARM_TOKEN; without one configured no
+worker can register. Finished jobs are dropped, together with their clips and
+inputs, JOB_RETENTION seconds after they end.
+"""
+
+import os
+import hmac
+import json
+import uuid
+import shutil
+import threading
+import subprocess
+import time
+import logging
+from collections import deque
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app, send_file, session, abort
+from itsdangerous import URLSafeTimedSerializer, BadSignature, SignatureExpired
+from werkzeug.utils import secure_filename
+
+SHARD_SCENES = 10           # scenes per shard
+SHARD_TIMEOUT = 30 * 60     # seconds before a dispatched shard is considered lost
+MAX_SHARD_ATTEMPTS = 3
+BLOB_URL_EXPIRATION = 6 * 3600
+JOB_RETENTION = 24 * 3600   # seconds a finished job (and its files) is kept for download
+REAPER_INTERVAL = 30
+
+
+class RenderWorker:
+    """A registered render worker (one Socket.IO session)"""
+    def __init__(self, sid, name, slots):
+        self.worker_id = str(uuid.uuid4())
+        self.sid = sid
+        self.name = name
+        self.slots = max(1, int(slots or 1))
+        self.active = set()  # {(job_id, shard_index)}
+        self.completed = 0
+        self.registered_at = datetime.utcnow().isoformat()
+
+
+class RenderShard:
+    """A contiguous run of scenes rendered by one worker"""
+    def __init__(self, job_id, index, scene_start, scenes):
+        self.job_id = job_id
+        self.index = index
+        self.scene_start = scene_start
+        self.scenes = scenes
+        self.status = 'queued'
+        self.attempts = 0
+        self.worker_sid = None
+        self.dispatched_at = None
+        self.failed_on = set()  # worker names this shard already failed on
+        self.duration = 0.0
+        self.srt = ''
+        self.clip_path = None  # upload of the attempt that completed
+        self.error = None
+
+
+class RenderJob:
+    def __init__(self, job_id, job_dir, source_path, settings, voice, rate, audio_files, base_url, input_dir=None):
+        self.job_id = job_id
+        self.job_dir = job_dir
+        self.input_dir = input_dir  # directory holding this job's source and audio, removed with the job
+        self.source_path = source_path
+        self.settings = settings
+        self.voice = voice
+        self.rate = rate
+        self.audio_files = audio_files  # {scene index: path} or {}
+        self.base_url = base_url  # public URL workers use to reach the blob endpoints
+        self.shards = []
+        self.status = 'queued'
+        self.error = None
+        self.created_at = datetime.utcnow().isoformat()
+        self.finished_at = None
+        self.finished_time = None  # time.time() when the job completed or failed
+        self.output_path = os.path.join(job_dir, 'output.mp4')
+        self.srt_path = os.path.join(job_dir, 'output.srt')
+
+
+def _parse_srt_time(value):
+    h, m, rest = value.strip().split(':')
+    s, ms = rest.split(',')
+    return int(h) * 3600 + int(m) * 60 + int(s) + int(ms) / 1000.0
+
+
+def _fmt_srt_time(seconds):
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    ms = int(round((s - int(s)) * 1000))
+    if ms == 1000:
+        s, ms = int(s) + 1, 0
+    return f"{int(h):02d}:{int(m):02d}:{int(s):02d},{ms:03d}"
+
+
+def merge_srt(parts):
+    """Concatenate (srt_text, duration) parts, shifting each by the preceding durations"""
+    entries = []
+    offset = 0.0
+    for srt_text, duration in parts:
+        for block in (srt_text or '').strip().split('\n\n'):
+            lines = block.strip().split('\n')
+            if len(lines) < 3 or '-->' not in lines[1]:
+                continue
+            start, end = lines[1].split('-->')
+            entries.append(
+                f"{len(entries) + 1}\n"
+                f"{_fmt_srt_time(_parse_srt_time(start) + offset)} --> {_fmt_srt_time(_parse_srt_time(end) + offset)}\n"
+                + '\n'.join(lines[2:]) + '\n'
+            )
+        offset += duration
+    return '\n'.join(entries)
+
+
+class RenderFarm:
+    """Tracks render workers and jobs, and schedules shards onto workers"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.workers = {}  # {sid: RenderWorker}
+        self.jobs = {}     # {job_id: RenderJob}
+        self.pending = deque()  # RenderShard
+        self.root_dir = None
+        self.serializer = None
+        self.emit = None    # emit(event, data, to=sid)
+        self.spawn = None   # spawn(fn, *args) for background work
+
+    def configure(self, root_dir, secret_key, emit, spawn):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+        self.serializer = URLSafeTimedSerializer(secret_key, salt='render-farm-blob')
+        self.emit = emit
+        self.spawn = spawn
+
+    # --- Signed blob URLs -------------------------------------------------
+
+    def blob_url(self, base_url, path, method='GET', **claims):
+        """Signed, expiring URL that lets a worker GET (with Range) or PUT one file under root_dir
+
+        PUT URLs carry the shard attempt they were issued for (claims j, s, a)
+        and stop resolving once that attempt is no longer the dispatched one.
+        """
+        rel_path = os.path.relpath(path, self.root_dir)
+        token = self.serializer.dumps({'p': rel_path, 'm': method, **claims})
+        return f"{base_url.rstrip('/')}/api/render-farm/blob/{token}"
+
+    def resolve_blob(self, token, method):
+        try:
+            data = self.serializer.loads(token, max_age=BLOB_URL_EXPIRATION)
+        except (BadSignature, SignatureExpired):
+            return None
+        if data.get('m') != method:
+            return None
+        path = os.path.abspath(os.path.join(self.root_dir, data['p']))
+        if not path.startswith(os.path.abspath(self.root_dir) + os.sep):
+            return None
+        if method == 'PUT' and not self._is_current_attempt(data.get('j'), data.get('s'), data.get('a')):
+            return None
+        return path
+
+    def _is_current_attempt(self, job_id, index, attempt):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job.status == 'failed' or not isinstance(index, int) or not 0 <= index < len(job.shards):
+                return False
+            shard = job.shards[index]
+            return shard.status == 'dispatched' and shard.attempts == attempt
+
+    # --- Workers ----------------------------------------------------------
+
+    def register_worker(self, sid, name, slots=1):
+        with self.lock:
+            worker = RenderWorker(sid, name or sid[:8], slots)
+            self.workers[sid] = worker
+        logging.info(f"Render worker registered: {worker.name} ({worker.slots} slots)")
+        self.dispatch()
+        return worker
+
+    def unregister_worker(self, sid):
+        """Forget a worker and requeue whatever it was rendering"""
+        with self.lock:
+            worker = self.workers.pop(sid, None)
+            if not worker:
+                return False
+            for job_id, index in list(worker.active):
+                job = self.jobs.get(job_id)
+                if job:
+                    self._fail_shard(job, job.shards[index], worker, 'worker disconnected')
+        logging.info(f"Render worker disconnected: {worker.name}")
+        self.dispatch()
+        return True
+
+    def list_workers(self):
+        with self.lock:
+            return [{
+                'worker_id': w.worker_id,
+                'name': w.name,
+                'slots': w.slots,
+                'active': len(w.active),
+                'completed': w.completed,
+                'registered_at': w.registered_at
+            } for w in self.workers.values()]
+
+    # --- Jobs -------------------------------------------------------------
+
+    def submit_job(self, source_path, script_data, base_url, audio_files=None, settings=None,
+                   voice='zh-CN-YunxiNeural', rate='+0%', shard_scenes=SHARD_SCENES, input_dir=None):
+        """
+        Split script_data into shards of shard_scenes scenes and queue them
+
+        audio_files: optional {scene index: path}; without it workers synthesize TTS themselves.
+        input_dir: directory of the job's inputs, deleted when the job expires.
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.root_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        job = RenderJob(job_id, job_dir, source_path, settings or {}, voice, rate,
+                        {str(k): v for k, v in (audio_files or {}).items()}, base_url, input_dir)
+        shard_scenes = max(1, int(shard_scenes))
+        for index, start in enumerate(range(0, len(script_data), shard_scenes)):
+            job.shards.append(RenderShard(job_id, index, start, script_data[start:start + shard_scenes]))
+        with self.lock:
+            self.jobs[job_id] = job
+            self.pending.extend(job.shards)
+        logging.info(f"Render job {job_id}: {len(script_data)} scenes in {len(job.shards)} shards")
+        self.dispatch()
+        return job_id
+
+    def get_job_status(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job:
+                return None
+            counts = {}
+            for shard in job.shards:
+                counts[shard.status] = counts.get(shard.status, 0) + 1
+            return {
+                'job_id': job.job_id,
+                'status': job.status,
+                'error': job.error,
+                'shards': len(job.shards),
+                'shard_status': counts,
+                'created_at': job.created_at,
+                'finished_at': job.finished_at
+            }
+
+    def get_job_output(self, job_id):
+        """(output path, SRT path) of a completed job, or None while it is not ready"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job.status != 'completed':
+                return None
+            return job.output_path, job.srt_path
+
+    def _shard_payload(self, job, shard):
+        source_path = job.source_path
+        audio_urls = None
+        if job.audio_files:
+            audio_urls = {}
+            for i in range(len(shard.scenes)):
+                path = job.audio_files.get(str(shard.scene_start + i))
+                if path:
+                    audio_urls[str(i)] = self.blob_url(job.base_url, path)
+        return {
+            'job_id': job.job_id,
+            'shard': shard.index,
+            'attempt': shard.attempts,
+            'source_url': self.blob_url(job.base_url, source_path),
+            'scenes': shard.scenes,
+            'audio_urls': audio_urls,
+            'voice': job.voice,
+            'rate': job.rate,
+            'settings': job.settings,
+            'upload_url': self.blob_url(job.base_url, self._shard_path(job, shard, shard.attempts), method='PUT',
+                                        j=job.job_id, s=shard.index, a=shard.attempts)
+        }
+
+    def _shard_path(self, job, shard, attempt):
+        # One file per attempt, so a superseded worker can never overwrite the clip that is stitched
+        return os.path.join(job.job_dir, f"shard_{shard.index:04d}_{attempt}.mp4")
+
+    def _pick_worker(self, shard):
+        idle = [w for w in self.workers.values() if len(w.active) < w.slots]
+        # Prefer workers this shard has not failed on; fall back only if every registered worker has
+        preferred = [w for w in idle if w.name not in shard.failed_on]
+        if preferred:
+            return min(preferred, key=lambda w: len(w.active) / w.slots)
+        if idle and all(w.name in shard.failed_on for w in self.workers.values()):
+            return idle[0]
+        return None
+
+    def dispatch(self):
+        """Hand queued shards to idle workers"""
+        outgoing = []
+        with self.lock:
+            skipped = deque()
+            while self.pending:
+                shard = self.pending.popleft()
+                job = self.jobs.get(shard.job_id)
+                if not job or job.status in ('failed', 'completed') or shard.status != 'queued':
+                    continue
+                worker = self._pick_worker(shard)
+                if not worker:
+                    skipped.append(shard)
+                    if not any(len(w.active) < w.slots for w in self.workers.values()):
+                        break
+                    continue
+                shard.status = 'dispatched'
+                shard.attempts += 1
+                shard.worker_sid = worker.sid
+                shard.dispatched_at = time.time()
+                worker.active.add((job.job_id, shard.index))
+                job.status = 'rendering'
+                outgoing.append((worker.sid, self._shard_payload(job, shard)))
+            skipped.extend(self.pending)
+            self.pending = skipped
+        for sid, payload in outgoing:
+            self.emit('render_shard', payload, to=sid)
+        return len(outgoing)
+
+    def _fail_shard(self, job, shard, worker, error):
+        """Record a failed attempt and requeue or fail the job (caller holds the lock)"""
+        if worker:
+            worker.active.discard((job.job_id, shard.index))
+            shard.failed_on.add(worker.name)
+        shard.worker_sid = None
+        shard.error = error
+        if shard.attempts >= MAX_SHARD_ATTEMPTS:
+            shard.status = 'failed'
+            job.status = 'failed'
+            job.error = f"shard {shard.index} failed after {shard.attempts} attempts: {error}"
+            self._finish(job)
+            logging.error(f"Render job {job.job_id} failed: {job.error}")
+        else:
+            shard.status = 'queued'
+            self.pending.appendleft(shard)
+            logging.warning(f"Render shard {job.job_id}/{shard.index} requeued: {error}")
+
+    def handle_result(self, sid, data):
+        job_id = data.get('job_id')
+        finished_job = None
+        with self.lock:
+            job = self.jobs.get(job_id)
+            worker = self.workers.get(sid)
+            if not job:
+                # The job has expired: free the slot its shard held
+                if worker:
+                    worker.active = {active for active in worker.active if active[0] != job_id}
+                return False
+            try:
+                shard = job.shards[int(data.get('shard'))]
+            except (TypeError, ValueError, IndexError):
+                return False
+            if job.status == 'failed':
+                if worker:
+                    worker.active.discard((job.job_id, shard.index))
+                shard.worker_sid = None
+                return False
+            # Ignore late results from an attempt that was already reassigned
+            if shard.status != 'dispatched' or shard.worker_sid != sid or data.get('attempt') != shard.attempts:
+                return False
+
+            clip_path = self._shard_path(job, shard, shard.attempts)
+            if data.get('status') == 'completed' and os.path.exists(clip_path):
+                shard.status = 'completed'
+                shard.clip_path = clip_path
+                shard.duration = float(data.get('duration') or 0.0)
+                shard.srt = data.get('srt') or ''
+                shard.worker_sid = None
+                if worker:
+                    worker.active.discard((job.job_id, shard.index))
+                    worker.completed += 1
+                if all(s.status == 'completed' for s in job.shards):
+                    job.status = 'stitching'
+                    finished_job = job
+            else:
+                self._fail_shard(job, shard, worker, data.get('error') or 'clip upload missing')
+        if finished_job:
+            self.spawn(self._stitch, finished_job)
+        self.dispatch()
+        return True
+
+    def reap_stale(self, now=None):
+        """Requeue shards whose worker has gone quiet for longer than SHARD_TIMEOUT"""
+        now = now or time.time()
+        reaped = 0
+        with self.lock:
+            for job in self.jobs.values():
+                for shard in job.shards:
+                    if shard.status == 'dispatched' and now - shard.dispatched_at > SHARD_TIMEOUT:
+                        self._fail_shard(job, shard, self.workers.get(shard.worker_sid), 'timed out')
+                        reaped += 1
+        if reaped:
+            self.dispatch()
+        return reaped
+
+    def _finish(self, job):
+        """Stamp a job that completed or failed (caller holds the lock)"""
+        job.finished_at = datetime.utcnow().isoformat()
+        job.finished_time = time.time()
+
+    def expire_jobs(self, now=None):
+        """Drop jobs that finished more than JOB_RETENTION ago and delete their files"""
+        now = now or time.time()
+        with self.lock:
+            expired = [job for job in self.jobs.values()
+                       if job.finished_time is not None and now - job.finished_time > JOB_RETENTION]
+            for job in expired:
+                del self.jobs[job.job_id]
+            if expired:
+                expired_ids = {job.job_id for job in expired}
+                for worker in self.workers.values():
+                    worker.active = {active for active in worker.active if active[0] not in expired_ids}
+        for job in expired:
+            shutil.rmtree(job.job_dir, ignore_errors=True)
+            if job.input_dir:
+                shutil.rmtree(job.input_dir, ignore_errors=True)
+            logging.info(f"Render job {job.job_id} expired")
+        return len(expired)
+
+    def _stitch(self, job):
+        """Join the shard clips (stream copy: every shard uses the same encoder settings)"""
+        list_path = os.path.join(job.job_dir, 'shards.txt')
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for shard in job.shards:
+                f.write(f"file '{os.path.basename(shard.clip_path)}'\n")
+        cmd = [
+            'ffmpeg', '-y', '-f', 'concat', '-safe', '0', '-i', 'shards.txt',
+            '-c', 'copy', '-movflags', '+faststart', os.path.basename(job.output_path)
+        ]
+        result = subprocess.run(cmd, capture_output=True, text=True, cwd=job.job_dir,
+                                encoding='utf-8', errors='replace')
+        with self.lock:
+            if result.returncode != 0:
+                job.status = 'failed'
+                job.error = f"stitch failed: {result.stderr[-500:]}"
+            else:
+                with open(job.srt_path, 'w', encoding='utf-8') as f:
+                    f.write(merge_srt([(s.srt, s.duration) for s in job.shards]))
+                job.status = 'completed'
+            self._finish(job)
+        if job.status == 'completed':
+            # The clips (including uploads of superseded attempts) are in the output now
+            for name in os.listdir(job.job_dir):
+                if name.startswith('shard_') or name == 'shards.txt':
+                    try:
+                        os.remove(os.path.join(job.job_dir, name))
+                    except OSError:
+                        pass
+        logging.info(f"Render job {job.job_id} {job.status}")
+
+
+# Global instance
+render_farm = RenderFarm()
+
+
+def check_worker_token(expected, token):
+    """Error message for a worker registration, or None when the token is accepted
+
+    Fails closed: with no RENDER_FARM_TOKEN configured every worker is refused.
+    """
+    if not expected:
+        return 'Render farm token not configured'
+    if not isinstance(token, str) or not hmac.compare_digest(token.encode('utf-8'), expected.encode('utf-8')):
+        return 'Invalid token'
+    return None
+
+
+def init_render_farm(app, socketio):
+    """Wire the render farm into the Socket.IO server"""
+    render_farm.configure(
+        os.path.join(app.instance_path, 'render_farm'),
+        app.config['SECRET_KEY'],
+        emit=socketio.emit,
+        spawn=socketio.start_background_task
+    )
+    if not app.config.get('RENDER_FARM_TOKEN'):
+        logging.warning("RENDER_FARM_TOKEN is not set: render workers will be refused")
+
+    @socketio.on('render_worker_register')
+    def handle_render_worker_register(data):
+        data = data or {}
+        error = check_worker_token(app.config.get('RENDER_FARM_TOKEN'), data.get('token'))
+        if error:
+            socketio.emit('render_worker_registered', {'success': False, 'message': error},
+                          to=request.sid)
+            return
+        worker = render_farm.register_worker(request.sid, data.get('worker_name'), data.get('slots', 1))
+        socketio.emit('render_worker_registered', {
+            'success': True,
+            'worker_id': worker.worker_id,
+            'message': f'Render worker "{worker.name}" registered'
+        }, to=request.sid)
+
+    @socketio.on('render_shard_result')
+    def handle_render_shard_result(data):
+        render_farm.handle_result(request.sid, data or {})
+
+    # Worker disconnects are handled by websocket_handler's shared 'disconnect' handler
+
+    def reaper():
+        while True:
+            socketio.sleep(REAPER_INTERVAL)
+            try:
+                render_farm.reap_stale()
+                render_farm.expire_jobs()
+            except Exception as e:
+                logging.error(f"Render farm reaper error: {e}")
+
+    socketio.start_background_task(reaper)
+
+
+# --- HTTP API ---------------------------------------------------------------
+
+render_farm_bp = Blueprint('render_farm', __name__, url_prefix='/api/render-farm')
+
+
+def _require_admin():
+    return session.get('logged_in') and session.get('is_admin')
+
+
+def _allowed_source_path(path):
+    """The real path of `path` if it is a file inside the upload folder or RENDER_FARM_SOURCE_DIRS, else None"""
+    if not path:
+        return None
+    real_path = os.path.realpath(path)
+    roots = [os.path.join(current_app.instance_path, current_app.config['UPLOAD_FOLDER'])]
+    roots += current_app.config.get('RENDER_FARM_SOURCE_DIRS') or []
+    for root in roots:
+        root = os.path.realpath(root)
+        if real_path.startswith(root + os.sep) and os.path.isfile(real_path):
+            return real_path
+    return None
+
+
+@render_farm_bp.route('/blob/<token>', methods=['GET'])
+def download_blob(token):
+    path = render_farm.resolve_blob(token, 'GET')
+    if not path or not os.path.exists(path):
+        abort(404)
+    # conditional=True enables Range requests, so ffmpeg fetches only what it seeks into
+    return send_file(path, conditional=True)
+
+
+@render_farm_bp.route('/blob/<token>', methods=['PUT'])
+def upload_blob(token):
+    path = render_farm.resolve_blob(token, 'PUT')
+    if not path:
+        abort(403)
+    tmp_path = path + '.part'
+    with open(tmp_path, 'wb') as f:
+        shutil.copyfileobj(request.stream, f, 1024 * 1024)
+    os.replace(tmp_path, path)
+    return jsonify({'success': True})
+
+
+@render_farm_bp.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Submit a render job (admin only).
+
+    Form fields: script_json, source_video (file) or source_path (a file in the upload folder or
+    RENDER_FARM_SOURCE_DIRS),
+    optional audio_files (ordered per scene), settings_json, voice, rate, shard_scenes.
+    """
+    if not _require_admin():
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+
+    try:
+        script_data = json.loads(request.form.get('script_json', '[]'))
+        settings = json.loads(request.form.get('settings_json') or '{}')
+    except json.JSONDecodeError as e:
+        return jsonify({'success': False, 'error': f'Invalid JSON: {e}'}), 400
+    if not script_data:
+        return jsonify({'success': False, 'error': 'script_json is empty'}), 400
+
+    upload_dir = os.path.join(render_farm.root_dir, 'inputs', uuid.uuid4().hex)
+    os.makedirs(upload_dir, exist_ok=True)
+
+    source_file = request.files.get('source_video')
+    if source_file:
+        source_path = os.path.join(upload_dir, secure_filename(source_file.filename) or 'source.mp4')
+        source_file.save(source_path)
+    else:
+        # Only files from the upload folder or a configured source store, never arbitrary server paths
+        source_path = _allowed_source_path(request.form.get('source_path', ''))
+        if not source_path:
+            shutil.rmtree(upload_dir, ignore_errors=True)
+            return jsonify({'success': False, 'error': 'source_video or a source_path inside an allowed directory is required'}), 400
+        # Blob URLs only cover files under the farm root, so link the source in
+        linked = os.path.join(upload_dir, os.path.basename(source_path))
+        try:
+            os.link(source_path, linked)
+        except OSError:
+            shutil.copy(source_path, linked)
+        source_path = linked
+
+    audio_files = {}
+    for i, audio in enumerate(request.files.getlist('audio_files')):
+        audio_path = os.path.join(upload_dir, f"audio_{i}.mp3")
+        audio.save(audio_path)
+        audio_files[str(i)] = audio_path
+
+    job_id = render_farm.submit_job(
+        source_path, script_data, input_dir=upload_dir,
+        base_url=current_app.config.get('RENDER_FARM_PUBLIC_URL') or request.host_url,
+        audio_files=audio_files,
+        settings=settings,
+        voice=request.form.get('voice') or 'zh-CN-YunxiNeural',
+        rate=request.form.get('rate') or '+0%',
+        shard_scenes=request.form.get('shard_scenes', SHARD_SCENES, type=int)
+    )
+    return jsonify({'success': True, 'job_id': job_id})
+
+
+@render_farm_bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    if not _require_admin():
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    status = render_farm.get_job_status(job_id)
+    if not status:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, **status})
+
+
+@render_farm_bp.route('/jobs/<job_id>/output', methods=['GET'])
+def job_output(job_id):
+    if not _require_admin():
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    paths = render_farm.get_job_output(job_id)
+    if not paths:
+        return jsonify({'success': False, 'error': 'Output not ready'}), 404
+    output_path, srt_path = paths
+    if request.args.get('format') == 'srt':
+        return send_file(srt_path, as_attachment=True, download_name='rendered_video.srt')
+    return send_file(output_path, as_attachment=True, download_name='rendered_video.mp4', conditional=True)
+
+
+@render_farm_bp.route('/workers', methods=['GET'])
+def list_workers():
+    if not _require_admin():
+        return jsonify({'success': False, 'error': 'Unauthorized'}), 403
+    return jsonify({'success': True, 'workers': render_farm.list_workers()})
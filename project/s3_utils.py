@@ -1,24 +1,67 @@
 import boto3
+from botocore.config import Config
 from botocore.exceptions import NoCredentialsError, ClientError
 import json
 import os
+import threading
+import time
 from flask import current_app
 
-def get_s3_config():
-    """Loads S3 configuration from the JSON file."""
-    config_path = current_app.config.get('S3_CONFIG_FILE')
-    if not config_path or not os.path.exists(config_path):
-        return None
+# s3_config.json is parsed once and re-read when its mtime changes; the file is
+# stat'ed at most once per CONFIG_CHECK_INTERVAL seconds (the admin page drops
+# the cache right away when it saves, see invalidate_s3_config)
+CONFIG_CHECK_INTERVAL = 1.0
+
+# One client per process, shared by all requests (boto3 clients are thread-safe)
+MAX_POOL_CONNECTIONS = 32
+CLIENT_CONFIG = Config(
+    max_pool_connections=MAX_POOL_CONNECTIONS,
+    retries={'max_attempts': 5, 'mode': 'standard'},
+    connect_timeout=10,
+    read_timeout=60,
+)
+
+_lock = threading.Lock()
+_config_cache = {'path': None, 'stamp': None, 'checked': 0.0, 'config': None}
+_client_cache = {'key': None, 'client': None}
+
+def _read_s3_config(config_path):
     try:
         with open(config_path, 'r') as f:
             return json.load(f)
     except (IOError, json.JSONDecodeError):
         return None
 
+def get_s3_config():
+    """Loads S3 configuration from the JSON file (cached until the file changes)."""
+    config_path = current_app.config.get('S3_CONFIG_FILE')
+    if not config_path:
+        return None
+    with _lock:
+        now = time.monotonic()
+        if config_path != _config_cache['path'] or now - _config_cache['checked'] >= CONFIG_CHECK_INTERVAL:
+            try:
+                stat = os.stat(config_path)
+                stamp = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stamp = None
+            if config_path != _config_cache['path'] or stamp != _config_cache['stamp']:
+                _config_cache['config'] = _read_s3_config(config_path) if stamp else None
+                _config_cache['path'], _config_cache['stamp'] = config_path, stamp
+            _config_cache['checked'] = now
+        config = _config_cache['config']
+    # A copy, so callers cannot change the cached settings
+    return dict(config) if config is not None else None
+
+def invalidate_s3_config():
+    """Makes the next get_s3_config() re-read the file (after the admin saves it)."""
+    with _lock:
+        _config_cache['path'] = None
+
 def get_s3_client():
     """
-    Initializes and returns a boto3 S3 client using credentials
-    from the s3_config.json file.
+    Returns the shared boto3 S3 client for the credentials in s3_config.json;
+    a new one is created only when they change.
     """
     s3_config = get_s3_config()
     if not s3_config:
@@ -35,18 +78,25 @@ def get_s3_client():
     if endpoint_url and 'tebi.io' in endpoint_url and endpoint_url.startswith('https://'):
         endpoint_url = endpoint_url.replace('https://', 'http://')
 
-    try:
-        s3_client = boto3.client(
-            's3',
-            endpoint_url=endpoint_url,
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            region_name='auto' # Tebi uses 'auto' or 'global'
-        )
+    key = (endpoint_url, access_key, secret_key)
+    with _lock:
+        if _client_cache['key'] == key:
+            return _client_cache['client']
+        try:
+            # A session of its own: the default boto3 session is not thread-safe
+            s3_client = boto3.session.Session().client(
+                's3',
+                endpoint_url=endpoint_url,
+                aws_access_key_id=access_key,
+                aws_secret_access_key=secret_key,
+                region_name='auto', # Tebi uses 'auto' or 'global'
+                config=CLIENT_CONFIG
+            )
+        except Exception as e:
+            print(f"Failed to create S3 client: {e}")
+            return None
+        _client_cache['key'], _client_cache['client'] = key, s3_client
         return s3_client
-    except Exception as e:
-        print(f"Failed to create S3 client: {e}")
-        return None
 
 def generate_presigned_url(file_name, content_type=None, expiration=7200, acl=None):
     """
@@ -0,0 +1,83 @@
+"""
+Sensitive-word checks for chat messages and prompts
+
+db['sensitive_words'] is compiled into an Aho-Corasick automaton, so a text is
+checked against every word in one pass over it. The automaton is built once and
+rebuilt when the list changes: the admin pages rebuild it as they save, and a
+list changed by another process is noticed on the next check.
+"""
+import threading
+from collections import deque
+
+
+class WordMatcher:
+    """Aho-Corasick automaton over a fixed list of words"""
+
+    def __init__(self, words):
+        self.source = tuple(words)
+        self.words = tuple(dict.fromkeys(word for word in self.source if word))
+        self.goto = [{}]    # node -> {character: next node}
+        self.fail = [0]     # node -> longest proper suffix that is also a node
+        self.out = [()]     # node -> indexes of the words ending here
+        for index, word in enumerate(self.words):
+            node = 0
+            for ch in word:
+                child = self.goto[node].get(ch)
+                if child is None:
+                    child = self.goto[node][ch] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                node = child
+            self.out[node] = (index,)
+
+        # Breadth first, so a node's fail target is complete before its children need it
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(ch, 0)
+                self.out[child] += self.out[self.fail[child]]
+
+    def find_all(self, text):
+        """The words occurring in `text`, each once, in the order their first occurrence ends"""
+        goto, fail, out = self.goto, self.fail, self.out
+        found = {}
+        node = 0
+        for ch in text:
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for index in out[node]:
+                found.setdefault(index)
+        return [self.words[index] for index in found]
+
+
+class SensitiveWordFilter:
+    """The process's WordMatcher for db['sensitive_words']"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.matcher = WordMatcher(())
+
+    def rebuild(self, words):
+        """Compiles `words` (the admin pages call this after editing the list)"""
+        matcher = WordMatcher(words or ())
+        with self.lock:
+            self.matcher = matcher
+        return matcher
+
+    def find_all(self, db, text):
+        """The sensitive words occurring in `text`; empty when it is clean"""
+        words = db.get('sensitive_words') or ()
+        matcher = self.matcher
+        if matcher.source != tuple(words):
+            matcher = self.rebuild(words)
+        return matcher.find_all(text or '')
+
+# Global instance
+sensitive_word_filter = SensitiveWordFilter()
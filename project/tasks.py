@@ -3,7 +3,7 @@ import subprocess
 import shlex
 import time
 import select
-from .database import load_db, save_db
+from .database import load_db, db_transaction, find_username_by_api_key
 from .utils import predict_output_filename
 from project import create_app
 
@@ -17,17 +17,14 @@ def _reset_user_waiting_status(api_key):
     if not api_key:
         return
 
-    db = load_db()
-    found_user = None
-    for username, user_data in db.get('users', {}).items():
-        if user_data.get('api_key') == api_key:
-            found_user = username
-            break
-
-    if found_user and db.get('user_states', {}).get(found_user, {}).get('is_waiting_for_file'):
-        db['user_states'][found_user]['is_waiting_for_file'] = False
-        save_db(db)
-        print(f"Reset waiting status for user: {found_user}")
+    found_user = find_username_by_api_key(load_db(), api_key)
+    if not found_user:
+        return
+    # Runs in the task thread while requests may be updating user_states too
+    with db_transaction() as db:
+        if db.get('user_states', {}).get(found_user, {}).get('is_waiting_for_file'):
+            db['user_states'][found_user]['is_waiting_for_file'] = False
+            print(f"Reset waiting status for user: {found_user}")
 
 
 def execute_inference_task(task_id, username, command, temp_upload_paths, user_api_key, server_url, template, prompt, seed, presigned_url, s3_object_name, predicted_filename):
@@ -225,10 +222,10 @@ def cleanup_expired_files():
                 files_to_delete_ids.append(file_id)
 
         if files_to_delete_ids:
-            for file_id in files_to_delete_ids:
-                if file_id in db['uploaded_files']:
-                    del db['uploaded_files'][file_id]
-            save_db(db)
+            with db_transaction() as db:
+                for file_id in files_to_delete_ids:
+                    if file_id in db['uploaded_files']:
+                        del db['uploaded_files'][file_id]
             print(f"Cleaned up {len(files_to_delete_ids)} expired files.")
 
     except Exception as e:
@@ -1,29 +1,21 @@
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
+# Usage counters live in the usage_counters table, one row per (user, kind, Beijing day),
+# and every change is a single-row SQL update, so concurrent requests can neither lose
+# an increment nor both take the last unit. A new Beijing day simply starts a new row.
+
 def get_beijing_date_str():
     beijing_tz = ZoneInfo("Asia/Shanghai")
     return datetime.now(beijing_tz).strftime('%Y-%m-%d')
 
-def check_and_increment_usage(db, username, usage_type):
+def get_usage_limit(db, username, usage_type):
     """
-    Checks if a user can perform an action based on their role and daily limits.
-    Increments the usage count if allowed.
-
-    IMPORTANT: This function modifies the `db` object in place but does NOT save it.
-    The caller is responsible for calling `save_db(db)`.
-
-    Args:
-        db (dict): The database object.
-        username (str): The username.
-        usage_type (str): 'chat' or 'websocket'.
-
-    Returns:
-        tuple: (allowed (bool), error_message (str or None))
+    Returns the user's daily limit for `usage_type`, or None if the user does not exist.
     """
     user = db.get('users', {}).get(username)
     if not user:
-        return False, "User not found"
+        return None
 
     # Get limits settings
     # Default Limits
@@ -41,66 +33,89 @@ def check_and_increment_usage(db, username, usage_type):
     role_limits = usage_limits.get(role, default_limits.get(role))
 
     limit_key = f'daily_{usage_type}_limit'
-    limit = role_limits.get(limit_key, 0)
+    return role_limits.get(limit_key, 0)
 
-    # Check date and reset if needed
-    today = get_beijing_date_str()
-    daily_usage = user.get('daily_usage', {})
 
-    if daily_usage.get('date') != today:
-        daily_usage = {
-            'date': today,
-            'chat_count': 0,
-            'websocket_count': 0
-        }
+class UsageReservation:
+    """
+    One unit of a user's daily quota, held from reserve_usage() until commit() or release().
 
-    # Check current usage
-    count_key = f'{usage_type}_count'
-    current_count = daily_usage.get(count_key, 0)
+    Reserved units count against the limit straight away. The reservation stays on
+    the day it was made, even if it is settled after midnight (Beijing time).
+    Settling is idempotent: only the first commit() or release() has an effect.
+    """
 
-    if current_count >= limit:
-        return False, f"Usage limit reached for today. (Limit: {limit})"
+    def __init__(self, db_path, username, usage_type, day):
+        self.db_path = db_path
+        self.username = username
+        self.usage_type = usage_type
+        self.day = day
+        self.settled = False
 
-    # Increment
-    daily_usage[count_key] = current_count + 1
-    user['daily_usage'] = daily_usage
+    def commit(self):
+        """The action went through: the unit is used."""
+        self._settle(used=True)
 
-    # We update the user object in the DB structure
-    db['users'][username] = user
+    def release(self):
+        """The action failed: the unit goes back to the user."""
+        self._settle(used=False)
 
-    return True, None
+    def _settle(self, used):
+        from .database import settle_usage_unit
 
-def decrement_usage(username, usage_type):
+        if self.settled:
+            return
+        self.settled = True
+        settle_usage_unit(self.db_path, self.username, self.usage_type, self.day, used)
+
+
+def reserve_usage(db, username, usage_type, day=None):
     """
-    Decrements the usage count for a user.
-    Used for refunds when an API call fails or returns an error.
-    This function handles loading and saving the DB internally.
+    Atomically reserves one unit of today's `usage_type` quota ('chat' or 'websocket').
+
+    Returns:
+        tuple: (UsageReservation or None, error_message (str or None))
     """
-    from .database import load_db, save_db
+    from .database import get_db_path, reserve_usage_unit
 
-    db = load_db()
-    user = db.get('users', {}).get(username)
-    if not user:
-        return
+    limit = get_usage_limit(db, username, usage_type)
+    if limit is None:
+        return None, "User not found"
 
-    # Get usage stats
-    daily_usage = user.get('daily_usage', {})
+    day = day or get_beijing_date_str()
+    db_path = get_db_path()
+    if not reserve_usage_unit(db_path, username, usage_type, day, limit):
+        return None, f"Usage limit reached for today. (Limit: {limit})"
+    return UsageReservation(db_path, username, usage_type, day), None
 
-    # Check date matches today (if not, it was reset anyway, so nothing to decrement from *today's* count)
-    # However, if we just incremented it, the date should match.
-    # If the date doesn't match, it means the day rolled over since the request started (unlikely but possible).
-    # In that case, we shouldn't decrement yesterday's usage on today's counter which is 0.
+def check_and_increment_usage(db, username, usage_type):
+    """
+    Checks if a user can perform an action based on their role and daily limits.
+    Increments the usage count if allowed.
 
-    today = get_beijing_date_str()
-    if daily_usage.get('date') != today:
-        # Day rolled over, or usage wasn't initialized.
-        return
+    The count is stored immediately (reserve + commit); `db` is not modified.
+    Use reserve_usage() instead when the action can still fail afterwards.
 
-    count_key = f'{usage_type}_count'
-    current_count = daily_usage.get(count_key, 0)
+    Args:
+        db (dict): The database object.
+        username (str): The username.
+        usage_type (str): 'chat' or 'websocket'.
+
+    Returns:
+        tuple: (allowed (bool), error_message (str or None))
+    """
+    reservation, error_message = reserve_usage(db, username, usage_type)
+    if not reservation:
+        return False, error_message
+    reservation.commit()
+    return True, None
+
+def decrement_usage(username, usage_type):
+    """
+    Decrements today's usage count for a user.
+    Used for refunds when an API call fails or returns an error.
+    A single-row update; the count never goes below zero.
+    """
+    from .database import get_db_path, refund_usage_unit
 
-    if current_count > 0:
-        daily_usage[count_key] = current_count - 1
-        user['daily_usage'] = daily_usage
-        db['users'][username] = user
-        save_db(db)
+    refund_usage_unit(get_db_path(), username, usage_type, get_beijing_date_str())
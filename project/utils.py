@@ -1,17 +1,17 @@
 import re
 from flask import current_app
-from .database import load_db
+from .database import load_db, find_username_by_api_key
 
 def get_user_by_token(token):
     """
     Retrieves a user from the database based on their API token.
     """
     db = load_db()
-    for username, user_data in db.get('users', {}).items():
-        if user_data.get('api_key') == token:
-            # Return a copy of the user data along with the username
-            return {'username': username, **user_data}
-    return None
+    username = find_username_by_api_key(db, token)
+    if username is None:
+        return None
+    # Return a copy of the user data along with the username
+    return {'username': username, **db['users'][username]}
 
 def allowed_file(filename):
     """Allows any file to be uploaded."""
@@ -1,6 +1,6 @@
 import uuid
 from flask import Blueprint, request, jsonify, current_app
-from .database import load_db, save_db
+from .database import load_db, save_db, find_usernames_by_email, find_username_ignore_case
 import logging
 from datetime import datetime, timedelta
 
@@ -153,10 +153,9 @@ def kofi_webhook():
 
     # Strategy A: Email
     if payment_email:
-        for u_key, u_data in db['users'].items():
-            if u_data.get('email') == payment_email:
-                target_user_key = u_key
-                break
+        matches = find_usernames_by_email(db, payment_email)
+        if matches:
+            target_user_key = matches[0]
 
     # Strategy B: Username (Exact & Case-Insensitive)
     if not target_user_key:
@@ -164,17 +163,8 @@ def kofi_webhook():
         valid_candidates = [c.strip() for c in candidates if c]
 
         for candidate in valid_candidates:
-            # Exact match
-            if candidate in db['users']:
-                target_user_key = candidate
-                break
-
-            # Case-insensitive match
-            candidate_lower = candidate.lower()
-            for u_key in db['users'].keys():
-                if u_key.lower() == candidate_lower:
-                    target_user_key = u_key
-                    break
+            # Exact match, then case-insensitive match
+            target_user_key = find_username_ignore_case(db, candidate)
             if target_user_key:
                 break
 
@@ -8,7 +8,9 @@ import logging
 from flask import request
 from flask_socketio import SocketIO, emit, join_room, leave_room, disconnect
 from .websocket_manager import ws_manager
-from .database import load_db
+from .database import load_db, find_space_ids
+from .render_farm import render_farm, init_render_farm
+from .chat import init_chat
 
 socketio = None
 
@@ -41,22 +43,13 @@ def init_websocket(app):
                 })
                 return
             
-            # Find space by name in database
+            # Find space by name in database (indexed, no scan over the catalogue)
             db = load_db()
-            space_id = None
-            space_count = 0
-            
-            # Debug logging with print for visibility
-            all_spaces = db.get('spaces', {})
-            print(f"[WS] Total spaces in DB: {len(all_spaces)}")
-            for sid, space in all_spaces.items():
-                print(f"[WS]   - name='{space.get('name')}' type='{space.get('card_type')}'")
-            
-            for sid, space in db.get('spaces', {}).items():
-                if space.get('name') == space_name and space.get('card_type') == 'websockets':
-                    space_id = sid
-                    space_count += 1
-                    print(f"[WS] MATCH FOUND: space_id={sid}")
+            matches = find_space_ids(db, name=space_name, card_type='websockets')
+            space_id = matches[0] if matches else None
+            space_count = len(matches)
+            if space_id:
+                print(f"[WS] MATCH FOUND: space_id={space_id}")
         except Exception as e:
             print(f"[WS] ERROR in handle_register: {e}")
             import traceback
@@ -115,6 +108,8 @@ def init_websocket(app):
     def handle_disconnect():
         """Handle disconnection of remote app"""
         sid = request.sid
+        # Render workers share this Socket.IO server; requeue their shards
+        render_farm.unregister_worker(sid)
         if sid in app.ws_connections:
             space_id = app.ws_connections[sid]
             ws_manager.unregister_connection(space_id)
@@ -122,6 +117,9 @@ def init_websocket(app):
             del app.ws_connections[sid]
             logging.info(f"Remote app disconnected from space: {space_id}")
 
+    init_render_farm(app, socketio)
+    init_chat(app, socketio)
+
     return socketio
 
 
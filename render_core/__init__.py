@@ -0,0 +1,41 @@
+"""
+NarratoAI 渲染核心库
+
+render_engine.py (网页/API)、narrato.py (命令行)、render_worker.py (渲染农场) 与
+bench_render.py 共用同一套实现，性能优化只需改这里。
+
+稳定 API:
+    plan(video_path, script_data, audio_files)          -> 渲染计划 (解析后的场景与子片段)
+    render(video_path, script_data, audio_files, ...)   -> 主输出视频路径 (字幕为 output_srt_path())
+    probe(path)                                         -> {'duration', 'has_audio'}
+    tts(script_data, voice, rate, output_dir)           -> {场景索引: 音频路径}
+
+调优参数 (并行数、编码 preset、缓存目录、临时文件策略) 集中在 render_core.config，
+可用 RENDER_* 环境变量或 config.configure() 设置。
+"""
+
+from . import config
+from .cache import (ENGINE_VERSION, RenderCache, cache_render_outputs, get_source_path, normalize_script,
+                    render_cache, render_fingerprint, sha256_file, source_fingerprint)
+from .config import configure
+from .ffmpeg import get_duration, has_audio_stream, probe, run_ffmpeg
+from .filters import build_cut_cmd, get_atempo_filter, get_rendition_path, get_scale_filter
+from .live import LIVE_PLAYLIST, append_live_segment, reset_live_playlist, write_live_playlist
+from .pipeline import output_srt_path, parse_time, plan, process_render, render
+from .profiler import RenderProfiler
+from .subtitles import build_subtitle_cues, fmt_srt_time, load_word_timings
+from .tts import create_communicate, generate_all_audio, generate_tts_audio, tts
+
+__all__ = [
+    "config", "configure",
+    "plan", "render", "probe", "tts",
+    "process_render", "parse_time", "output_srt_path",
+    "get_duration", "has_audio_stream", "run_ffmpeg",
+    "build_cut_cmd", "get_atempo_filter", "get_rendition_path", "get_scale_filter",
+    "LIVE_PLAYLIST", "append_live_segment", "reset_live_playlist", "write_live_playlist",
+    "RenderProfiler",
+    "build_subtitle_cues", "fmt_srt_time", "load_word_timings",
+    "create_communicate", "generate_all_audio", "generate_tts_audio",
+    "ENGINE_VERSION", "RenderCache", "render_cache", "render_fingerprint", "normalize_script",
+    "source_fingerprint", "cache_render_outputs", "sha256_file", "get_source_path",
+]
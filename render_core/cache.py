@@ -0,0 +1,217 @@
+"""
+成品缓存与内容寻址存储
+
+缓存键 = 源视频 SHA-256 + 规范化脚本 + 配音 (voice/rate 或音频内容哈希) + 渲染参数 + 编码参数 + 引擎版本。
+渲染逻辑有输出变化的修改时须递增 ENGINE_VERSION，旧缓存随之失效。
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+from . import config
+from .filters import get_rendition_path
+
+
+ENGINE_VERSION = "render_core/1"
+
+
+_HEX_ID = re.compile(r"^[0-9a-f]{16,64}$")
+
+
+def sha256_file(file_path, block_size=4 * 1024 * 1024):
+    """流式计算文件 SHA-256"""
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def get_source_path(source_id):
+    """source_id -> 仓库中的文件路径 (不存在返回 None)"""
+    if not source_id or not _HEX_ID.match(source_id):
+        return None
+    path = os.path.join(config.SOURCE_DIR, f"{source_id}.src")
+    return path if os.path.exists(path) else None
+
+
+def normalize_script(script_data):
+    """脚本规范化: 键排序、字符串去首尾空白，使等价脚本得到相同指纹"""
+    def norm(value):
+        if isinstance(value, dict):
+            return {k: norm(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [norm(v) for v in value]
+        if isinstance(value, str):
+            return value.strip()
+        return value
+    return json.dumps(norm(script_data), ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def render_fingerprint(source_hash, script_data, voice=None, rate=None, audio_hashes=None, **settings):
+    """
+    计算渲染指纹
+    
+    CLI 在合成语音前按 voice/rate 计算 (命中时连 TTS 也省掉)；
+    网页端语音由浏览器生成后上传，用 audio_hashes (各场景音频的 SHA-256) 代替 voice/rate。
+    settings: resolution, cut_method, renditions, burn_subtitles, word_timings 等影响输出的参数
+    编码参数 (preset/crf) 取自 config，CLI 与网页端都无需另行传入
+    """
+    payload = {
+        "engine": ENGINE_VERSION,
+        "source": source_hash,
+        "script": normalize_script(script_data),
+        "voice": voice,
+        "rate": rate,
+        "audio": audio_hashes,
+        "encode": config.encode_args(),
+        "settings": {k: v for k, v in settings.items() if v is not None}
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """
+    成品缓存: 每个指纹一个目录，内含输出文件与 meta.json
+    
+    命中时刷新 last_used；写入后按保留期清理过期条目，再按最近最少使用淘汰到容量上限以内。
+    """
+    def __init__(self, cache_dir=None, max_bytes=None, ttl=None):
+        # 未指定的参数随 config 变化 (configure() 后立即生效)
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+    
+    @property
+    def cache_dir(self):
+        return self._cache_dir or config.CACHE_DIR
+    
+    @property
+    def max_bytes(self):
+        return config.CACHE_MAX_BYTES if self._max_bytes is None else self._max_bytes
+    
+    @property
+    def ttl(self):
+        return config.CACHE_TTL if self._ttl is None else self._ttl
+    
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+    
+    def _read_meta(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, "meta.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _write_meta(self, entry_dir, meta):
+        tmp_path = os.path.join(entry_dir, "meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(entry_dir, "meta.json"))
+    
+    def get(self, key):
+        """命中返回 {名称: 路径}，未命中或已过期返回 None"""
+        entry_dir = self._entry_dir(key)
+        meta = self._read_meta(entry_dir)
+        if not meta:
+            return None
+        if time.time() - meta["last_used"] > self.ttl:
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+        files = {name: os.path.join(entry_dir, fname) for name, fname in meta["files"].items()}
+        if not all(os.path.exists(p) for p in files.values()):
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            return None
+        meta["last_used"] = time.time()
+        meta["hits"] = meta.get("hits", 0) + 1
+        self._write_meta(entry_dir, meta)
+        return files
+    
+    def put(self, key, files):
+        """写入成品 {名称: 源路径}，先写临时目录再整体改名，中途失败不留半成品"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(prefix=f".{key[:12]}_", dir=self.cache_dir)
+        try:
+            names = {}
+            size = 0
+            for name, src in files.items():
+                fname = name + os.path.splitext(src)[1]
+                shutil.copy(src, os.path.join(tmp_dir, fname))
+                names[name] = fname
+                size += os.path.getsize(src)
+            now = time.time()
+            self._write_meta(tmp_dir, {"files": names, "size": size, "created": now, "last_used": now, "hits": 0})
+            entry_dir = self._entry_dir(key)
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        self.evict()
+        return self.get(key)
+    
+    def evict(self):
+        """删除过期条目，并按 last_used 从旧到新淘汰直到总大小不超过上限，返回删除数"""
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        now = time.time()
+        entries = []
+        removed = 0
+        for name in os.listdir(self.cache_dir):
+            entry_dir = self._entry_dir(name)
+            if name.startswith(".") or not os.path.isdir(entry_dir):
+                continue
+            meta = self._read_meta(entry_dir)
+            if not meta or now - meta["last_used"] > self.ttl:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                removed += 1
+                continue
+            entries.append((meta["last_used"], meta["size"], entry_dir))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_dir in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+render_cache = RenderCache()
+
+
+def source_fingerprint(path):
+    """
+    源视频 SHA-256；按 (路径, 大小, 修改时间) 记忆到缓存目录，
+    同一文件重复提交时不必重新读完整部影片
+    """
+    st = os.stat(path)
+    memo_key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    memo_path = os.path.join(config.CACHE_DIR, "sources.json")
+    try:
+        with open(memo_path, "r", encoding="utf-8") as f:
+            memo = json.load(f)
+    except (OSError, ValueError):
+        memo = {}
+    if memo_key not in memo:
+        memo[memo_key] = sha256_file(path)
+        os.makedirs(config.CACHE_DIR, exist_ok=True)
+        tmp_path = memo_path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(memo, f)
+        os.replace(tmp_path, memo_path)
+    return memo[memo_key]
+
+
+def cache_render_outputs(key, renditions):
+    """把本次渲染的成品 (各档视频 video_<档位> + 字幕 srt) 存入缓存"""
+    base_path = os.path.join(config.TEMP_DIR, "final_output.mp4")
+    files = {"srt": os.path.splitext(base_path)[0] + ".srt"}
+    for r in renditions:
+        files[f"video_{r}"] = get_rendition_path(base_path, r, renditions)
+    return render_cache.put(key, files)
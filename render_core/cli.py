@@ -0,0 +1,233 @@
+"""
+渲染 CLI (python -m render_core)，narrato.py 与 render_engine.py --render 均调用这里
+
+用法:
+  python -m render_core project.json                       # 自动查找同名视频
+  python -m render_core 1.json 1.mkv -r 720p --cut         # narrato.py 的参数形式
+  python -m render_core project.json --jobs 4 --profile    # 4 个场景并行，导出 render_trace.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+
+from . import config
+from .cache import (cache_render_outputs, get_source_path, render_cache, render_fingerprint,
+                    source_fingerprint)
+from .ffmpeg import get_duration
+from .filters import get_rendition_path
+from .pipeline import OUTPUT_FILENAME, output_srt_path, render
+from .profiler import RenderProfiler
+from .tts import tts
+
+VIDEO_EXTENSIONS = [".mp4", ".mkv", ".mov", ".avi"]
+
+
+def load_script(project):
+    """
+    从工程数据中提取场景列表
+
+    支持 script_content / script / scenes 字段，或直接为 (可嵌套的) 场景数组。
+    """
+    def flatten(items):
+        result = []
+        for item in items:
+            if isinstance(item, list):
+                result.extend(flatten(item))
+            elif isinstance(item, dict):
+                result.append(item)
+        return result
+
+    if isinstance(project, list):
+        return flatten(project)
+    script_data = []
+    if "script_content" in project:
+        for part in project["script_content"]:
+            if isinstance(part, dict) and "scenes" in part:
+                script_data.extend(part["scenes"])
+            elif isinstance(part, dict):
+                script_data.append(part)
+    elif "script" in project:
+        script_data = project["script"]
+    elif "scenes" in project:
+        script_data = project["scenes"]
+    return script_data
+
+
+def find_video(project_path, project):
+    """工程中的 source_id / video_path，否则查找同名视频或目录下第一个 mp4"""
+    if project.get("source_id") and get_source_path(project["source_id"]):
+        print(f"[仓库] 使用已存储的源视频: {project['source_id'][:12]}...")
+        return get_source_path(project["source_id"])
+    video_path = project.get("video_path", "")
+    if video_path and os.path.exists(video_path):
+        return video_path
+    base_name = os.path.splitext(project_path)[0]
+    for ext in VIDEO_EXTENSIONS:
+        if os.path.exists(base_name + ext):
+            print(f"[自动] 找到同名视频: {base_name + ext}")
+            return base_name + ext
+    project_dir = os.path.dirname(project_path) or '.'
+    mp4_files = sorted(f for f in os.listdir(project_dir) if f.endswith('.mp4'))
+    if mp4_files:
+        video_path = os.path.join(project_dir, mp4_files[0])
+        print(f"[自动] 使用目录下第一个视频: {video_path}")
+    return video_path
+
+
+def render_from_project(project_path, output_path=None, profile_path=None, use_cache=True,
+                        video_path=None, resolution=None, cut_method=None):
+    """
+    从工程文件渲染视频: 合成语音 -> 渲染 -> 复制成品 (视频 + 同名 .srt)
+
+    video_path / resolution / cut_method 为命令行覆盖值，未提供时取工程文件中的设置。
+    profile_path: 写出 Chrome trace 与耗时汇总；use_cache: 相同输入复用缓存成品。
+    """
+    print(f"\n{'='*50}")
+    print("智能配音剪辑器 - CLI 渲染模式")
+    print(f"{'='*50}\n")
+
+    print(f"[加载] 读取工程文件: {project_path}")
+    with open(project_path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    project = raw if isinstance(raw, dict) else {}
+
+    video_path = video_path or find_video(project_path, project)
+    voice = project.get("voice") or config.DEFAULT_VOICE
+    rate = project.get("rate", "+0%")
+    resolution = resolution or project.get("resolution", "native")
+    cut_method = cut_method or project.get("cut_method", "pad")
+    # 多档输出，如 ["360p", "720p", "1080p"]，一次渲染全部生成
+    renditions = project.get("renditions") or None
+    burn_subtitles = bool(project.get("burn_subtitles", False))
+
+    script_data = load_script(raw)
+    if not script_data:
+        print("[错误] 无法找到脚本数据")
+        sys.exit(1)
+
+    if not video_path or not os.path.exists(video_path):
+        print(f"[错误] 视频文件不存在: {video_path}")
+        sys.exit(1)
+
+    print(f"[视频] {video_path}")
+    print(f"[语音] {voice} @ {rate}")
+    print(f"[片段] {len(script_data)} 个场景（超时片段将自动适应）")
+    print(f"[并行] {config.WORKERS} 个场景 | preset={config.PRESET} crf={config.CRF}")
+
+    video_duration = get_duration(video_path)
+    print(f"[视频时长] {video_duration:.1f} 秒 ({video_duration/60:.1f} 分钟)\n")
+
+    if output_path is None:
+        output_path = os.path.splitext(os.path.basename(video_path))[0] + "_rendered.mp4"
+    output_renditions = renditions or [resolution]
+
+    def copy_outputs(videos, srt_path):
+        if len(output_renditions) > 1:
+            for r in output_renditions:
+                out = get_rendition_path(output_path, r, output_renditions)
+                shutil.copy(videos[r], out)
+                print(f"\n[完成] 输出文件 ({r}): {os.path.abspath(out)}")
+        else:
+            shutil.copy(videos[output_renditions[0]], output_path)
+            print(f"\n[完成] 输出文件: {os.path.abspath(output_path)}")
+        out_srt = os.path.splitext(output_path)[0] + ".srt"
+        shutil.copy(srt_path, out_srt)
+        print(f"[完成] 字幕: {os.path.abspath(out_srt)}")
+
+    # 成品缓存: 合成语音之前查询，命中时 TTS 与渲染都跳过
+    cache_key = None
+    if use_cache:
+        # source_id 即仓库文件的 SHA-256，仅当视频确实来自仓库时可直接使用 (命令行覆盖或仓库缺失时重新计算)
+        source_id = project.get("source_id")
+        from_store = bool(source_id) and video_path == get_source_path(source_id)
+        cache_key = render_fingerprint(
+            source_id if from_store else source_fingerprint(video_path), script_data, voice=voice, rate=rate,
+            resolution=resolution, cut_method=cut_method, renditions=renditions, burn_subtitles=burn_subtitles
+        )
+        cached = render_cache.get(cache_key)
+        if cached:
+            print(f"[缓存] 命中 {cache_key[:12]}，跳过语音合成与渲染")
+            copy_outputs({r: cached[f"video_{r}"] for r in output_renditions}, cached["srt"])
+            return
+
+    config.prepare_temp_dir()
+    profiler = RenderProfiler(enabled=bool(profile_path))
+
+    print("[阶段1] 生成语音...")
+    profiler.begin("tts", scenes=len(script_data))
+    audio_paths = tts(script_data, voice, rate, config.TEMP_DIR)
+    profiler.end()
+
+    print("\n[阶段2] FFmpeg 渲染...")
+    print(f"[分辨率] {', '.join(renditions) if renditions else resolution}")
+    render(video_path, script_data, audio_paths, verbose=True, resolution=resolution, cut_method=cut_method,
+           renditions=renditions, burn_subtitles=burn_subtitles, profiler=profiler)
+
+    base_path = os.path.join(config.TEMP_DIR, OUTPUT_FILENAME)
+    copy_outputs({r: get_rendition_path(base_path, r, output_renditions) for r in output_renditions},
+                 output_srt_path())
+    if cache_key:
+        cache_render_outputs(cache_key, output_renditions)
+        print(f"[缓存] 成品已缓存: {cache_key[:12]}")
+
+    if profile_path:
+        print("\n[性能剖析]")
+        print(profiler.export(profile_path))
+        print(f"[导出] Chrome trace: {os.path.abspath(profile_path)}")
+
+    if config.cleanup_temp_dir():
+        print("[清理] 临时文件已删除\n")
+
+
+def add_tuning_arguments(parser):
+    """引擎调优参数 (render_engine.py --render 复用)"""
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help=f"并行渲染的场景数 (默认 {config.WORKERS}，可用 RENDER_WORKERS 设置)")
+    parser.add_argument("--preset", default=None, help=f"x264 preset (默认 {config.PRESET})")
+    parser.add_argument("--profile", metavar="TRACE", nargs="?", const="render_trace.json",
+                        help="记录各阶段耗时，导出 Chrome trace JSON 与汇总表")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="忽略成品缓存，强制重新渲染 (缓存目录/容量/保留期见 RENDER_CACHE_* 环境变量)")
+    parser.add_argument("--keep-temp", action="store_true", help="保留中间文件 (TEMP_STRATEGY=keep)")
+
+
+def apply_tuning_arguments(args):
+    overrides = {}
+    if args.jobs:
+        overrides["WORKERS"] = max(1, args.jobs)
+    if args.preset:
+        overrides["PRESET"] = args.preset
+    if args.keep_temp:
+        overrides["TEMP_STRATEGY"] = "keep"
+    config.configure(**overrides)
+
+
+def main(argv=None, prog=None, default_project=None, output_suffix="_rendered"):
+    """
+    output_suffix: 未指定 -o 时的输出文件名后缀；narrato.py 传 "_output" 并以工程文件名命名
+    """
+    parser = argparse.ArgumentParser(prog=prog, description="NarratoAI 渲染 CLI")
+    parser.add_argument("project", nargs="?" if default_project else None, default=default_project,
+                        help="工程/脚本 JSON 文件")
+    parser.add_argument("video", nargs="?", default=None, help="源视频 (默认自动查找同名视频)")
+    parser.add_argument("--output", "-o", metavar="FILE", help="输出文件路径")
+    parser.add_argument("--resolution", "-r", default=None,
+                        help="native, 360p, 480p, 720p, 1080p 或 WxH (默认取工程设置或 native)")
+    parser.add_argument("--cut", action="store_true", help="视频比配音长时截断视频 (默认补静音保留画面)")
+    add_tuning_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.project):
+        print(f"Error: JSON file '{args.project}' not found.")
+        sys.exit(1)
+    apply_tuning_arguments(args)
+
+    output_path = args.output
+    if output_path is None and output_suffix != "_rendered":
+        output_path = os.path.splitext(args.project)[0] + output_suffix + ".mp4"
+    render_from_project(args.project, output_path, args.profile, use_cache=not args.no_cache,
+                        video_path=args.video, resolution=args.resolution,
+                        cut_method="cut" if args.cut else None)
@@ -0,0 +1,76 @@
+"""
+渲染引擎调优参数 (唯一入口)
+
+所有参数都可用环境变量设置初值，运行时用 configure() 覆盖 (CLI 的 --jobs/--preset 即如此)。
+渲染代码一律通过 config.XXX 读取，不要 from config import，否则覆盖不生效。
+"""
+
+import os
+import shutil
+
+# 并行渲染的场景数 (每个场景的切割/混音是独立的 FFmpeg 进程)
+WORKERS = int(os.environ.get("RENDER_WORKERS", "1"))
+
+# libx264 编码参数 (片段切割、子片段拼接与最终合并共用)
+PRESET = os.environ.get("RENDER_PRESET", "fast")
+CRF = int(os.environ.get("RENDER_CRF", "23"))
+
+# 中间文件目录与清理策略:
+#   clean: 启动/CLI 渲染前清空，CLI 渲染完成后删除
+#   keep:  保留中间文件，便于排查问题
+TEMP_DIR = os.environ.get("RENDER_TEMP_DIR", "temp_render")
+TEMP_STRATEGY = os.environ.get("RENDER_TEMP_STRATEGY", "clean")
+LIVE_DIR = os.path.join(TEMP_DIR, "live")
+
+# 源视频仓库 (按 SHA-256 去重) 与成品缓存
+SOURCE_DIR = os.environ.get("RENDER_SOURCE_DIR", "source_store")
+CACHE_DIR = os.environ.get("RENDER_CACHE_DIR", "render_cache")
+CACHE_MAX_BYTES = int(float(os.environ.get("RENDER_CACHE_MAX_GB", "20")) * 1024 ** 3)
+CACHE_TTL = float(os.environ.get("RENDER_CACHE_DAYS", "7")) * 86400
+
+# 分块上传: 单个源视频的大小上限；闲置超过保留期的未完成上传 (.part 与元数据) 被清理
+UPLOAD_MAX_BYTES = int(float(os.environ.get("RENDER_UPLOAD_MAX_GB", "10")) * 1024 ** 3)
+UPLOAD_TTL = float(os.environ.get("RENDER_UPLOAD_HOURS", "24")) * 3600
+
+# 语音合成
+DEFAULT_VOICE = os.environ.get("RENDER_VOICE", "zh-CN-YunxiNeural")
+TTS_CONCURRENCY = int(os.environ.get("RENDER_TTS_CONCURRENCY", "5"))
+
+TEMP_STRATEGIES = ("clean", "keep")
+
+
+def configure(**overrides):
+    """
+    运行时覆盖参数，如 configure(WORKERS=4, PRESET="veryfast")
+
+    修改 TEMP_DIR 时 LIVE_DIR 随之更新 (除非同时指定)。
+    """
+    for name, value in overrides.items():
+        if name not in globals() or not name.isupper():
+            raise ValueError(f"未知的渲染参数: {name}")
+        if name == "TEMP_STRATEGY" and value not in TEMP_STRATEGIES:
+            raise ValueError(f"TEMP_STRATEGY 只能是 {', '.join(TEMP_STRATEGIES)}")
+        globals()[name] = value
+    if "TEMP_DIR" in overrides and "LIVE_DIR" not in overrides:
+        globals()["LIVE_DIR"] = os.path.join(TEMP_DIR, "live")
+
+
+def encode_args():
+    """视频编码参数"""
+    return ["-c:v", "libx264", "-preset", PRESET, "-crf", str(CRF)]
+
+
+def prepare_temp_dir():
+    """按清理策略准备中间文件目录"""
+    if TEMP_STRATEGY == "clean" and os.path.exists(TEMP_DIR):
+        shutil.rmtree(TEMP_DIR)
+    os.makedirs(TEMP_DIR, exist_ok=True)
+    os.makedirs(LIVE_DIR, exist_ok=True)
+
+
+def cleanup_temp_dir():
+    """渲染结束后按清理策略删除中间文件，返回是否已删除"""
+    if TEMP_STRATEGY != "clean":
+        return False
+    shutil.rmtree(TEMP_DIR, ignore_errors=True)
+    return True
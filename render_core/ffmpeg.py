@@ -0,0 +1,68 @@
+"""
+FFmpeg / FFprobe 调用
+
+所有子进程都经由当前剖析器执行 (未开启剖析时为普通 subprocess.run)。
+"""
+
+import os
+import subprocess
+
+from . import profiler
+
+
+def _subprocess_kwargs():
+    """Windows 下避免为每个 FFmpeg 进程弹出控制台窗口"""
+    if os.name != "nt":
+        return {}
+    startupinfo = subprocess.STARTUPINFO()
+    startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+    return {"startupinfo": startupinfo}
+
+
+def get_duration(file_path):
+    """获取媒体文件时长(秒)"""
+    cmd = [
+        "ffprobe", "-v", "error", "-show_entries", "format=duration",
+        "-of", "default=noprint_wrappers=1:nokey=1", file_path
+    ]
+    try:
+        result = profiler.current().run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                        **_subprocess_kwargs())
+        return float(result.stdout.strip())
+    except:
+        return 0.0
+
+
+def has_audio_stream(file_path):
+    """检查文件是否包含音频流"""
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "a",
+        "-show_entries", "stream=index", "-of", "csv=p=0", file_path
+    ]
+    try:
+        result = profiler.current().run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                        **_subprocess_kwargs())
+        # 如果有音频流，输出不为空
+        return bool(result.stdout.strip())
+    except:
+        return False
+
+
+def probe(file_path):
+    """媒体信息: {'duration': 秒, 'has_audio': bool}"""
+    return {"duration": get_duration(file_path), "has_audio": has_audio_stream(file_path)}
+
+
+def run_ffmpeg(cmd, verbose=False, cwd=None):
+    """Run FFmpeg command with optional stderr output for debugging"""
+    # Force utf-8 and relax decoding to prevent crash on Windows (GBK vs UTF-8 issues)
+    result = profiler.current().run(cmd, capture_output=True, text=True, cwd=cwd, encoding='utf-8',
+                                    errors='replace', **_subprocess_kwargs())
+    if result.returncode != 0:
+        if verbose:
+            print(f"[FFmpeg 错误] 命令: {' '.join(cmd[:5])}...")
+            # Print last 800 chars of stderr
+            stderr_tail = result.stderr[-800:] if len(result.stderr) > 800 else result.stderr
+            print(stderr_tail)
+        raise subprocess.CalledProcessError(result.returncode, cmd)
+    return result
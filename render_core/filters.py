@@ -0,0 +1,92 @@
+"""
+FFmpeg 滤镜与切割命令构建: 分辨率缩放、变速、多档输出
+"""
+
+import os
+
+from . import config
+
+RESOLUTION_SCALES = {
+    "360p": "scale=640:360",
+    "480p": "scale=854:480",
+    "720p": "scale=1280:720",
+    "1080p": "scale=1920:1080",
+}
+
+
+def get_scale_filter(resolution):
+    """分辨率 -> scale 滤镜: 360p/480p/720p/1080p 或自定义 WxH；native 返回 None"""
+    if not resolution or resolution == "native":
+        return None
+    if resolution in RESOLUTION_SCALES:
+        return RESOLUTION_SCALES[resolution]
+    if "x" in resolution:
+        # 支持自定义 WxH 格式，如 "800x600"
+        return f"scale={resolution.replace('x', ':')}"
+    return None
+
+
+def get_atempo_filter(speed):
+    """atempo 单级仅支持 0.5~2.0，超出范围时串联多级"""
+    filters = []
+    s = speed
+    while s < 0.5:
+        filters.append("atempo=0.5")
+        s /= 0.5
+    while s > 2.0:
+        filters.append("atempo=2.0")
+        s /= 2.0
+    filters.append(f"atempo={s}")
+    return ",".join(filters)
+
+
+def get_rendition_path(path, rendition, renditions):
+    """多档输出时在文件名后追加分辨率后缀，单档保持原文件名"""
+    if len(renditions) <= 1:
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}_{rendition}{ext}"
+
+
+def build_cut_cmd(video_path, start, dur, out_paths, renditions, speed=1.0, keep_audio=True):
+    """
+    构建切割命令: 解码一次，按 renditions 输出多档分辨率
+    
+    单档时与普通 -vf 切割一致；多档时用 split 把同一解码结果分给各个缩放编码器，
+    避免每个分辨率重复解码源视频。
+    """
+    cmd = ["ffmpeg", "-y", "-ss", str(start), "-t", str(dur), "-i", video_path]
+    setpts = f"setpts={1/speed}*PTS" if speed != 1.0 else None
+    af_chain = get_atempo_filter(speed) if speed != 1.0 else None
+    encode_args = config.encode_args()
+    
+    if len(out_paths) == 1:
+        vf_filters = [f for f in (get_scale_filter(renditions[0]), setpts) if f]
+        if vf_filters:
+            cmd.extend(["-vf", ",".join(vf_filters)])
+        if keep_audio and af_chain:
+            cmd.extend(["-af", af_chain])
+        cmd.extend(encode_args)
+        cmd.extend(["-c:a", "aac"] if keep_audio else ["-an"])
+        cmd.append(out_paths[0])
+        return cmd
+    
+    head = "[0:v]" + (setpts + "," if setpts else "") + f"split={len(out_paths)}"
+    head += "".join(f"[s{i}]" for i in range(len(out_paths)))
+    branches = [
+        f"[s{i}]{get_scale_filter(r) or 'null'}[v{i}]"
+        for i, r in enumerate(renditions)
+    ]
+    cmd.extend(["-filter_complex", ";".join([head] + branches)])
+    for i, out in enumerate(out_paths):
+        cmd.extend(["-map", f"[v{i}]"])
+        cmd.extend(encode_args)
+        if keep_audio:
+            cmd.extend(["-map", "0:a?"])
+            if af_chain:
+                cmd.extend(["-af", af_chain])
+            cmd.extend(["-c:a", "aac"])
+        else:
+            cmd.append("-an")
+        cmd.append(out)
+    return cmd
@@ -0,0 +1,67 @@
+"""
+渐进式 HLS 输出: 每完成一个片段即追加分片到 config.LIVE_DIR 下的直播列表
+"""
+
+import math
+import os
+
+from . import config
+from .ffmpeg import get_duration, run_ffmpeg
+
+LIVE_PLAYLIST = "index.m3u8"
+
+
+def reset_live_playlist():
+    """清空上一次渲染的直播分片"""
+    os.makedirs(config.LIVE_DIR, exist_ok=True)
+    for name in os.listdir(config.LIVE_DIR):
+        os.remove(os.path.join(config.LIVE_DIR, name))
+
+
+def write_live_playlist(segments, finished=False):
+    """
+    原子地重写 EVENT 类型的 m3u8 列表
+    
+    segments: [(文件名, 时长秒)]，finished 时追加 ENDLIST 使播放器停止轮询
+    """
+    target = max([math.ceil(d) for _, d in segments] or [1])
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        "#EXT-X-PLAYLIST-TYPE:EVENT",
+        f"#EXT-X-TARGETDURATION:{target}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+    ]
+    for name, dur in segments:
+        lines.append(f"#EXTINF:{dur:.3f},")
+        lines.append(name)
+    if finished:
+        lines.append("#EXT-X-ENDLIST")
+    tmp_path = os.path.join(config.LIVE_DIR, LIVE_PLAYLIST + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, os.path.join(config.LIVE_DIR, LIVE_PLAYLIST))
+
+
+def append_live_segment(clip_path, idx, time_offset, segments, verbose=False):
+    """
+    把完成的片段无损转封装为 MPEG-TS 分片并发布到列表
+    
+    使用 -output_ts_offset 让各分片时间戳首尾相接，播放器无需 DISCONTINUITY。
+    """
+    seg_name = f"seg_{idx:05d}.ts"
+    cmd = [
+        "ffmpeg", "-y", "-i", clip_path,
+        "-c", "copy", "-bsf:v", "h264_mp4toannexb",
+        "-output_ts_offset", f"{time_offset:.3f}",
+        "-f", "mpegts",
+        os.path.join(config.LIVE_DIR, seg_name)
+    ]
+    try:
+        run_ffmpeg(cmd, verbose=verbose)
+    except Exception as e:
+        if verbose:
+            print(f"[警告] 片段 {idx+1} 直播分片生成失败: {e}")
+        return
+    segments.append((seg_name, get_duration(clip_path)))
+    write_live_playlist(segments)
@@ -0,0 +1,461 @@
+"""
+渲染流水线: plan() 解析脚本，render() 逐场景切割/混音后合并输出
+
+场景之间互不依赖，config.WORKERS > 1 时并行渲染；字幕计时与直播分片按场景顺序在主线程汇总。
+"""
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from . import config
+from .ffmpeg import get_duration, has_audio_stream, run_ffmpeg
+from .filters import build_cut_cmd, get_rendition_path
+from .live import append_live_segment, reset_live_playlist, write_live_playlist
+from .profiler import current as current_profiler, use as use_profiler
+from .subtitles import build_subtitle_cues, fmt_srt_time, load_word_timings
+
+OUTPUT_FILENAME = "final_output.mp4"
+
+
+def output_srt_path():
+    """render() 导出的字幕路径: 多档输出时各档共用这一份，不与各档视频同名"""
+    return os.path.splitext(os.path.join(config.TEMP_DIR, OUTPUT_FILENAME))[0] + ".srt"
+
+
+def parse_time(t_str):
+    """SS / MM:SS / HH:MM:SS -> 秒"""
+    t_str = str(t_str)
+    p = list(map(float, t_str.split(':')))
+    if len(p) == 1:  # SS (pure seconds)
+        return p[0]
+    elif len(p) == 2:  # MM:SS
+        return p[0]*60 + p[1]
+    elif len(p) == 3:  # HH:MM:SS
+        return p[0]*3600 + p[1]*60 + p[2]
+    else:
+        raise ValueError(f"无效的时间格式: {t_str}")
+
+
+def plan(video_path, script_data, audio_files):
+    """
+    渲染计划: 解析每个场景的子片段并按源视频时长修正边界 (源视频只探测一次)
+
+    支持新格式 (fragments 列表) 和旧格式 (time_start/time_end)。
+    Returns: {'video_path', 'source_duration',
+              'scenes': [{'idx', 'voiceover', 'audio', 'end', 'fragments': [{'start', 'dur', 'speed'}]}]}
+              其中 end 为最后一个子片段在源视频中的结束时间，音频过长时从这里延长
+    """
+    source_video_duration = get_duration(video_path)
+    scenes = []
+    for idx, scene in enumerate(script_data):
+        fragments = scene.get('fragments', [])
+        if not fragments:
+            # 兼容旧格式
+            start_str = scene.get('time_start', '00:00')
+            end_str = scene.get('time_end', '00:05')
+            fragments = [{'start': start_str, 'end': end_str, 'speed': 1.0}]
+
+        planned = []
+        for frag in fragments:
+            frag_start = parse_time(frag.get('start', '00:00'))
+            frag_end = parse_time(frag.get('end', '00:05'))
+            frag_speed = float(frag.get('speed', 1.0))
+
+            # 边界检查
+            if frag_start >= source_video_duration:
+                frag_start = max(0, source_video_duration - 2)
+            if frag_end > source_video_duration:
+                frag_end = source_video_duration
+
+            frag_dur = frag_end - frag_start
+            if frag_dur <= 0:
+                frag_dur = 1
+            planned.append({'start': frag_start, 'dur': frag_dur, 'speed': frag_speed})
+
+        scenes.append({
+            'idx': idx,
+            'voiceover': scene.get('voiceover', ''),
+            'audio': audio_files.get(str(idx)),
+            'end': parse_time(fragments[-1].get('end', '00:05')),
+            'fragments': planned
+        })
+    return {'video_path': video_path, 'source_duration': source_video_duration, 'scenes': scenes}
+
+
+def _render_scene(render_plan, scene, renditions, cut_method, verbose):
+    """
+    渲染单个场景: 切割子片段 -> 拼接 -> 按配音延长 -> 混音
+
+    Returns: {'clips': {档位: 片段路径}, 'report': 延长说明或 None}；无有效子片段时返回 None
+    """
+    video_path = render_plan['video_path']
+    source_video_duration = render_plan['source_duration']
+    idx = scene['idx']
+    audio_path = scene['audio']
+    report = None
+
+    def rpath(name, rendition):
+        return get_rendition_path(os.path.join(config.TEMP_DIR, name), rendition, renditions)
+
+    # 临时文件名 (多档分辨率时追加后缀)
+    p_seg_v = {r: rpath(f"seg_v_{idx}.mp4", r) for r in renditions}
+    p_seg_a = os.path.join(config.TEMP_DIR, f"seg_a_{idx}.wav")
+    p_seg_out = {r: rpath(f"clip_{idx}.mp4", r) for r in renditions}
+
+    # 处理多片段: 切割每个片段并拼接
+    frag_files = {r: [] for r in renditions}
+    for frag_idx, frag in enumerate(scene['fragments']):
+        # 切割单个片段 (一次解码，输出所有分辨率；变速时保留原声并同步变速)
+        outs = [rpath(f"frag_{idx}_{frag_idx}.mp4", r) for r in renditions]
+        cmd_frag = build_cut_cmd(video_path, frag['start'], frag['dur'], outs, renditions, speed=frag['speed'])
+        try:
+            run_ffmpeg(cmd_frag, verbose=verbose)
+            for r, out in zip(renditions, outs):
+                frag_files[r].append(out)
+        except Exception as e:
+            if verbose:
+                print(f"[警告] 片段 {idx+1} 子片段 {frag_idx+1} 切割失败: {e}")
+
+    if not frag_files[renditions[0]]:
+        if verbose:
+            print(f"[跳过] 片段 {idx+1}: 无有效子片段")
+        return None
+
+    for r in renditions:
+        # 如果只有一个片段，直接使用；否则拼接
+        if len(frag_files[r]) == 1:
+            shutil.copy(frag_files[r][0], p_seg_v[r])
+        else:
+            # 使用 concat demuxer 拼接多个片段
+            concat_list = rpath(f"concat_{idx}.txt", r)
+            with open(concat_list, 'w', encoding='utf-8') as f:
+                for ff in frag_files[r]:
+                    f.write(f"file '{os.path.abspath(ff)}'\n")
+
+            cmd_concat = [
+                "ffmpeg", "-y", "-f", "concat", "-safe", "0",
+                "-i", concat_list,
+                *config.encode_args(),
+                "-an",
+                p_seg_v[r]
+            ]
+            run_ffmpeg(cmd_concat, verbose=verbose)
+
+    # 获取拼接后的实际视频时长
+    video_dur = get_duration(p_seg_v[renditions[0]])
+
+    # A. 处理音频 (计算是否需要延长视频)
+    # 先转为wav并获取时长 (所有分辨率共用)
+    run_ffmpeg(["ffmpeg", "-y", "-i", audio_path, p_seg_a], verbose=verbose)
+    audio_dur = get_duration(p_seg_a)
+
+    # 如果音频比视频长，自动延长最后一个片段
+    if audio_dur > video_dur + 0.1:
+        diff = audio_dur - video_dur
+        vo_text = scene['voiceover'].strip()
+        vo_snippet = (vo_text[:30] + '..') if len(vo_text) > 30 else vo_text
+
+        # 从最后一个片段的结束时间继续延长
+        extend_start = scene['end']
+        extend_dur = diff + 0.5  # 多加0.5秒确保足够
+
+        # 检查是否超出源视频
+        if extend_start + extend_dur > source_video_duration:
+            # 如果会超出，只能延长到视频末尾
+            extend_dur = source_video_duration - extend_start
+            if extend_dur <= 0:
+                # 源视频已经用完了，从头开始循环
+                extend_start = 0
+                extend_dur = diff + 0.5
+                if extend_dur > source_video_duration:
+                    extend_dur = source_video_duration
+
+        if extend_dur > 0:
+            print(f"[自动延长] 片段 {idx+1}: 从 {extend_start:.1f}s 延长 {extend_dur:.1f}s")
+
+            # 切割延长部分 (使用与主片段相同的分辨率逻辑)
+            extend_files = [rpath(f"extend_{idx}.mp4", r) for r in renditions]
+            cmd_extend = build_cut_cmd(video_path, extend_start, extend_dur, extend_files, renditions,
+                                       keep_audio=False)
+
+            try:
+                run_ffmpeg(cmd_extend, verbose=verbose)
+
+                for r, extend_file in zip(renditions, extend_files):
+                    # 把延长部分拼接到原视频后面
+                    concat_extend = rpath(f"concat_ext_{idx}.txt", r)
+                    with open(concat_extend, 'w', encoding='utf-8') as f:
+                        f.write(f"file '{os.path.abspath(p_seg_v[r])}'\n")
+                        f.write(f"file '{os.path.abspath(extend_file)}'\n")
+
+                    p_seg_v_extended = rpath(f"seg_v_{idx}_ext.mp4", r)
+                    cmd_concat_ext = [
+                        "ffmpeg", "-y", "-f", "concat", "-safe", "0",
+                        "-i", concat_extend,
+                        *config.encode_args(),
+                        "-an",
+                        p_seg_v_extended
+                    ]
+                    run_ffmpeg(cmd_concat_ext, verbose=verbose)
+
+                    # 用延长后的视频替换原来的
+                    shutil.move(p_seg_v_extended, p_seg_v[r])
+
+            except Exception as e:
+                print(f"[警告] 自动延长失败: {e}")
+
+        report = f"片段 {idx+1} [内容: {vo_snippet}]: 已自动延长视频 {diff:.2f}s"
+
+    # B. 合并当前片段 (视频 + 音频)
+    # 视频比音频长时: cut 模式截断视频；pad 模式保留视频长度，原声静音后与配音混合或补静音。
+    # 音频更长或相等 (素材耗尽) 时以 -shortest 截断音频。
+    for r in renditions:
+        video_dur = get_duration(p_seg_v[r])
+
+        # 截断模式：如果设置了 --cut 且视频比音频长，则截断视频
+        if cut_method == "cut" and video_dur > audio_dur + 0.1:
+            cmd_merge = [
+                "ffmpeg", "-y",
+                "-i", p_seg_v[r],
+                "-i", p_seg_a,
+                "-map", "0:v", "-map", "1:a",
+                "-c:v", "copy", "-c:a", "aac",
+                "-shortest", # 截断到最短流(音频)
+                p_seg_out[r]
+            ]
+        elif video_dur > audio_dur + 0.1:
+            if has_audio_stream(p_seg_v[r]):
+                # 有原声，进行混合
+                audio_filter = f"[0:a]volume=0:enable='between(t,0,{audio_dur})'[bg];[1:a][bg]amix=inputs=2:duration=longest:dropout_transition=0[aout]"
+                cmd_merge = [
+                    "ffmpeg", "-y",
+                    "-i", p_seg_v[r],
+                    "-i", p_seg_a,
+                    "-filter_complex", audio_filter,
+                    "-map", "0:v", "-map", "[aout]",
+                    "-c:v", "copy", "-c:a", "aac",
+                    "-t", str(video_dur),
+                    p_seg_out[r]
+                ]
+            else:
+                # 无原声，直接填充静音，保留视频长度
+                cmd_merge = [
+                    "ffmpeg", "-y",
+                    "-i", p_seg_v[r],
+                    "-i", p_seg_a,
+                    "-filter_complex", f"[1:a]apad=whole_dur={video_dur}[aout]",
+                    "-map", "0:v", "-map", "[aout]",
+                    "-c:v", "copy", "-c:a", "aac",
+                    "-t", str(video_dur),
+                    p_seg_out[r]
+                ]
+        # 音频更长或相等: 只用 TTS
+        else:
+            cmd_merge = [
+                "ffmpeg", "-y",
+                "-i", p_seg_v[r],
+                "-i", p_seg_a,
+                "-map", "0:v", "-map", "1:a",
+                "-c:v", "copy", "-c:a", "aac",
+                "-shortest",
+                p_seg_out[r]
+            ]
+
+        try:
+            run_ffmpeg(cmd_merge, verbose=verbose)
+        except Exception as e:
+            # Fallback if audio processing fails (e.g. no audio stream in source)
+            if verbose: print(f"[警告] 音频混合失败，尝试仅使用TTS音频: {e}")
+            fallback_cmd = [
+                "ffmpeg", "-y",
+                "-i", p_seg_v[r],
+                "-i", p_seg_a,
+                "-filter_complex", f"[1:a]apad=whole_dur={video_dur}[aout]",
+                "-map", "0:v", "-map", "[aout]",
+                "-c:v", "copy", "-c:a", "aac",
+                "-t", str(video_dur),
+                p_seg_out[r]
+            ]
+            run_ffmpeg(fallback_cmd, verbose=verbose)
+
+    return {'clips': p_seg_out, 'report': report}
+
+
+def render(video_path, script_data, audio_files, verbose=False, resolution="native", cut_method="pad",
+           progressive=None, renditions=None, burn_subtitles=False, word_timings=None, profiler=None,
+           render_plan=None, workers=None):
+    """
+    核心渲染逻辑:
+    1. 遍历脚本，切割视频，处理音频同步
+    2. 生成片段
+    3. 合并片段
+    4. 烧录字幕
+
+    Args:
+        verbose: If True, print progress to terminal (CLI mode)
+        resolution: 'native' 保持原分辨率, '360p' 缩放到640x360
+        progressive: 'hls' 时每完成一个片段即写入 config.LIVE_DIR 下的 HLS 分片与直播列表
+        renditions: 多档分辨率列表 (如 ['360p', '720p', '1080p'])，一次渲染全部输出；
+                    第一档为主输出，其余见 get_rendition_path()
+        burn_subtitles: 在最终合并编码中直接烧录字幕 (不额外增加一次编码)
+        word_timings: {场景索引: [{'start', 'end', 'text'}]}；未提供时读取音频旁的 .words.json，
+                      有逐词计时则按短句切分字幕，否则每个场景一条字幕
+        profiler: RenderProfiler 实例，记录各阶段与每条 FFmpeg 命令的耗时
+        render_plan: plan() 的结果，未提供时现场生成
+        workers: 并行渲染的场景数，默认 config.WORKERS
+    Returns: 主输出视频路径 (字幕见 output_srt_path())
+    """
+    with use_profiler(profiler) as prof:
+        prof.begin("render", scenes=len(script_data))
+        try:
+            return _render(video_path, script_data, audio_files, verbose, resolution, cut_method, progressive,
+                           renditions, burn_subtitles, word_timings, render_plan, workers or config.WORKERS)
+        finally:
+            prof.end_all()
+
+
+# 兼容旧名称 (narrato.py / render_engine.py 原有的入口)
+process_render = render
+
+
+def _render(video_path, script_data, audio_files, verbose, resolution, cut_method, progressive,
+            renditions, burn_subtitles, word_timings, render_plan, workers):
+    prof = current_profiler()
+    renditions = list(renditions) if renditions else [resolution]
+    temp_dir = config.TEMP_DIR
+    final_path = get_rendition_path(os.path.join(temp_dir, OUTPUT_FILENAME), renditions[0], renditions)
+
+    # Progress callback
+    def update_progress(step, detail=""):
+        if verbose:
+            print(f"[进度] {step}: {detail}")
+        # Also write to file for GUI mode
+        with open(os.path.join(temp_dir, "progress.txt"), "w", encoding="utf-8") as f:
+            f.write(f"{step}|{detail}")
+
+    def rpath(name, rendition):
+        return get_rendition_path(os.path.join(temp_dir, name), rendition, renditions)
+
+    # 每档分辨率各自的片段列表
+    segment_files = {r: [] for r in renditions}
+    srt_entries = []
+    current_time_cursor = 0.0
+    report_log = []
+    live_segments = []
+    reset_live_playlist()
+    if progressive == "hls":
+        write_live_playlist(live_segments)
+
+    prof.begin("plan")
+    render_plan = render_plan or plan(video_path, script_data, audio_files)
+    prof.end()
+    scenes = render_plan['scenes']
+
+    def run_scene(scene):
+        prof.begin("scene", idx=scene['idx'])
+        try:
+            return _render_scene(render_plan, scene, renditions, cut_method, verbose)
+        finally:
+            prof.end()
+
+    # 1. 处理每个片段 (并行时结果仍按场景顺序取回)
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    results = pool.map(run_scene, scenes) if pool else map(run_scene, scenes)
+    try:
+        for scene, result in zip(scenes, results):
+            idx = scene['idx']
+            if result is None:
+                continue
+            update_progress("渲染片段", f"{idx+1}/{len(scenes)}")
+            for r in renditions:
+                segment_files[r].append(result['clips'][r])
+            if result['report']:
+                report_log.append(result['report'])
+
+            # 更新视频时长用于字幕计时 (以主输出为准)
+            clip_path = result['clips'][renditions[0]]
+            video_dur = get_duration(clip_path)
+
+            if progressive == "hls":
+                append_live_segment(clip_path, idx, current_time_cursor, live_segments, verbose=verbose)
+
+            # 记录字幕 (SRT格式)
+            words = (word_timings or {}).get(str(idx)) or load_word_timings(scene['audio'])
+            if words:
+                cues = build_subtitle_cues(words)
+            else:
+                cues = [(0.0, video_dur, scene['voiceover'])]
+            for cue_start, cue_end, cue_text in cues:
+                if cue_start >= video_dur:
+                    break
+                srt_start = fmt_srt_time(current_time_cursor + cue_start)
+                srt_end = fmt_srt_time(current_time_cursor + min(cue_end, video_dur))
+                srt_entries.append(f"{len(srt_entries)+1}\n{srt_start} --> {srt_end}\n{cue_text}\n")
+
+            current_time_cursor += video_dur
+    finally:
+        if pool:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    # 2. 生成 SRT 文件 (合并前写出，以便在合并编码中直接烧录)
+    srt_path = os.path.join(temp_dir, "subs.srt")
+    with open(srt_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(srt_entries))
+
+    # 3. 合并所有片段 (每档分辨率各一次)；合并本身就要重新编码，字幕烧录随之完成
+    update_progress("合并片段", "正在拼接并烧录字幕..." if burn_subtitles else "正在拼接所有片段...")
+    prof.begin("final_concat", renditions=len(renditions))
+    for r in renditions:
+        list_path = rpath("filelist.txt", r)
+        with open(list_path, "w", encoding="utf-8") as f:
+            for seg in segment_files[r]:
+                # ffmpeg concat demuxer 需要绝对路径或相对路径，注意转义
+                f.write(f"file '{os.path.basename(seg)}'\n")
+
+        merged_tmp = rpath("merged_tmp.mp4", r)
+        # Use relative filename since we run with cwd=TEMP_DIR
+        cmd_concat = [
+            "ffmpeg", "-y", "-f", "concat", "-safe", "0",
+            "-i", os.path.basename(list_path),  # relative to TEMP_DIR
+        ]
+        if burn_subtitles and srt_entries:
+            # 相对路径避免 Windows 盘符在滤镜参数中的转义问题
+            cmd_concat.extend(["-vf", "subtitles=subs.srt"])
+        cmd_concat.extend([
+            *config.encode_args(),
+            "-c:a", "aac", "-b:a", "128k",
+            os.path.basename(merged_tmp)  # relative to TEMP_DIR
+        ])
+        # 注意：cwd设为TEMP_DIR以便读取 filelist
+        run_ffmpeg(cmd_concat, verbose=verbose, cwd=temp_dir)
+    prof.end()
+
+    # 4. 合并后的视频即最终输出
+    prof.begin("export")
+    for r in renditions:
+        shutil.copy(rpath("merged_tmp.mp4", r), rpath(OUTPUT_FILENAME, r))
+
+    # 导出 SRT
+    final_srt_path = output_srt_path()
+    shutil.copy(srt_path, final_srt_path)
+    if verbose:
+        for r in renditions:
+            print(f"[导出] 视频: {rpath(OUTPUT_FILENAME, r)}")
+        print(f"[导出] 字幕: {final_srt_path}")
+
+    if progressive == "hls":
+        write_live_playlist(live_segments, finished=True)
+    prof.end()
+
+    update_progress("完成", "渲染完成！")
+
+    # 5. 生成报告
+    if report_log:
+        report_path = "report.txt"
+        with open(report_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(report_log))
+        if verbose:
+            print(f"[提示] 已生成延长报告: {report_path}")
+
+    return final_path
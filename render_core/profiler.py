@@ -0,0 +1,214 @@
+"""
+渲染性能剖析: 记录各阶段及每条 FFmpeg 命令的墙钟时间、子进程 CPU 时间、读写字节
+
+渲染代码通过 current() 取得当前剖析器；render() 期间由 use() 切换为调用方传入的实例。
+"""
+
+import json
+import os
+import subprocess
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows 无 resource 模块，剖析时子进程 CPU 时间记为 0
+    resource = None
+
+
+def _children_cpu_time():
+    """已结束子进程 (ffmpeg/ffprobe) 的累计 CPU 时间 (user + sys)"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _file_size(path, cwd=None):
+    if cwd and not os.path.isabs(path):
+        path = os.path.join(cwd, path)
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def classify_ffmpeg_cmd(cmd):
+    """按用途给 FFmpeg/FFprobe 命令归类，便于汇总各类命令的耗时"""
+    if cmd[0] == "ffprobe":
+        return "probe"
+    args = " ".join(cmd)
+    if "-f concat" in args:
+        return "concat"
+    if "-f mpegts" in args:
+        return "hls_segment"
+    if cmd[-1].endswith(".wav"):
+        return "wav"
+    if "amix" in args:
+        return "amix"
+    if "apad" in args:
+        return "apad"
+    if "-ss" in cmd:
+        return "cut"
+    if "copy" in cmd:
+        return "mux"
+    return "ffmpeg"
+
+
+def _cmd_io_bytes(cmd, cwd=None):
+    """估算命令读取/写出的字节数: 输入文件 (含 concat 列表中的文件) 与输出文件大小"""
+    read = 0
+    for i, arg in enumerate(cmd[:-1]):
+        if arg != "-i":
+            continue
+        src = cmd[i + 1]
+        if src.endswith(".txt"):
+            list_path = src if (os.path.isabs(src) or not cwd) else os.path.join(cwd, src)
+            list_dir = os.path.dirname(list_path)
+            try:
+                with open(list_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.startswith("file '"):
+                            read += _file_size(line.strip()[6:-1], list_dir)
+            except OSError:
+                pass
+        else:
+            read += _file_size(src, cwd)
+    written = _file_size(cmd[-1], cwd) if cmd[0] == "ffmpeg" else 0
+    return read, written
+
+
+class RenderProfiler:
+    """
+    记录渲染各阶段及每条 FFmpeg 命令的墙钟时间、子进程 CPU 时间、读写字节
+    
+    输出 Chrome trace (chrome://tracing 或 Perfetto 打开) 与文本汇总表。
+    enabled=False 时所有方法均为空操作，方便在渲染代码中无条件调用。
+    多线程渲染 (--jobs) 时每个线程各有阶段栈，在 trace 中显示为独立的一行；
+    子进程 CPU 时间按进程统计，并行时各事件的 child_cpu_s 会互相重叠。
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.events = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tids = {}
+        self._origin = time.perf_counter()
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _tid(self):
+        ident = threading.get_ident()
+        with self._lock:
+            return self._tids.setdefault(ident, len(self._tids) + 1)
+
+    def _now_us(self):
+        return (time.perf_counter() - self._origin) * 1e6
+
+    def begin(self, name, cat="stage", **args):
+        if not self.enabled:
+            return
+        self._stack.append((name, cat, self._now_us(), _children_cpu_time(), args))
+
+    def end(self):
+        if not self.enabled or not self._stack:
+            return
+        name, cat, start, cpu0, args = self._stack.pop()
+        self._add(name, cat, start, self._now_us() - start, _children_cpu_time() - cpu0, args)
+
+    def end_all(self):
+        while self._stack:
+            self.end()
+
+    def run(self, cmd, **kwargs):
+        """执行子进程并记录为一条命令事件"""
+        if not self.enabled:
+            return subprocess.run(cmd, **kwargs)
+        start, cpu0 = self._now_us(), _children_cpu_time()
+        result = subprocess.run(cmd, **kwargs)
+        dur, cpu = self._now_us() - start, _children_cpu_time() - cpu0
+        read, written = _cmd_io_bytes(cmd, kwargs.get("cwd"))
+        self._add(classify_ffmpeg_cmd(cmd), "ffmpeg", start, dur, cpu, {
+            "bytes_read": read, "bytes_written": written,
+            "returncode": result.returncode, "cmd": " ".join(cmd)
+        })
+        return result
+
+    def _add(self, name, cat, start_us, dur_us, cpu_s, args):
+        event_args = dict(args)
+        event_args["child_cpu_s"] = round(cpu_s, 4)
+        event = {
+            "name": name, "cat": cat, "ph": "X",
+            "ts": round(start_us, 1), "dur": round(dur_us, 1),
+            "pid": os.getpid(), "tid": self._tid(),
+            "args": event_args
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def write_chrome_trace(self, path):
+        self.end_all()
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+
+    def summary(self):
+        """按 (类别, 名称) 汇总: 次数、墙钟秒、子进程 CPU 秒、读写 MB"""
+        rows = {}
+        for e in self.events:
+            row = rows.setdefault((e["cat"], e["name"]), [0, 0.0, 0.0, 0, 0])
+            row[0] += 1
+            row[1] += e["dur"] / 1e6
+            row[2] += e["args"].get("child_cpu_s", 0.0)
+            row[3] += e["args"].get("bytes_read", 0)
+            row[4] += e["args"].get("bytes_written", 0)
+        return rows
+
+    def summary_table(self):
+        rows = self.summary()
+        total = sum(r[1] for (cat, name), r in rows.items() if cat == "stage" and name == "render") or \
+            sum(r[1] for r in rows.values()) or 1.0
+        lines = [f"{'cat':<8}{'name':<16}{'count':>6}{'wall_s':>10}{'share':>8}{'cpu_s':>10}{'read_MB':>10}{'write_MB':>10}"]
+        for (cat, name), (count, wall, cpu, read, written) in sorted(rows.items(), key=lambda kv: -kv[1][1]):
+            lines.append(
+                f"{cat:<8}{name:<16}{count:>6}{wall:>10.2f}{wall / total * 100:>7.1f}%"
+                f"{cpu:>10.2f}{read / 1e6:>10.1f}{written / 1e6:>10.1f}"
+            )
+        return "\n".join(lines)
+
+    def export(self, trace_path):
+        """写出 trace JSON 与同名 .txt 汇总表，返回汇总文本"""
+        self.write_chrome_trace(trace_path)
+        table = self.summary_table()
+        with open(os.path.splitext(trace_path)[0] + ".txt", "w", encoding="utf-8") as f:
+            f.write(table + "\n")
+        return table
+
+
+# 当前渲染使用的剖析器 (render 期间有效)
+_current = RenderProfiler(enabled=False)
+
+
+def current():
+    return _current
+
+
+class use:
+    """with use(profiler): 期间 current() 返回该剖析器"""
+
+    def __init__(self, profiler):
+        self.profiler = profiler or RenderProfiler(enabled=False)
+
+    def __enter__(self):
+        global _current
+        self.previous, _current = _current, self.profiler
+        return self.profiler
+
+    def __exit__(self, *exc):
+        global _current
+        _current = self.previous
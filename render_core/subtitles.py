@@ -0,0 +1,72 @@
+"""
+字幕: 基于 edge-tts WordBoundary 的逐词计时切分短字幕，输出 SRT
+"""
+
+import json
+import os
+
+SUB_MAX_CHARS = 16       # 单条字幕最多字符数 (中文按字计)
+SUB_MAX_GAP = 0.35       # 词间停顿超过该秒数时断行
+SUB_BREAK_PUNCT = "。！？；，、,.!?;:："
+
+
+def get_word_timings_path(audio_path):
+    """音频对应的逐词计时文件: audio_0.mp3 -> audio_0.words.json"""
+    return os.path.splitext(audio_path)[0] + ".words.json"
+
+
+def load_word_timings(audio_path):
+    """读取音频旁的逐词计时 [{'start', 'end', 'text'}]，不存在返回 None"""
+    if not audio_path:
+        return None
+    path = get_word_timings_path(audio_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _join_words(left, right):
+    # 西文单词之间补空格，中文直接拼接
+    if left and right and left[-1].isascii() and left[-1].isalnum() and right[0].isascii() and right[0].isalnum():
+        return left + " " + right
+    return left + right
+
+
+def build_subtitle_cues(words, max_chars=SUB_MAX_CHARS, max_gap=SUB_MAX_GAP):
+    """
+    把逐词计时合并为短字幕行
+    
+    遇到标点、停顿过长或超出 max_chars 时断行，无需额外的对齐步骤。
+    Returns: [(start, end, text)]，时间相对于该段配音开头
+    """
+    cues = []
+    cur_text, cur_start, cur_end = "", None, None
+    for w in words:
+        text = str(w.get("text", "")).strip()
+        if not text:
+            continue
+        start, end = float(w["start"]), float(w["end"])
+        if cur_text and (len(cur_text) + len(text) > max_chars or start - cur_end > max_gap):
+            cues.append((cur_start, cur_end, cur_text))
+            cur_text, cur_start = "", None
+        if cur_start is None:
+            cur_start = start
+        cur_text = _join_words(cur_text, text)
+        cur_end = end
+        if text[-1] in SUB_BREAK_PUNCT:
+            cues.append((cur_start, cur_end, cur_text))
+            cur_text, cur_start = "", None
+    if cur_text:
+        cues.append((cur_start, cur_end, cur_text))
+    return cues
+
+
+def fmt_srt_time(seconds):
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    ms = int((s - int(s)) * 1000)
+    return f"{int(h):02d}:{int(m):02d}:{int(s):02d},{ms:03d}"
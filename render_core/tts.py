@@ -0,0 +1,74 @@
+"""
+语音合成 (edge-tts)，同时保存逐词计时供字幕切分
+"""
+
+import asyncio
+import json
+import os
+
+import edge_tts
+
+from . import config
+from .subtitles import get_word_timings_path
+
+
+def create_communicate(text, voice, rate):
+    """创建开启逐词边界事件的 edge-tts 会话"""
+    try:
+        return edge_tts.Communicate(text, voice, rate=rate, boundary="WordBoundary")
+    except TypeError:
+        # edge-tts < 7 没有 boundary 参数，默认即输出 WordBoundary
+        return edge_tts.Communicate(text, voice, rate=rate)
+
+
+async def generate_tts_audio(text: str, voice: str, rate: str, output_path: str, max_retries: int = 3):
+    """Generate TTS audio with retry logic (同时把逐词计时写入 .words.json 供字幕切分)"""
+    for attempt in range(max_retries):
+        try:
+            communicate = create_communicate(text, voice, rate)
+            words = []
+            with open(output_path, "wb") as f:
+                async for chunk in communicate.stream():
+                    if chunk["type"] == "audio":
+                        f.write(chunk["data"])
+                    elif chunk["type"] == "WordBoundary":
+                        # offset/duration 单位为 100ns
+                        start = chunk["offset"] / 1e7
+                        words.append({
+                            "start": start,
+                            "end": start + chunk["duration"] / 1e7,
+                            "text": chunk["text"]
+                        })
+            with open(get_word_timings_path(output_path), "w", encoding="utf-8") as f:
+                json.dump(words, f, ensure_ascii=False)
+            return True
+        except Exception as e:
+            if attempt < max_retries - 1:
+                await asyncio.sleep(2)  # Wait before retry
+            else:
+                print(f"[TTS 错误] 生成失败: {str(e)[:50]}")
+                raise
+
+
+async def generate_all_audio(script_data: list, voice: str, rate: str, output_dir: str):
+    """Generate all TTS audio files with limited concurrency"""
+    semaphore = asyncio.Semaphore(config.TTS_CONCURRENCY)
+    
+    async def generate_one(idx, scene):
+        async with semaphore:
+            output_path = os.path.join(output_dir, f"audio_{idx}.mp3")
+            print(f"[TTS] 生成语音 {idx+1}/{len(script_data)}: {scene['voiceover'][:30]}...")
+            await generate_tts_audio(scene['voiceover'], voice, rate, output_path)
+    
+    tasks = [generate_one(idx, scene) for idx, scene in enumerate(script_data)]
+    await asyncio.gather(*tasks)
+    print(f"[TTS] 所有 {len(script_data)} 个语音生成完成!")
+    
+    # Return paths dict
+    return {str(i): os.path.join(output_dir, f"audio_{i}.mp3") for i in range(len(script_data))}
+
+
+def tts(script_data, voice=None, rate="+0%", output_dir=None):
+    """同步接口: 为每个场景合成配音，返回 {场景索引: 音频路径}"""
+    return asyncio.run(generate_all_audio(script_data, voice or config.DEFAULT_VOICE, rate,
+                                          output_dir or config.TEMP_DIR))
@@ -1,7 +1,8 @@
 import uvicorn
-from fastapi import FastAPI, Body, UploadFile, File, Form
+from fastapi import FastAPI, Body, UploadFile, File, Form, Request, HTTPException
 from fastapi.responses import HTMLResponse, StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
 import edge_tts
 import io
 import json
@@ -13,500 +14,39 @@ import tempfile
 import argparse
 import asyncio
 import sys
+import threading
+import time
+import hashlib
+import re
+import zipfile
 from typing import List
 
+from render_core import (LIVE_PLAYLIST, RenderProfiler, cache_render_outputs, config, generate_all_audio,
+                         get_duration, get_rendition_path, get_source_path, process_render, render_cache,
+                         render_fingerprint, sha256_file)
+from render_core.cli import add_tuning_arguments, apply_tuning_arguments, render_from_project
+
 # ==========================================
 # 1. 后端逻辑
 # ==========================================
 
 app = FastAPI()
 
-# 临时文件目录
-TEMP_DIR = "temp_render"
-if os.path.exists(TEMP_DIR):
-    shutil.rmtree(TEMP_DIR)
-os.makedirs(TEMP_DIR, exist_ok=True)
+# 渲染实现见 render_core；这里按 config 准备目录，并保留原有的模块级名称供 render_worker 等调用
+config.prepare_temp_dir()
+TEMP_DIR = config.TEMP_DIR
+LIVE_DIR = config.LIVE_DIR
+# 一次只跑一个 /render_video (见 render_video_final)
+_render_lock = asyncio.Lock()
 
-# ---------------------------------------------------
-# FFmpeg 辅助函数
-# ---------------------------------------------------
+# 源视频仓库 (按 SHA-256 去重，跨渲染持久保存，不随 TEMP_DIR 清理)
+SOURCE_DIR = config.SOURCE_DIR
+UPLOAD_DIR = os.path.join(SOURCE_DIR, "uploads")
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-def get_duration(file_path):
-    """获取媒体文件时长(秒)"""
-    cmd = [
-        "ffprobe", "-v", "error", "-show_entries", "format=duration",
-        "-of", "default=noprint_wrappers=1:nokey=1", file_path
-    ]
-    try:
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return float(result.stdout.strip())
-    except:
-        return 0.0
-
-def has_audio_stream(file_path):
-    """检查文件是否包含音频流"""
-    cmd = [
-        "ffprobe", "-v", "error", "-select_streams", "a",
-        "-show_entries", "stream=index", "-of", "csv=p=0", file_path
-    ]
-    try:
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        # 如果有音频流，输出不为空
-        return bool(result.stdout.strip())
-    except:
-        return False
-
-def run_ffmpeg(cmd, verbose=False, cwd=None):
-    """Run FFmpeg command with optional stderr output for debugging"""
-    # Force utf-8 and relax decoding to prevent crash on Windows (GBK vs UTF-8 issues)
-    result = subprocess.run(cmd, capture_output=True, text=True, cwd=cwd, encoding='utf-8', errors='replace')
-    if result.returncode != 0:
-        if verbose:
-            print(f"[FFmpeg 错误] 命令: {' '.join(cmd[:5])}...")
-            # Print last 800 chars of stderr
-            stderr_tail = result.stderr[-800:] if len(result.stderr) > 800 else result.stderr
-            print(stderr_tail)
-        raise subprocess.CalledProcessError(result.returncode, cmd)
-    return result
-
-def process_render(video_path, script_data, audio_files, verbose=False, resolution="native", cut_method="pad"):
-    """
-    核心渲染逻辑:
-    1. 遍历脚本，切割视频，处理音频同步
-    2. 生成片段
-    3. 合并片段
-    4. 烧录字幕
-    
-    Args:
-        verbose: If True, print progress to terminal (CLI mode)
-        resolution: 'native' 保持原分辨率, '360p' 缩放到640x360
-    """
-    output_filename = "final_output.mp4"
-    final_path = os.path.join(TEMP_DIR, output_filename)
-    
-    segment_files = []
-    srt_entries = []
-    current_time_cursor = 0.0
-    total_scenes = len(script_data)
-    
-    # Progress callback
-    def update_progress(step, detail=""):
-        if verbose:
-            print(f"[进度] {step}: {detail}")
-        # Also write to file for GUI mode
-        with open(os.path.join(TEMP_DIR, "progress.txt"), "w", encoding="utf-8") as f:
-            f.write(f"{step}|{detail}")
-
-    segment_files = []
-    srt_entries = []
-    current_time_cursor = 0.0
-    report_log = []
-
-    # 1. 处理每个片段
-    for idx, scene in enumerate(script_data):
-        # 支持新格式 (fragments列表) 和旧格式 (time_start/time_end)
-        fragments = scene.get('fragments', [])
-        if not fragments:
-            # 兼容旧格式
-            start_str = scene.get('time_start', '00:00')
-            end_str = scene.get('time_end', '00:05')
-            fragments = [{'start': start_str, 'end': end_str, 'speed': 1.0}]
-        
-        def parse_time(t_str):
-            t_str = str(t_str)
-            p = list(map(float, t_str.split(':')))
-            if len(p) == 1:  # SS (pure seconds)
-                return p[0]
-            elif len(p) == 2:  # MM:SS
-                return p[0]*60 + p[1]
-            elif len(p) == 3:  # HH:MM:SS
-                return p[0]*3600 + p[1]*60 + p[2]
-            else:
-                raise ValueError(f"无效的时间格式: {t_str}")
-        
-        # 对应的音频文件
-        audio_path = audio_files.get(str(idx))
-        
-        # 临时文件名
-        seg_video_name = f"seg_v_{idx}.mp4"
-        seg_audio_name = f"seg_a_{idx}.wav"
-        seg_out_name = f"clip_{idx}.mp4"
-        
-        p_seg_v = os.path.join(TEMP_DIR, seg_video_name)
-        p_seg_a = os.path.join(TEMP_DIR, seg_audio_name)
-        p_seg_out = os.path.join(TEMP_DIR, seg_out_name)
-        
-        # 获取视频总时长
-        source_video_duration = get_duration(video_path)
-        
-        # 处理多片段: 切割每个片段并拼接
-        frag_files = []
-        total_video_dur = 0
-        
-        for frag_idx, frag in enumerate(fragments):
-            frag_start = parse_time(frag.get('start', '00:00'))
-            frag_end = parse_time(frag.get('end', '00:05'))
-            frag_speed = float(frag.get('speed', 1.0))
-            
-            # 边界检查
-            if frag_start >= source_video_duration:
-                frag_start = max(0, source_video_duration - 2)
-            if frag_end > source_video_duration:
-                frag_end = source_video_duration
-            
-            frag_dur = frag_end - frag_start
-            if frag_dur <= 0:
-                frag_dur = 1
-            
-            # 计算变速后的时长
-            actual_frag_dur = frag_dur / frag_speed
-            total_video_dur += actual_frag_dur
-            
-            # 切割单个片段
-            frag_file = os.path.join(TEMP_DIR, f"frag_{idx}_{frag_idx}.mp4")
-            
-            # 构建变速滤镜
-            # 支持自定义分辨率：360p, 480p, 720p, 1080p 或 native（原始）
-            scale_filter = ""
-            if resolution and resolution != "native":
-                res_map = {
-                    "360p": "scale=640:360",
-                    "480p": "scale=854:480",
-                    "720p": "scale=1280:720",
-                    "1080p": "scale=1920:1080",
-                }
-                if resolution in res_map:
-                    scale_filter = res_map[resolution] + ","
-                elif "x" in resolution:
-                    # 支持自定义 WxH 格式，如 "800x600"
-                    scale_filter = f"scale={resolution.replace('x', ':')},"
-            
-            # 构建视频滤镜
-            vf_filters = []
-            if scale_filter:
-                vf_filters.append(scale_filter.rstrip(','))
-            
-            if frag_speed != 1.0:
-                vf_filters.append(f"setpts={1/frag_speed}*PTS")
-            
-            vf_chain = ",".join(vf_filters) if vf_filters else None
-            
-            # 构建音频滤镜 (保留原声并变速)
-            # 需要在函数顶层定义 get_atempo_filter，这里先假设已定义或临时内联
-            af_chain = None
-            if frag_speed != 1.0:
-                # 临时的内联实现以免此时未定义报错，也可以稍后在顶部添加
-                filters = []
-                s = frag_speed
-                while s < 0.5: filters.append("atempo=0.5"); s /= 0.5
-                while s > 2.0: filters.append("atempo=2.0"); s /= 2.0
-                filters.append(f"atempo={s}")
-                af_chain = ",".join(filters)
-            
-            cmd_frag = [
-                "ffmpeg", "-y", "-ss", str(frag_start), "-t", str(frag_dur),
-                "-i", video_path
-            ]
-            if vf_chain:
-                cmd_frag.extend(["-vf", vf_chain])
-            if af_chain:
-                cmd_frag.extend(["-af", af_chain])
-            
-            cmd_frag.extend([
-                "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-                "-c:a", "aac", 
-                frag_file
-            ])
-            
-            try:
-                run_ffmpeg(cmd_frag, verbose=verbose)
-                frag_files.append(frag_file)
-            except Exception as e:
-                if verbose:
-                    print(f"[警告] 片段 {idx+1} 子片段 {frag_idx+1} 切割失败: {e}")
-        
-        if not frag_files:
-            if verbose:
-                print(f"[跳过] 片段 {idx+1}: 无有效子片段")
-            continue
-        
-        # 如果只有一个片段，直接使用；否则拼接
-        if len(frag_files) == 1:
-            import shutil
-            shutil.copy(frag_files[0], p_seg_v)
-        else:
-            # 使用 concat demuxer 拼接多个片段
-            concat_list = os.path.join(TEMP_DIR, f"concat_{idx}.txt")
-            with open(concat_list, 'w', encoding='utf-8') as f:
-                for ff in frag_files:
-                    f.write(f"file '{os.path.abspath(ff)}'\n")
-            
-            cmd_concat = [
-                "ffmpeg", "-y", "-f", "concat", "-safe", "0",
-                "-i", concat_list,
-                "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-                "-an",
-                p_seg_v
-            ]
-            run_ffmpeg(cmd_concat, verbose=verbose)
-        
-        # 获取拼接后的实际视频时长
-        actual_video_dur = get_duration(p_seg_v)
-        video_dur = actual_video_dur
-        
-        # A. 处理音频 (计算是否需要延长视频)
-        # 先转为wav并获取时长
-        run_ffmpeg(["ffmpeg", "-y", "-i", audio_path, p_seg_a], verbose=verbose)
-        audio_dur = get_duration(p_seg_a)
-        
-        final_audio_filter = "anull" # 默认不处理
-        
-        # 如果音频比视频长，自动延长最后一个片段
-        if audio_dur > video_dur + 0.1:
-            diff = audio_dur - video_dur
-            vo_text = scene.get('voiceover', '').strip()
-            vo_snippet = (vo_text[:30] + '..') if len(vo_text) > 30 else vo_text
-            
-            # 获取最后一个片段的结束时间，从那里继续延长
-            last_frag = fragments[-1]
-            last_frag_end = parse_time(last_frag.get('end', '00:05'))
-            
-            # 计算需要延长多少
-            extend_start = last_frag_end
-            extend_dur = diff + 0.5  # 多加0.5秒确保足够
-            
-            # 检查是否超出源视频
-            if extend_start + extend_dur > source_video_duration:
-                # 如果会超出，只能延长到视频末尾
-                extend_dur = source_video_duration - extend_start
-                if extend_dur <= 0:
-                    # 源视频已经用完了，从头开始循环
-                    extend_start = 0
-                    extend_dur = diff + 0.5
-                    if extend_dur > source_video_duration:
-                        extend_dur = source_video_duration
-            
-            if extend_dur > 0:
-                print(f"[自动延长] 片段 {idx+1}: 从 {extend_start:.1f}s 延长 {extend_dur:.1f}s")
-                
-                # 切割延长部分
-                extend_file = os.path.join(TEMP_DIR, f"extend_{idx}.mp4")
-                
-                # 使用与主片段相同的分辨率逻辑
-                scale_filter = None
-                if resolution and resolution != "native":
-                    res_map = {
-                        "360p": "scale=640:360",
-                        "480p": "scale=854:480",
-                        "720p": "scale=1280:720",
-                        "1080p": "scale=1920:1080",
-                    }
-                    if resolution in res_map:
-                        scale_filter = res_map[resolution]
-                    elif "x" in resolution:
-                        scale_filter = f"scale={resolution.replace('x', ':')}"
-                
-                cmd_extend = [
-                    "ffmpeg", "-y", "-ss", str(extend_start), "-t", str(extend_dur),
-                    "-i", video_path
-                ]
-                if scale_filter:
-                    cmd_extend.extend(["-vf", scale_filter])
-                cmd_extend.extend([
-                    "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-                    "-an",
-                    extend_file
-                ])
-                
-                try:
-                    run_ffmpeg(cmd_extend, verbose=verbose)
-                    
-                    # 把延长部分拼接到原视频后面
-                    concat_extend = os.path.join(TEMP_DIR, f"concat_ext_{idx}.txt")
-                    with open(concat_extend, 'w', encoding='utf-8') as f:
-                        f.write(f"file '{os.path.abspath(p_seg_v)}'\n")
-                        f.write(f"file '{os.path.abspath(extend_file)}'\n")
-                    
-                    p_seg_v_extended = os.path.join(TEMP_DIR, f"seg_v_{idx}_ext.mp4")
-                    cmd_concat_ext = [
-                        "ffmpeg", "-y", "-f", "concat", "-safe", "0",
-                        "-i", concat_extend,
-                        "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-                        "-an",
-                        p_seg_v_extended
-                    ]
-                    run_ffmpeg(cmd_concat_ext, verbose=verbose)
-                    
-                    # 用延长后的视频替换原来的
-                    import shutil
-                    shutil.move(p_seg_v_extended, p_seg_v)
-                    
-                    # 更新视频时长
-                    video_dur = get_duration(p_seg_v)
-                    
-                except Exception as e:
-                    print(f"[警告] 自动延长失败: {e}")
-            
-            msg = f"片段 {idx+1} [内容: {vo_snippet}]: 已自动延长视频 {diff:.2f}s"
-            report_log.append(msg)
-        
-
-        # C. 合并当前片段 (视频 + 音频)
-        # 注意：视频长度和音频长度可能不完全一致（由于帧率对齐等），
-        # 如果视频延长后比音频略长，或者略短。
-        # 使用 -shortest 可能会截断音频。如果视频定格需求，需要 pad。
-        # 为简单起见，且满足“延伸视频”的需求，我们假设视频已经足够长（或者已到末尾）。
-        # 如果视频比音频长，shortest会让视频适应音频。
-        # 如果音频比视频长(素材耗尽)，shortest会让音频被截断。这是合理的。
-        
-        # 此时 final_audio_filter 应该是空的或者 anull
-        
-        cmd_merge = []
-        video_dur = get_duration(p_seg_v)
-        
-        # 截断模式：如果设置了 --cut 且视频比音频长，则截断视频
-        if cut_method == "cut" and video_dur > audio_dur + 0.1:
-            cmd_merge = [
-                "ffmpeg", "-y",
-                "-i", p_seg_v,
-                "-i", p_seg_a,
-                "-map", "0:v", "-map", "1:a",
-                "-c:v", "copy", "-c:a", "aac",
-                "-shortest", # 截断到最短流(音频)
-                p_seg_out
-            ]
-        elif video_dur > audio_dur + 0.1:
-            # 检查是否有原声
-            has_original_audio = has_audio_stream(p_seg_v)
-            
-            if has_original_audio:
-                # 有原声，进行混合
-                # Log: [0:a]volume=0:enable='between(t,0,AUDIO_DUR)'[bg];[1:a][bg]amix=inputs=2:duration=longest[aout]
-                audio_filter = f"[0:a]volume=0:enable='between(t,0,{audio_dur})'[bg];[1:a][bg]amix=inputs=2:duration=longest:dropout_transition=0[aout]"
-                cmd_merge = [
-                    "ffmpeg", "-y",
-                    "-i", p_seg_v,
-                    "-i", p_seg_a,
-                    "-filter_complex", audio_filter,
-                    "-map", "0:v", "-map", "[aout]",
-                    "-c:v", "copy", "-c:a", "aac", 
-                    "-t", str(video_dur),
-                    p_seg_out
-                ]
-            else:
-                # 无原声，直接填充静音，保留视频长度
-                # if verbose: print(f"[提示] 片段 {idx+1} 无原声，仅使用TTS")
-                cmd_merge = [
-                    "ffmpeg", "-y",
-                    "-i", p_seg_v,
-                    "-i", p_seg_a,
-                    "-filter_complex", f"[1:a]apad=whole_dur={video_dur}[aout]",
-                    "-map", "0:v", "-map", "[aout]",
-                    "-c:v", "copy", "-c:a", "aac",
-                    "-t", str(video_dur),
-                    p_seg_out
-                ]
-        # 音频更长或相等
-        else:
-            # 这种情况下，视频被拉长或循环，原声可能不连贯，或者我们应该只用 TTS。
-            # 简单起见，只用 TTS。
-            cmd_merge = [
-                "ffmpeg", "-y",
-                "-i", p_seg_v,
-                "-i", p_seg_a,
-                "-map", "0:v", "-map", "1:a",
-                "-c:v", "copy", "-c:a", "aac",
-                "-shortest", 
-                p_seg_out
-            ]
-            
-        try:
-             run_ffmpeg(cmd_merge, verbose=verbose)
-             segment_files.append(p_seg_out)
-        except Exception as e:
-             # Fallback if audio processing fails (e.g. no audio stream in source)
-             if verbose: print(f"[警告] 音频混合失败，尝试仅使用TTS音频: {e}")
-             # try simple merge without original audio
-             fallback_cmd = [
-                "ffmpeg", "-y",
-                "-i", p_seg_v,
-                "-i", p_seg_a,
-                "-filter_complex", f"[1:a]apad=whole_dur={video_dur}[aout]",
-                "-map", "0:v", "-map", "[aout]",
-                "-c:v", "copy", "-c:a", "aac",
-                "-t", str(video_dur),
-                p_seg_out
-             ]
-             run_ffmpeg(fallback_cmd, verbose=verbose)
-             segment_files.append(p_seg_out)
-        
-        # 更新视频时长用于字幕计时
-        video_dur = get_duration(p_seg_out)
-        
-        # D. 记录字幕 (SRT格式)
-        # 格式: 
-        # 1
-        # 00:00:00,000 --> 00:00:05,000
-        # 字幕内容
-        def fmt_srt_time(seconds):
-            m, s = divmod(seconds, 60)
-            h, m = divmod(m, 60)
-            ms = int((s - int(s)) * 1000)
-            return f"{int(h):02d}:{int(m):02d}:{int(s):02d},{ms:03d}"
-            
-        srt_start = fmt_srt_time(current_time_cursor)
-        srt_end = fmt_srt_time(current_time_cursor + video_dur)
-        srt_entries.append(f"{idx+1}\n{srt_start} --> {srt_end}\n{scene['voiceover']}\n")
-        
-        current_time_cursor += video_dur
-
-    # 2. 合并所有片段
-    list_path = os.path.join(TEMP_DIR, "filelist.txt")
-    with open(list_path, "w", encoding="utf-8") as f:
-        for seg in segment_files:
-            # ffmpeg concat demuxer 需要绝对路径或相对路径，注意转义
-            f.write(f"file '{os.path.basename(seg)}'\n")
-            
-    merged_tmp = os.path.join(TEMP_DIR, "merged_tmp.mp4")
-    # Use relative filename since we run with cwd=TEMP_DIR
-    cmd_concat = [
-        "ffmpeg", "-y", "-f", "concat", "-safe", "0",
-        "-i", "filelist.txt",  # relative to TEMP_DIR
-        "-c:v", "libx264", "-preset", "fast", "-crf", "23",
-        "-c:a", "aac", "-b:a", "128k",
-        "merged_tmp.mp4"  # relative to TEMP_DIR
-    ]
-    # 注意：cwd设为TEMP_DIR以便读取 filelist
-    update_progress("合并片段", "正在拼接所有片段...")
-    run_ffmpeg(cmd_concat, verbose=verbose, cwd=TEMP_DIR)
-    
-    # 3. 生成 SRT 文件 (保存备用，但不烧录)
-    srt_path = os.path.join(TEMP_DIR, "subs.srt")
-    with open(srt_path, "w", encoding="utf-8") as f:
-        f.write("\n".join(srt_entries))
-        
-    # 4. 跳过字幕烧录，直接使用合并后的视频作为最终输出
-    import shutil
-    shutil.copy(merged_tmp, final_path)
-    
-    # 导出 SRT
-    final_srt_path = os.path.splitext(final_path)[0] + ".srt"
-    shutil.copy(srt_path, final_srt_path)
-    if verbose:
-        print(f"[导出] 视频: {final_path}")
-        print(f"[导出] 字幕: {final_srt_path}")
-        
-    update_progress("完成", "渲染完成！")
-    
-    # 5. 生成报告
-    if report_log:
-        report_path = "report.txt"
-        with open(report_path, "w", encoding="utf-8") as f:
-            f.write("\n".join(report_log))
-        if verbose:
-            print(f"[提示] 已生成延长报告: {report_path}")
-            
-    return final_path
+# CLI 旧名称
+cli_generate_all_audio = generate_all_audio
 
 # ---------------------------------------------------
 # API
@@ -521,6 +61,7 @@ HTML_CONTENT = r"""
     <title>智能脚本配音剪辑器 v4.0 (含视频导出)</title>
     <link href="https://fonts.googleapis.com/css2?family=Noto+Sans+SC:wght@400;700;900&display=swap" rel="stylesheet">
     <script src="https://cdn.jsdelivr.net/npm/mp4-muxer@5.1.3/build/mp4-muxer.min.js"></script>
+    <script src="https://cdn.jsdelivr.net/npm/mp4box@0.5.2/dist/mp4box.all.min.js"></script>
     <style>
         :root { --bg: #111827; --card: #1f2937; --text: #f3f4f6; --accent: #3b82f6; --success: #10b981; --warn: #f59e0b; --danger: #ef4444; }
         body { background-color: var(--bg); color: var(--text); font-family: "Noto Sans SC", sans-serif; margin: 0; padding: 20px; display: flex; flex-direction: column; height: 100vh; box-sizing: border-box; }
@@ -1220,6 +761,159 @@ HTML_CONTENT = r"""
         alert(`CLI渲染文件已导出！\\n\\n步骤：\\n1. 将下载的 project.json 中 video_path 改为视频绝对路径\\n2. 确保音频文件 audio_*.mp3 在同一目录\\n3. 运行命令：\\n\\n${cliCommand}\\n\\n(命令已复制到剪贴板)`);
     }
     
+    // ========== WebCodecs: 源视频解封装与顺序解码 ==========
+    const DEMUX_READ_SIZE = 4 * 1024 * 1024;
+
+    // 解析 MP4/MOV 的 moov，得到解码配置与样本表；样本数据之后按需读取，不整文件载入内存
+    async function demuxSource(file) {
+        if (typeof MP4Box === 'undefined' || !('VideoDecoder' in window)) return null;
+        const mp4file = MP4Box.createFile();
+        let info = null;
+        let failed = false;
+        mp4file.onReady = (i) => { info = i; };
+        mp4file.onError = () => { failed = true; };
+
+        let offset = 0;
+        while (!info && !failed && offset < file.size) {
+            const buf = await file.slice(offset, offset + DEMUX_READ_SIZE).arrayBuffer();
+            buf.fileStart = offset;
+            const next = mp4file.appendBuffer(buf);
+            // appendBuffer 返回下一个需要的位置，可直接跳过 mdat
+            offset = (next && next > offset) ? next : offset + buf.byteLength;
+        }
+        if (!info || !info.videoTracks.length) return null;
+
+        const track = info.videoTracks[0];
+        const trak = mp4file.getTrackById(track.id);
+        let description;
+        for (const entry of trak.mdia.minf.stbl.stsd.entries) {
+            const box = entry.avcC || entry.hvcC || entry.vpcC || entry.av1C;
+            if (box) {
+                const stream = new DataStream(undefined, 0, DataStream.BIG_ENDIAN);
+                box.write(stream);
+                description = new Uint8Array(stream.buffer, 8); // 去掉 box 头
+                break;
+            }
+        }
+        const config = {
+            codec: track.codec.startsWith('vp08') ? 'vp8' : track.codec,
+            codedWidth: track.video.width,
+            codedHeight: track.video.height,
+            description
+        };
+        const support = await VideoDecoder.isConfigSupported(config);
+        if (!support.supported) return null;
+
+        return {
+            file,
+            config,
+            // 解码顺序的样本表: offset/size 为文件内位置，cts/duration 以 timescale 为单位
+            samples: trak.samples.map(s => ({
+                offset: s.offset, size: s.size, cts: s.cts, duration: s.duration,
+                isKey: s.is_sync, timescale: s.timescale
+            })),
+            block: null // 最近一次读取的文件块 { start, data }
+        };
+    }
+
+    // 读取样本数据：相邻样本通常连续存放，按 4MB 块批量读取
+    async function readSample(demux, s) {
+        let b = demux.block;
+        if (!b || s.offset < b.start || s.offset + s.size > b.start + b.data.byteLength) {
+            const end = Math.min(demux.file.size, s.offset + Math.max(s.size, DEMUX_READ_SIZE));
+            b = demux.block = { start: s.offset, data: await demux.file.slice(s.offset, end).arrayBuffer() };
+        }
+        return new Uint8Array(b.data, s.offset - b.start, s.size);
+    }
+
+    // 顺序解码一个片段，按输出帧率把最近的解码帧交给 emit
+    async function decodeSegmentSequential(demux, seg, segFrames, fps, emit) {
+        const samples = demux.samples;
+        const sec = (s) => s.cts / s.timescale;
+
+        // 片段起点前最近的关键帧，到起点之后的下一个关键帧 (该 GOP 内的重排序帧都已送入)
+        let first = 0;
+        for (let k = 0; k < samples.length; k++) {
+            if (samples[k].isKey && sec(samples[k]) <= seg.start) first = k;
+        }
+        let last = samples.length;
+        for (let k = first + 1; k < samples.length; k++) {
+            if (samples[k].isKey && sec(samples[k]) > seg.end) { last = k; break; }
+        }
+
+        const frameQueue = [];
+        let decodeError = null;
+        const decoder = new VideoDecoder({
+            output: (frame) => frameQueue.push(frame),
+            error: (e) => { decodeError = e; }
+        });
+        decoder.configure(demux.config);
+
+        let next = first;
+        let flushed = false;
+        async function nextFrame() {
+            while (frameQueue.length === 0) {
+                if (decodeError) throw decodeError;
+                if (next < last) {
+                    // 解码队列积压时让出事件循环，等待输出回调
+                    if (decoder.decodeQueueSize > 8) { await new Promise(r => setTimeout(r, 0)); continue; }
+                    const s = samples[next++];
+                    decoder.decode(new EncodedVideoChunk({
+                        type: s.isKey ? 'key' : 'delta',
+                        timestamp: Math.round(s.cts * 1e6 / s.timescale),
+                        duration: Math.round(s.duration * 1e6 / s.timescale),
+                        data: await readSample(demux, s)
+                    }));
+                } else if (!flushed) {
+                    flushed = true;
+                    await decoder.flush();
+                } else {
+                    return null;
+                }
+            }
+            return frameQueue.shift();
+        }
+
+        let current = null;
+        let pending = await nextFrame();
+        try {
+            for (let f = 0; f < segFrames; f++) {
+                const t = (seg.start + f / fps) * 1e6;
+                // 跳过起点之前的帧；多个源帧落在同一输出帧内时取最后一个
+                while (pending && (pending.timestamp <= t || !current)) {
+                    if (current) current.close();
+                    current = pending;
+                    pending = await nextFrame();
+                }
+                if (current) await emit(current);
+            }
+        } finally {
+            if (current) current.close();
+            if (pending) pending.close();
+            frameQueue.forEach(fr => fr.close());
+            decoder.close();
+        }
+    }
+
+    // 回退方式：逐帧设置 <video>.currentTime 后绘制
+    async function drawSegmentBySeeking(seg, segFrames, fps, emit) {
+        video.currentTime = seg.start;
+        await new Promise(r => {
+            const onSeeked = () => { video.removeEventListener('seeked', onSeeked); r(); };
+            video.addEventListener('seeked', onSeeked);
+        });
+        for (let f = 0; f < segFrames; f++) {
+            const videoTime = seg.start + (f / fps);
+            if (Math.abs(video.currentTime - videoTime) > 0.001) {
+                video.currentTime = videoTime;
+            }
+            while (video.readyState < 2) {
+                await new Promise(r => setTimeout(r, 10));
+            }
+            await emit(video);
+        }
+    }
+
     // ========== WebCodecs 浏览器渲染器 (优化版) ==========
     async function startWebCodecsRender() {
         if (!selectedVideoFile) { alert("请先上传视频文件！"); return; }
@@ -1360,6 +1054,58 @@ HTML_CONTENT = r"""
         // 视频静音，我们自己处理音频
         video.muted = true;
         
+        // 解封装源视频一次，后续各片段顺序解码
+        updateRenderProgress(10, "解析源视频...", "");
+        let demux = null;
+        try {
+            demux = await demuxSource(selectedVideoFile);
+        } catch (e) {
+            console.warn("解封装失败，回退到 seek 模式:", e);
+        }
+        if (!demux) console.warn("源视频无法顺序解码，使用 seek 模式 (较慢)");
+        
+        // 绘制一帧 (叠加字幕) 并送入编码器
+        async function emitFrame(source, sceneIndex) {
+            ctx.drawImage(source, 0, 0, targetWidth, targetHeight);
+            
+            // 绘制字幕
+            ctx.font = `bold ${Math.floor(targetHeight / 15)}px "Noto Sans SC", sans-serif`;
+            ctx.textAlign = 'center';
+            ctx.fillStyle = 'white';
+            ctx.strokeStyle = 'black';
+            ctx.lineWidth = 4;
+            ctx.lineJoin = 'round';
+            const text = scriptData[sceneIndex].voiceover;
+            const textY = targetHeight - targetHeight * 0.1;
+            ctx.strokeText(text, targetWidth / 2, textY);
+            ctx.fillText(text, targetWidth / 2, textY);
+            
+            // 编码器积压时等待，渲染速度由编码器决定
+            while (videoEncoder.encodeQueueSize > 30) {
+                await new Promise(r => setTimeout(r, 1));
+            }
+            
+            // 从 Canvas 创建 VideoFrame
+            const frame = new VideoFrame(canvas, {
+                timestamp: globalFrameIndex * (1_000_000 / fps)
+            });
+            videoEncoder.encode(frame, { keyFrame: globalFrameIndex % (fps * 2) === 0 });
+            frame.close(); // 必须关闭以释放显存
+            
+            globalFrameIndex++;
+            
+            // 每10帧更新一次UI，避免卡顿
+            if (globalFrameIndex % 10 === 0) {
+                 const progress = 10 + (globalFrameIndex / totalFrames) * 85;
+                 const elapsed = (Date.now() - renderStartTime) / 1000;
+                 const speed = globalFrameIndex / elapsed;
+                 const remaining = (totalFrames - globalFrameIndex) / speed;
+                 updateRenderProgress(progress, `渲染帧 ${globalFrameIndex}/${totalFrames} (${Math.round(speed)} fps)`, `片段 ${sceneIndex+1}/${scriptData.length}${demux ? '' : ' (seek)'}`, remaining);
+                 // 让出主线程
+                 await new Promise(r => setTimeout(r, 0));
+            }
+        }
+        
         for (let i = 0; i < segmentInfos.length; i++) {
             const seg = segmentInfos[i];
             const segFrames = Math.ceil(seg.duration * fps);
@@ -1441,72 +1187,12 @@ HTML_CONTENT = r"""
             }
             
             // --- 视频处理 ---
-            // 预加载 seek 优化
-            // 使用 requestVideoFrameCallback 并不是 seek 的替代，我们还是需要 seek
-            // 优化：只有当时间跨度大时才等待 seeked，连续帧通常很快
-            
-            video.currentTime = seg.start;
-            // 初始 seek
-             await new Promise(r => {
-                const onSeeked = () => { video.removeEventListener('seeked', onSeeked); r(); };
-                video.addEventListener('seeked', onSeeked);
-            });
-            
-            for (let f = 0; f < segFrames; f++) {
-                const videoTime = seg.start + (f / fps);
-                // 只有当时间变动超过阈值才设置 currentTime (浏览器自己会插值?)
-                // 不，我们需要精确帧。为了速度，我们可以容忍少量时间误差? 为了质量不行。
-                // 技巧：不要每次都 seek，而是播放 video，然后抓取？
-                // 不行，播放速度不可控。
-                // 方法：设置 currentTime，如果 gap 很小，浏览器可能不需要触发 seeked
-                
-                if (Math.abs(video.currentTime - videoTime) > 0.001) {
-                    video.currentTime = videoTime;
-                }
-                
-                // 快速等待
-                // 在Chrome中，设置currentTime后，数据不一定立即更新。
-                // 但对于本地文件，通常很快。
-                // 我们用一个小技巧：等待 video.readyState >= 2
-                while (video.readyState < 2) {
-                    await new Promise(r => setTimeout(r, 10));
-                }
-                
-                // 绘制到 Canvas 以便添加字幕
-                ctx.drawImage(video, 0, 0, targetWidth, targetHeight);
-                
-                // 绘制字幕
-                ctx.font = `bold ${Math.floor(targetHeight / 15)}px "Noto Sans SC", sans-serif`;
-                ctx.textAlign = 'center';
-                ctx.fillStyle = 'white';
-                ctx.strokeStyle = 'black';
-                ctx.lineWidth = 4;
-                ctx.lineJoin = 'round';
-                const text = scriptData[i].voiceover;
-                const textY = targetHeight - targetHeight * 0.1;
-                ctx.strokeText(text, targetWidth / 2, textY);
-                ctx.fillText(text, targetWidth / 2, textY);
-                
-                // 从 Canvas 创建 VideoFrame
-                const frame = new VideoFrame(canvas, {
-                    timestamp: globalFrameIndex * (1_000_000 / fps)
-                });
-                
-                videoEncoder.encode(frame);
-                frame.close(); // 必须关闭以释放显存
-                
-                globalFrameIndex++;
-                
-                // 每10帧更新一次UI，避免卡顿
-                if (globalFrameIndex % 10 === 0) {
-                     const progress = 10 + (globalFrameIndex / totalFrames) * 85;
-                     const elapsed = (Date.now() - renderStartTime) / 1000;
-                     const speed = globalFrameIndex / elapsed;
-                     const remaining = (totalFrames - globalFrameIndex) / speed;
-                     updateRenderProgress(progress, `渲染帧 ${globalFrameIndex}/${totalFrames} (${Math.round(speed)} fps)`, `片段 ${i+1}/${scriptData.length}`, remaining);
-                     // 让出主线程
-                     await new Promise(r => setTimeout(r, 0));
-                }
+            // MP4/MOV: 顺序解码 (从片段前最近的关键帧开始送入 VideoDecoder，无需逐帧 seek)
+            // 其他容器 (如 MKV) MP4Box 无法解析时回退到 <video> seek 方式
+            if (demux) {
+                await decodeSegmentSequential(demux, seg, segFrames, fps, (source) => emitFrame(source, i));
+            } else {
+                await drawSegmentBySeeking(seg, segFrames, fps, (source) => emitFrame(source, i));
             }
         }
         
@@ -1564,6 +1250,63 @@ HTML_CONTENT = r"""
         console.log(`[渲染] ${Math.round(percent)}% - ${label} - ${detail}`);
     }
 
+    // ========== 源视频分块上传 (可续传，服务器按 SHA-256 去重) ==========
+    function getSourceFingerprint(file) {
+        return `${file.name}|${file.size}|${file.lastModified}`;
+    }
+
+    async function uploadSourceVideo(file, onProgress) {
+        const fingerprint = getSourceFingerprint(file);
+        const storageKey = 'sourceId:' + fingerprint;
+
+        // 1. 同一文件已上传过: 确认服务器仍保留后直接引用
+        const knownId = localStorage.getItem(storageKey);
+        if (knownId) {
+            const res = await fetch(`/sources/${knownId}`);
+            if (res.ok && (await res.json()).exists) return knownId;
+            localStorage.removeItem(storageKey);
+        }
+
+        // 2. 创建或恢复上传会话
+        const res = await fetch('/sources/uploads', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ filename: file.name, size: file.size, fingerprint })
+        });
+        if (!res.ok) throw new Error("创建上传会话失败");
+        const session = await res.json();
+        if (session.exists) {
+            localStorage.setItem(storageKey, session.source_id);
+            return session.source_id;
+        }
+
+        // 3. 只上传缺失的分块
+        const received = new Set(session.received);
+        let done = received.size;
+        for (let i = 0; i < session.total_chunks; i++) {
+            if (received.has(i)) continue;
+            const start = i * session.chunk_size;
+            const chunk = file.slice(start, Math.min(start + session.chunk_size, file.size));
+            let ok = false;
+            for (let attempt = 0; attempt < 3 && !ok; attempt++) {
+                try {
+                    const r = await fetch(`/sources/uploads/${session.upload_id}/${i}`, { method: 'PUT', body: chunk });
+                    ok = r.ok;
+                } catch {}
+            }
+            if (!ok) throw new Error(`分块 ${i+1}/${session.total_chunks} 上传失败`);
+            done++;
+            if (onProgress) onProgress(done, session.total_chunks);
+        }
+
+        // 4. 完成: 服务器校验哈希并入库
+        const fin = await fetch(`/sources/uploads/${session.upload_id}/complete`, { method: 'POST' });
+        if (!fin.ok) throw new Error("源视频入库失败");
+        const { source_id } = await fin.json();
+        localStorage.setItem(storageKey, source_id);
+        return source_id;
+    }
+
     // ========== FFmpeg 服务器渲染 ==========
     async function startRenderExport() {
         if (!selectedVideoFile) { alert("请先上传视频文件！"); return; }
@@ -1606,6 +1349,17 @@ HTML_CONTENT = r"""
         loaderTitle.innerText = "正在服务器渲染...";
         loaderMsg.innerText = "上传素材中...";
         
+        let sourceId;
+        try {
+            sourceId = await uploadSourceVideo(selectedVideoFile, (done, total) => {
+                loaderMsg.innerText = `上传源视频 ${done}/${total}`;
+            });
+        } catch (e) {
+            showLoader(false);
+            alert("源视频上传失败: " + e.message);
+            return;
+        }
+
         // Start progress polling
         let progressInterval = setInterval(async () => {
             try {
@@ -1613,13 +1367,17 @@ HTML_CONTENT = r"""
                 if (pRes.ok) {
                     const pData = await pRes.json();
                     loaderMsg.innerText = `${pData.step}: ${pData.detail}`;
+                    if (pData.live) {
+                        loaderMsg.innerText += `\n边渲染边预览: ${location.origin}${pData.live}`;
+                    }
                 }
             } catch {}
         }, 500);
 
         const formData = new FormData();
-        formData.append("video_file", selectedVideoFile);
+        formData.append("source_id", sourceId);
         formData.append("script_json", JSON.stringify(scriptData));
+        formData.append("progressive", "hls");
         
         // 将所有音频按顺序加入 FormData (Map 遍历顺序通常是插入顺序，但为了保险我们按索引遍历)
         for(let i=0; i<scriptData.length; i++) { 
@@ -1922,6 +1680,9 @@ HTML_CONTENT = r"""
 # 路由定义
 # ==========================================
 
+# 渐进式输出的 HLS 列表与分片
+app.mount("/render_live", StaticFiles(directory=LIVE_DIR), name="render_live")
+
 @app.get("/", response_class=HTMLResponse)
 async def index():
     return HTML_CONTENT
@@ -1941,10 +1702,231 @@ async def generate_tts(
     return StreamingResponse(audio_stream, media_type="audio/mpeg")
 
 
+# ---------------------------------------------------
+# 源视频仓库: 分块 / 可续传 / SHA-256 去重上传
+# ---------------------------------------------------
+# 流程:
+#   1. GET  /sources/{sha256}                 -> 已存在则直接引用，无需上传
+#   2. POST /sources/uploads                  -> 创建或恢复上传会话，返回已收到的分块
+#   3. PUT  /sources/uploads/{upload_id}/{n}  -> 上传第 n 块 (可乱序、可重传)
+#   4. POST /sources/uploads/{upload_id}/complete -> 校验哈希，入库，返回 source_id
+# 渲染时 /render_video 传 source_id 即可，不再每次上传整部影片。
+
+_HEX_ID = re.compile(r"^[0-9a-f]{16,64}$")
+
+def _upload_paths(upload_id):
+    if not _HEX_ID.match(upload_id or ""):
+        raise HTTPException(status_code=400, detail="无效的 upload_id")
+    base = os.path.join(UPLOAD_DIR, upload_id)
+    return base + ".part", base + ".json"
+
+# 以下文件操作都在线程中执行 (asyncio.to_thread)，不阻塞事件循环；
+# 元数据的读-改-写由锁保护，避免并发分块互相覆盖 received 列表
+_upload_lock = threading.Lock()
+
+def _load_upload(upload_id):
+    part_path, meta_path = _upload_paths(upload_id)
+    if not os.path.exists(meta_path):
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f), part_path, meta_path
+
+def _save_upload(meta, meta_path):
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, meta_path)
+
+def _open_upload(upload_id, meta):
+    """已有会话返回其元数据，否则预分配文件 (分块可按任意顺序写入) 并保存 meta"""
+    part_path, meta_path = _upload_paths(upload_id)
+    with _upload_lock:
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        with open(part_path, "wb") as f:
+            f.truncate(meta["size"])
+        _save_upload(meta, meta_path)
+        return meta
+
+def _write_chunk(upload_id, index, offset, data):
+    """写入分块并记入 received，返回已收到的分块数"""
+    part_path, meta_path = _upload_paths(upload_id)
+    try:
+        with open(part_path, "r+b") as f:
+            f.seek(offset)
+            f.write(data)
+    except FileNotFoundError:
+        # 会话已完成或过期
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    with _upload_lock:
+        meta, _, _ = _load_upload(upload_id)
+        if index not in meta["received"]:
+            meta["received"].append(index)
+            _save_upload(meta, meta_path)
+        return len(meta["received"])
+
+def _finish_upload(upload_id, digest):
+    """校验并入库已到齐的上传 (digest 为 .part 的 SHA-256)，删除会话，返回元数据
+
+    在锁内重新读取元数据再判断，并发的 complete、过期清理或迟到的分块不会让文件被移动/删除两次。
+    """
+    with _upload_lock:
+        meta, part_path, meta_path = _load_upload(upload_id)
+        total_chunks = math.ceil(meta["size"] / meta["chunk_size"])
+        missing = sorted(set(range(total_chunks)) - set(meta["received"]))
+        if missing:
+            raise HTTPException(status_code=409, detail={"missing": missing})
+        if meta.get("sha256") and meta["sha256"] != digest:
+            os.remove(part_path)
+            os.remove(meta_path)
+            raise HTTPException(status_code=422, detail="SHA-256 校验失败，请重新上传")
+        if get_source_path(digest):
+            os.remove(part_path)
+        else:
+            os.replace(part_path, os.path.join(SOURCE_DIR, f"{digest}.src"))
+        os.remove(meta_path)
+        return meta
+
+def _expire_uploads(now=None):
+    """删除闲置超过 UPLOAD_TTL 的上传会话 (.part、元数据及其临时文件)，返回删除的会话数"""
+    now = now or time.time()
+    expired = 0
+    with _upload_lock:
+        for upload_id in {name.split(".", 1)[0] for name in os.listdir(UPLOAD_DIR)}:
+            base = os.path.join(UPLOAD_DIR, upload_id)
+            paths = [p for p in (base + ".part", base + ".json", base + ".json.tmp") if os.path.exists(p)]
+            try:
+                # 每个分块都会写 .part 并更新元数据，最新的修改时间即最后活动时间
+                if not paths or now - max(os.path.getmtime(p) for p in paths) <= config.UPLOAD_TTL:
+                    continue
+                for path in paths:
+                    os.remove(path)
+            except OSError:
+                continue
+            expired += 1
+    return expired
+
+@app.get("/sources/{source_id}")
+async def get_source(source_id: str):
+    """查询源视频是否已在服务器 (source_id 即文件 SHA-256)"""
+    path = get_source_path(source_id.lower())
+    if not path:
+        return {"exists": False}
+    return {"exists": True, "source_id": source_id.lower(), "size": os.path.getsize(path)}
+
+@app.post("/sources/uploads")
+async def create_source_upload(
+    filename: str = Body(..., embed=True),
+    size: int = Body(..., embed=True),
+    sha256: str = Body(None, embed=True),
+    fingerprint: str = Body(None, embed=True)
+):
+    """
+    创建 (或恢复) 分块上传会话
+    
+    sha256: 客户端已知的文件哈希，命中仓库则直接返回 source_id
+    fingerprint: 客户端文件标识 (如 name|size|mtime)，用于刷新页面后续传同一会话
+    """
+    if sha256:
+        sha256 = sha256.lower()
+        if get_source_path(sha256):
+            return {"exists": True, "source_id": sha256}
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="文件大小无效")
+    if size > config.UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"文件过大 (上限 {config.UPLOAD_MAX_BYTES // 1024 ** 2} MB)")
+    
+    # 顺带清理过期会话，未完成的上传不会一直占用磁盘
+    await asyncio.to_thread(_expire_uploads)
+    key = sha256 or fingerprint or f"{filename}|{size}|{os.urandom(8).hex()}"
+    upload_id = hashlib.sha256(f"{key}|{size}".encode("utf-8")).hexdigest()[:32]
+    meta = await asyncio.to_thread(_open_upload, upload_id, {
+        "filename": filename,
+        "size": size,
+        "sha256": sha256,
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+        "received": []
+    })
+    
+    total_chunks = math.ceil(meta["size"] / meta["chunk_size"])
+    return {
+        "exists": False,
+        "upload_id": upload_id,
+        "chunk_size": meta["chunk_size"],
+        "total_chunks": total_chunks,
+        "received": meta["received"]
+    }
+
+@app.put("/sources/uploads/{upload_id}/{index}")
+async def upload_source_chunk(upload_id: str, index: int, request: Request):
+    """写入单个分块 (请求体为原始字节)"""
+    meta, _, _ = await asyncio.to_thread(_load_upload, upload_id)
+    chunk_size = meta["chunk_size"]
+    total_chunks = math.ceil(meta["size"] / chunk_size)
+    if index < 0 or index >= total_chunks:
+        raise HTTPException(status_code=400, detail="分块序号越界")
+    
+    offset = index * chunk_size
+    expected = min(chunk_size, meta["size"] - offset)
+    # 分块不超过 UPLOAD_CHUNK_SIZE，先收进内存，再在线程中一次写入
+    data = bytearray()
+    async for piece in request.stream():
+        if len(data) + len(piece) > expected:
+            raise HTTPException(status_code=400, detail="分块大小不符")
+        data += piece
+    if len(data) != expected:
+        raise HTTPException(status_code=400, detail=f"分块不完整: {len(data)}/{expected}")
+    
+    received = await asyncio.to_thread(_write_chunk, upload_id, index, offset, data)
+    return {"received": received, "total_chunks": total_chunks}
+
+@app.get("/sources/uploads/{upload_id}")
+async def get_source_upload(upload_id: str):
+    """查询上传进度，用于断点续传"""
+    meta, _, _ = await asyncio.to_thread(_load_upload, upload_id)
+    return {
+        "upload_id": upload_id,
+        "chunk_size": meta["chunk_size"],
+        "total_chunks": math.ceil(meta["size"] / meta["chunk_size"]),
+        "received": sorted(meta["received"])
+    }
+
+@app.post("/sources/uploads/{upload_id}/complete")
+async def complete_source_upload(upload_id: str):
+    """所有分块到齐后校验 SHA-256 并入库 (已存在相同内容则直接复用)"""
+    meta, part_path, _ = await asyncio.to_thread(_load_upload, upload_id)
+    total_chunks = math.ceil(meta["size"] / meta["chunk_size"])
+    missing = sorted(set(range(total_chunks)) - set(meta["received"]))
+    if missing:
+        raise HTTPException(status_code=409, detail={"missing": missing})
+    
+    # 哈希整个文件耗时较长，不持锁；之后的复核、入库与删除在 _finish_upload 中持锁完成
+    try:
+        digest = await asyncio.to_thread(sha256_file, part_path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="上传会话不存在")
+    meta = await asyncio.to_thread(_finish_upload, upload_id, digest)
+    return {"source_id": digest, "size": meta["size"]}
+
 @app.post("/render_video")
 async def render_video_final(
-    video_file: UploadFile = File(...),
+    video_file: UploadFile = File(None),
     script_json: str = Form(...),
+    # 已通过 /sources/uploads 入库的源视频 ID，提供时无需再上传 video_file
+    source_id: str = Form(None),
+    # 'hls': 渲染过程中在 /render_live/index.m3u8 边渲染边发布
+    progressive: str = Form(None),
+    # JSON 数组，如 ["360p", "720p", "1080p"]: 一次渲染输出多档分辨率 (打包为 zip 返回)
+    renditions: str = Form(None),
+    # 在最终合并编码中烧录字幕
+    burn_subtitles: bool = Form(False),
+    # JSON {场景索引: [{start, end, text}]}: 逐词计时，用于切分短字幕
+    word_timings: str = Form(None),
+    # 记录性能剖析，完成后可从 /render_trace 下载
+    profile: bool = Form(False),
+    # 相同输入直接返回缓存的成品 (见 RenderCache)
+    use_cache: bool = Form(True),
     # 接收文件列表
     audio_files: List[UploadFile] = File(None) 
     # 注意：前端必须把所有 blob append 到 'audio_files' 这个同一个 key 下
@@ -1952,39 +1934,116 @@ async def render_video_final(
     # 这里修改后端去适配前端的 key pattern 比较困难，我们修改上面的 JS 代码吗？
     # 不，我们直接用 request.form() 读取
 ):
-    # 保存视频源
-    src_video_path = os.path.join(TEMP_DIR, "source_video.mp4")
-    with open(src_video_path, "wb") as f:
-        shutil.copyfileobj(video_file.file, f)
+    # render_core 的中间文件、成品、进度与直播分片都在共享的 TEMP_DIR 中，同一时间只能有一个渲染;
+    # 进度查询与直播分片不加锁，渲染期间照常响应
+    async with _render_lock:
+        # 视频源: 优先引用仓库中的源视频，否则保存本次上传的文件
+        if source_id:
+            src_video_path = get_source_path(source_id.lower())
+            if not src_video_path:
+                return HTMLResponse(content=f"Render Failed: 源视频不存在 {source_id}", status_code=404)
+        elif video_file is not None:
+            src_video_path = os.path.join(TEMP_DIR, "source_video.mp4")
+            with open(src_video_path, "wb") as f:
+                shutil.copyfileobj(video_file.file, f)
+        else:
+            return HTMLResponse(content="Render Failed: 缺少 video_file 或 source_id", status_code=400)
     
-    # 解析脚本
-    script_data = json.loads(script_json)
+        # 解析脚本
+        script_data = json.loads(script_json)
+        rendition_list = json.loads(renditions) if renditions else None
     
-    # 保存音频文件到 dict: index -> path
-    # 由于 UploadFile 列表顺序可能和 append 顺序一致，但为了保险，前端应该按顺序 append
-    # 或者前端全部 append 到 'audio_files' 列表里
-    # 我们假设前端代码修改为 formData.append("audio_files", blob)
+        # 保存音频文件到 dict: index -> path
+        # 由于 UploadFile 列表顺序可能和 append 顺序一致，但为了保险，前端应该按顺序 append
+        # 或者前端全部 append 到 'audio_files' 列表里
+        # 我们假设前端代码修改为 formData.append("audio_files", blob)
     
-    saved_audio_paths = {}
+        saved_audio_paths = {}
     
-    # 如果前端还是 audio_0, audio_1... 我们无法通过参数直接获取，需要用 request
-    # 为了保证代码能跑，我们在 HTML 里修改 JS逻辑：formData.append('audio_files', val.blob)
-    # 并确保顺序
+        # 如果前端还是 audio_0, audio_1... 我们无法通过参数直接获取，需要用 request
+        # 为了保证代码能跑，我们在 HTML 里修改 JS逻辑：formData.append('audio_files', val.blob)
+        # 并确保顺序
     
-    if audio_files:
-        for i, af in enumerate(audio_files):
-            p = os.path.join(TEMP_DIR, f"upload_a_{i}.mp3")
-            with open(p, "wb") as f:
-                shutil.copyfileobj(af.file, f)
-            saved_audio_paths[str(i)] = p
+        if audio_files:
+            for i, af in enumerate(audio_files):
+                p = os.path.join(TEMP_DIR, f"upload_a_{i}.mp3")
+                with open(p, "wb") as f:
+                    shutil.copyfileobj(af.file, f)
+                saved_audio_paths[str(i)] = p
             
-    # 开始 FFmpeg 处理
-    try:
-        final_video_path = process_render(src_video_path, script_data, saved_audio_paths)
-        return FileResponse(final_video_path, filename="rendered_video.mp4", media_type="video/mp4")
-    except Exception as e:
-        print(f"Render Error: {e}")
-        return HTMLResponse(content=f"Render Failed: {e}", status_code=500)
+        word_timing_data = json.loads(word_timings) if word_timings else None
+        output_renditions = rendition_list or ["native"]
+    
+        def render_response(videos, cache_status, rendered=False):
+            # 响应在释放锁之后才发送: 本次渲染的成品 (rendered) 与 zip 放进本请求专属的目录，
+            # 以免被下一个渲染覆盖，发送完成后删除
+            headers = {"X-Render-Cache": cache_status}
+            delivery_dir = tempfile.mkdtemp(prefix="delivery_", dir=TEMP_DIR)
+            cleanup = BackgroundTask(shutil.rmtree, delivery_dir, ignore_errors=True)
+            if rendered:
+                videos = dict(videos)
+                for r in output_renditions:
+                    moved = os.path.join(delivery_dir, f"rendered_video_{r}.mp4")
+                    os.replace(videos[r], moved)
+                    videos[r] = moved
+            if len(output_renditions) > 1:
+                # 视频已压缩，zip 只做打包 (ZIP_STORED)
+                zip_path = os.path.join(delivery_dir, "renditions.zip")
+                with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_STORED) as zf:
+                    for r in output_renditions:
+                        zf.write(videos[r], f"rendered_video_{r}.mp4")
+                return FileResponse(zip_path, filename="rendered_videos.zip", media_type="application/zip",
+                                    headers=headers, background=cleanup)
+            return FileResponse(videos[output_renditions[0]], filename="rendered_video.mp4", media_type="video/mp4",
+                                headers=headers, background=cleanup)
+    
+        # 查询成品缓存 (语音由浏览器生成，用音频内容哈希代替 voice/rate)
+        cache_key = None
+        if use_cache:
+            source_hash = source_id.lower() if source_id else await asyncio.to_thread(sha256_file, src_video_path)
+            audio_hashes = {}
+            for idx, p in saved_audio_paths.items():
+                audio_hashes[idx] = await asyncio.to_thread(sha256_file, p)
+            cache_key = render_fingerprint(
+                source_hash, script_data, audio_hashes=audio_hashes, resolution="native", cut_method="pad",
+                renditions=rendition_list, burn_subtitles=burn_subtitles, word_timings=word_timing_data
+            )
+            cached = render_cache.get(cache_key)
+            if cached:
+                print(f"[缓存] 命中 {cache_key[:12]}，直接返回成品")
+                return render_response({r: cached[f"video_{r}"] for r in output_renditions}, "hit")
+    
+        # 开始 FFmpeg 处理
+        profiler = RenderProfiler(enabled=profile)
+        try:
+            # 在线程中渲染，避免阻塞事件循环 (进度查询与直播分片需要同时响应)
+            await asyncio.to_thread(
+                process_render, src_video_path, script_data, saved_audio_paths,
+                progressive=progressive, renditions=rendition_list,
+                burn_subtitles=burn_subtitles, word_timings=word_timing_data,
+                profiler=profiler
+            )
+            if profile:
+                print(profiler.export(os.path.join(TEMP_DIR, "render_trace.json")))
+            base_path = os.path.join(TEMP_DIR, "final_output.mp4")
+            videos = {r: get_rendition_path(base_path, r, output_renditions) for r in output_renditions}
+            if cache_key:
+                try:
+                    await asyncio.to_thread(cache_render_outputs, cache_key, output_renditions)
+                except OSError as e:
+                    print(f"[缓存] 写入失败: {e}")
+            return render_response(videos, "miss" if cache_key else "bypass", rendered=True)
+        except Exception as e:
+            print(f"Render Error: {e}")
+            return HTMLResponse(content=f"Render Failed: {e}", status_code=500)
+
+@app.get("/render_trace")
+async def get_render_trace():
+    """下载最近一次 profile 渲染的 Chrome trace"""
+    trace_path = os.path.join(TEMP_DIR, "render_trace.json")
+    if not os.path.exists(trace_path):
+        return HTMLResponse(content="No trace", status_code=404)
+    return FileResponse(trace_path, filename="render_trace.json", media_type="application/json")
 
 @app.get("/render_progress")
 async def get_render_progress():
@@ -1996,7 +2055,10 @@ async def get_render_progress():
                 content = f.read().strip()
                 if "|" in content:
                     step, detail = content.split("|", 1)
-                    return {"step": step, "detail": detail}
+                    progress = {"step": step, "detail": detail}
+                    if os.path.exists(os.path.join(LIVE_DIR, LIVE_PLAYLIST)):
+                        progress["live"] = f"/render_live/{LIVE_PLAYLIST}"
+                    return progress
         return {"step": "等待中", "detail": "准备开始..."}
     except:
         return {"step": "处理中", "detail": "..."}
@@ -2006,139 +2068,6 @@ async def get_render_progress():
 # CLI Mode Functions
 # ==========================================
 
-async def generate_tts_audio(text: str, voice: str, rate: str, output_path: str, max_retries: int = 3):
-    """Generate TTS audio with retry logic"""
-    for attempt in range(max_retries):
-        try:
-            communicate = edge_tts.Communicate(text, voice, rate=rate)
-            await communicate.save(output_path)
-            return True
-        except Exception as e:
-            if attempt < max_retries - 1:
-                await asyncio.sleep(2)  # Wait before retry
-            else:
-                print(f"[TTS 错误] 生成失败: {str(e)[:50]}")
-                raise
-
-async def cli_generate_all_audio(script_data: list, voice: str, rate: str, output_dir: str):
-    """Generate all TTS audio files with limited concurrency"""
-    semaphore = asyncio.Semaphore(5)  # Limit to 5 concurrent requests
-    
-    async def generate_one(idx, scene):
-        async with semaphore:
-            output_path = os.path.join(output_dir, f"audio_{idx}.mp3")
-            print(f"[TTS] 生成语音 {idx+1}/{len(script_data)}: {scene['voiceover'][:30]}...")
-            await generate_tts_audio(scene['voiceover'], voice, rate, output_path)
-    
-    tasks = [generate_one(idx, scene) for idx, scene in enumerate(script_data)]
-    await asyncio.gather(*tasks)
-    print(f"[TTS] 所有 {len(script_data)} 个语音生成完成!")
-    
-    # Return paths dict
-    return {str(i): os.path.join(output_dir, f"audio_{i}.mp3") for i in range(len(script_data))}
-
-def render_from_project(project_path: str, output_path: str = None):
-    """CLI: Render video from project file"""
-    print(f"\n{'='*50}")
-    print("智能配音剪辑器 - CLI 渲染模式")
-    print(f"{'='*50}\n")
-    
-    # Load project
-    print(f"[加载] 读取工程文件: {project_path}")
-    with open(project_path, "r", encoding="utf-8") as f:
-        project = json.load(f)
-    
-    # 智能获取视频路径
-    video_path = project.get("video_path", "")
-    if not video_path or not os.path.exists(video_path):
-        # 尝试同名视频
-        base_name = os.path.splitext(project_path)[0]
-        auto_video = base_name + ".mp4"
-        if os.path.exists(auto_video):
-            video_path = auto_video
-            print(f"[自动] 找到同名视频: {video_path}")
-        else:
-            # 尝试当前目录的mp4
-            mp4_files = [f for f in os.listdir(os.path.dirname(project_path) or '.') if f.endswith('.mp4')]
-            if mp4_files:
-                video_path = os.path.join(os.path.dirname(project_path) or '.', mp4_files[0])
-                print(f"[自动] 使用目录下第一个视频: {video_path}")
-    
-    # 默认yunxi语音
-    voice = project.get("voice", "zh-CN-YunxiNeural")
-    if not voice:
-        voice = "zh-CN-YunxiNeural"
-    rate = project.get("rate", "+0%")
-    resolution = project.get("resolution", "native")
-    
-    # 智能提取脚本
-    script_data = []
-    if "script_content" in project:
-        for part in project["script_content"]:
-            if isinstance(part, dict) and "scenes" in part:
-                script_data.extend(part["scenes"])
-            elif isinstance(part, dict):
-                script_data.append(part)
-    elif "script" in project:
-        script_data = project["script"]
-    elif "scenes" in project:
-        script_data = project["scenes"]
-    elif isinstance(project, list):
-        script_data = project
-    
-    if not script_data:
-        print("[错误] 无法找到脚本数据")
-        sys.exit(1)
-    
-    if not os.path.exists(video_path):
-        print(f"[错误] 视频文件不存在: {video_path}")
-        sys.exit(1)
-    
-    print(f"[视频] {video_path}")
-    print(f"[语音] {voice} @ {rate}")
-    print(f"[片段] {len(script_data)} 个场景")
-    
-    # 获取视频实际时长并过滤超时片段
-    video_duration = get_duration(video_path)
-    print(f"[视频时长] {video_duration:.1f} 秒 ({video_duration/60:.1f} 分钟)")
-    
-    def parse_time(t_str):
-        p = list(map(float, t_str.split(':')))
-        if len(p) == 2:
-            return p[0]*60 + p[1]
-        elif len(p) == 3:
-            return p[0]*3600 + p[1]*60 + p[2]
-        return 0
-    
-    
-    # 显示视频信息（不过滤，由切割阶段自动适应）
-    print(f"[片段] {len(script_data)} 个场景（超时片段将自动适应）\n")
-    
-    # Ensure temp dir
-    if os.path.exists(TEMP_DIR):
-        shutil.rmtree(TEMP_DIR)
-    os.makedirs(TEMP_DIR, exist_ok=True)
-    
-    # Generate all TTS audio
-    print("[阶段1] 生成语音...")
-    audio_paths = asyncio.run(cli_generate_all_audio(script_data, voice, rate, TEMP_DIR))
-    
-    # Run FFmpeg render
-    print("\n[阶段2] FFmpeg 渲染...")
-    print(f"[分辨率] {resolution}")
-    final_video = process_render(video_path, script_data, audio_paths, verbose=True, resolution=resolution)
-    
-    # Copy to output
-    if output_path is None:
-        output_path = os.path.splitext(os.path.basename(video_path))[0] + "_rendered.mp4"
-    
-    shutil.copy(final_video, output_path)
-    print(f"\n[完成] 输出文件: {os.path.abspath(output_path)}")
-    
-    # Cleanup
-    shutil.rmtree(TEMP_DIR)
-    print("[清理] 临时文件已删除\n")
-
 def create_sample_project(output_path: str):
     """Create a sample project file"""
     sample = {
@@ -2309,19 +2238,25 @@ if __name__ == "__main__":
   python app.py --check script.json      # 检测脚本格式
   python app.py --export sample.json     # 导出示例工程文件
   python app.py --render project.json -o output.mp4  # 指定输出文件
+  python app.py --render project.json --profile      # 输出 render_trace.json 性能剖析
+  python app.py --render project.json --no-cache     # 忽略成品缓存重新渲染
+  python app.py --render project.json --jobs 4       # 4 个场景并行渲染
         """
     )
     parser.add_argument("--render", "-r", metavar="PROJECT", help="从工程文件渲染视频 (CLI模式)")
     parser.add_argument("--output", "-o", metavar="FILE", help="输出文件路径 (配合 --render 使用)")
     parser.add_argument("--export", "-e", metavar="FILE", help="导出示例工程文件")
     parser.add_argument("--check", "-c", metavar="SCRIPT", help="检测脚本文件格式")
+    # --jobs/--preset/--profile/--no-cache/--keep-temp (配合 --render 使用)
+    add_tuning_arguments(parser)
     
     args = parser.parse_args()
     
     if args.check:
         check_script(args.check)
     elif args.render:
-        render_from_project(args.render, args.output)
+        apply_tuning_arguments(args)
+        render_from_project(args.render, args.output, args.profile, use_cache=not args.no_cache)
     elif args.export:
         create_sample_project(args.export)
     else:
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Render Worker - renders scene shards for the platform's render farm
+
+Connects to the website via Socket.IO, registers as a render worker and renders
+the shards the coordinator dispatches (see project/render_farm.py).
+
+Usage:
+    python render_worker.py --host http://localhost:5001
+    python render_worker.py --host http://localhost:5001 --name node-a --token SECRET
+
+    # Several local workers for testing (each gets its own work directory)
+    for i in 1 2 3; do python render_worker.py --name local-$i & done
+
+Each shard:
+    1. The source is read straight from the signed source_url; ffmpeg issues
+       HTTP Range requests, so only the byte ranges around each cut are fetched
+    2. TTS audio is downloaded from audio_urls, or synthesized locally when absent
+    3. render_core.render renders the shard
+    4. The clip is uploaded to the signed upload_url and the result reported
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+try:
+    import socketio
+except ImportError:
+    print("ERROR: python-socketio is required")
+    print("Install with: pip install python-socketio python-engineio")
+    sys.exit(1)
+
+import requests
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class RenderWorkerApp:
+    """Render farm worker that connects via Socket.IO"""
+
+    def __init__(self, host, name, token=None, work_dir=None, jobs=None):
+        self.host = host.rstrip('/')
+        self.name = name
+        self.token = token
+        self.work_dir = os.path.abspath(work_dir or os.path.join(REPO_DIR, f"render_worker_{name}"))
+        self.jobs = jobs
+        self.sio = None
+        self.queue = deque()
+        self.lock = threading.Lock()
+        self.rendered_count = 0
+        self.error_count = 0
+
+    def log(self, message):
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] [{self.name}] {message}")
+
+    def connect(self):
+        self.sio = socketio.Client(reconnection=True, reconnection_delay=1, reconnection_delay_max=5)
+
+        @self.sio.event
+        def connect():
+            self.sio.emit('render_worker_register', {
+                'worker_name': self.name,
+                'slots': 1,
+                'token': self.token
+            })
+
+        @self.sio.event
+        def render_worker_registered(data):
+            if data.get('success'):
+                self.log(f"Registered: {data.get('message')}")
+            else:
+                self.log(f"Registration failed: {data.get('message')}")
+                self.sio.disconnect()
+
+        @self.sio.event
+        def render_shard(data):
+            self.log(f"Shard {data.get('job_id', '')[:8]}/{data.get('shard')} received "
+                     f"({len(data.get('scenes', []))} scenes, attempt {data.get('attempt')})")
+            with self.lock:
+                self.queue.append(data)
+
+        @self.sio.event
+        def disconnect():
+            self.log("Disconnected")
+
+        # render_core uses a cwd-relative temp directory, so each worker renders in its own
+        os.makedirs(self.work_dir, exist_ok=True)
+        os.chdir(self.work_dir)
+        sys.path.insert(0, REPO_DIR)
+
+        self.log(f"Connecting to {self.host}...")
+        self.sio.connect(self.host, transports=['websocket', 'polling'])
+        threading.Thread(target=self.process_shards, daemon=True).start()
+        self.sio.wait()
+
+    def process_shards(self):
+        # One shard at a time: render_core keeps per-process render state
+        while True:
+            with self.lock:
+                shard = self.queue.popleft() if self.queue else None
+            if not shard:
+                time.sleep(0.2)
+                continue
+            result = {'job_id': shard['job_id'], 'shard': shard['shard'], 'attempt': shard['attempt']}
+            try:
+                result.update(self.render_shard(shard))
+                result['status'] = 'completed'
+                self.rendered_count += 1
+            except Exception as e:
+                self.log(f"Shard {shard['shard']} failed: {e}")
+                result.update({'status': 'failed', 'error': str(e)[:500]})
+                self.error_count += 1
+            self.sio.emit('render_shard_result', result)
+
+    def render_shard(self, shard):
+        import render_core
+
+        shard_dir = os.path.join(self.work_dir, 'shard_audio')
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        os.makedirs(shard_dir)
+        os.makedirs(render_core.config.TEMP_DIR, exist_ok=True)
+
+        scenes = shard['scenes']
+        if shard.get('audio_urls'):
+            audio_files = {}
+            for idx, url in shard['audio_urls'].items():
+                path = os.path.join(shard_dir, f"audio_{idx}.mp3")
+                self.download(url, path)
+                audio_files[idx] = path
+        else:
+            audio_files = render_core.tts(scenes, shard.get('voice'), shard.get('rate') or '+0%', shard_dir)
+
+        settings = shard.get('settings') or {}
+        start = time.time()
+        final_path = render_core.render(
+            shard['source_url'], scenes, audio_files,
+            resolution=settings.get('resolution', 'native'),
+            cut_method=settings.get('cut_method', 'pad'),
+            burn_subtitles=settings.get('burn_subtitles', False),
+            workers=self.jobs
+        )
+        duration = render_core.get_duration(final_path)
+        srt_path = os.path.splitext(final_path)[0] + '.srt'
+        with open(srt_path, 'r', encoding='utf-8') as f:
+            srt = f.read()
+
+        with open(final_path, 'rb') as f:
+            resp = requests.put(shard['upload_url'], data=f, timeout=600)
+        resp.raise_for_status()
+        self.log(f"Shard {shard['shard']} done: {duration:.1f}s of video in {time.time() - start:.1f}s")
+        return {'duration': duration, 'srt': srt}
+
+    def download(self, url, path):
+        with requests.get(url, stream=True, timeout=120) as resp:
+            resp.raise_for_status()
+            with open(path, 'wb') as f:
+                for chunk in resp.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NarratoAI render farm worker")
+    parser.add_argument("--host", default="http://localhost:5001", help="Website URL")
+    parser.add_argument("--name", default=f"worker-{os.getpid()}", help="Worker name (unique per node)")
+    parser.add_argument("--token", default=os.environ.get("RENDER_FARM_TOKEN"), help="Render farm token")
+    parser.add_argument("--work-dir", help="Scratch directory (default: render_worker_<name>)")
+    parser.add_argument("--jobs", "-j", type=int, help="Scenes rendered in parallel within a shard (default: RENDER_WORKERS)")
+    args = parser.parse_args()
+
+    worker = RenderWorkerApp(args.host, args.name, args.token, args.work_dir, args.jobs)
+    try:
+        worker.connect()
+    except KeyboardInterrupt:
+        worker.log(f"Stopped: {worker.rendered_count} rendered, {worker.error_count} failed")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,8 +4,10 @@ eventlet.monkey_patch()
 
 from project import create_app
 from project.database import init_db, backup_db
+from project.activity import activity_tracker
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
+import logging
 
 app = create_app()
 
@@ -13,17 +15,23 @@ app = create_app()
 with app.app_context():
     init_db()
 
-# Scheduler for automatic database backups
+# Scheduler for automatic database backups (online copies, old ones rotated out)
 def run_backup():
     with app.app_context():
-        backup_db()
+        result = backup_db()
+    if not result['success']:
+        logging.error(f"Scheduled database backup failed: {result['message']}")
 
 scheduler = BackgroundScheduler()
-scheduler.add_job(func=run_backup, trigger="interval", days=1)
+scheduler.add_job(func=run_backup, trigger="interval", days=1, max_instances=1, coalesce=True)
+# Write buffered last_seen / daily active users even when no requests arrive
+scheduler.add_job(func=activity_tracker.flush, trigger="interval", seconds=activity_tracker.FLUSH_INTERVAL)
 scheduler.start()
 
 # Shut down the scheduler when exiting the app
 atexit.register(lambda: scheduler.shutdown())
+# Registered last so it runs first: keep the activity buffered since the last flush
+atexit.register(activity_tracker.flush)
 
 # Get the socketio instance if it was created
 socketio = getattr(app, 'socketio', None)
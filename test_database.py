@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Storage layer tests for project.database (no Flask app or server needed)
+
+Builds a database in the old single-blob layout, lets open_db() migrate it to
+the per-entity tables and checks that load/save round-trips and only writes
+the rows that changed.
+
+Run: python -m pytest -q test_database.py   (or python test_database.py)
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from project import database
+from project.database import open_db, save_db
+
+
+def legacy_blob():
+    return {
+        "users": {f"user{i}": {"email": f"user{i}@example.com", "points": i} for i in range(3)},
+        "spaces": {
+            "s1": {"id": "s1", "name": "Space", "templates": {"t1": {"id": "t1", "name": "Template"}}},
+            "s2": {"id": "s2", "name": "No templates"},
+        },
+        "settings": {"chat_is_muted": False},
+        "chat_messages": [{"id": f"m{i}", "username": "user0", "content": str(i)} for i in range(3)],
+        "chat_history": [{"id": "h0", "username": "user1", "content": "old"}],
+        "orders": [{"id": "o1", "user": "user0"}, {"user": "user1"}],
+        "webhook_events": [{"id": "e1", "status": "success"}],
+        "daily_active_users": {"2026-01-01": ["user0", "user1"]},
+        "invitation_codes": {"CODE": {"uses": 1}},
+        "uploaded_files": {},
+    }
+
+
+def make_legacy_db(data):
+    path = os.path.join(tempfile.mkdtemp(prefix="db_test_"), "database.sqlite")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE app_data (key TEXT PRIMARY KEY, value TEXT);")
+    conn.execute("INSERT INTO app_data VALUES ('main_db', ?);", (json.dumps(data, indent=4),))
+    conn.commit()
+    conn.close()
+    return path
+
+
+def record_writes(monkeypatch):
+    writes = []
+    connect = database._connect
+
+    def tracing_connect(db_path, **kwargs):
+        conn = connect(db_path, **kwargs)
+        conn.set_trace_callback(
+            lambda sql: writes.append(sql) if sql.split()[0] in ("INSERT", "UPDATE", "DELETE", "BEGIN") else None)
+        return conn
+
+    monkeypatch.setattr(database, "_connect", tracing_connect)
+    database.close_db_connections()  # pooled connections were opened before tracing
+    return writes
+
+
+def test_blob_is_migrated_and_round_trips():
+    data = legacy_blob()
+    path = make_legacy_db(data)
+    db = open_db(path)
+    chat = data.pop("chat_history") + data.pop("chat_messages")
+    assert json.loads(json.dumps(db)) == data
+    assert "main_db" not in db
+    assert [m["id"] for m in database.get_chat_messages(path)] == [m["id"] for m in chat]
+    assert os.listdir(os.path.join(os.path.dirname(path), "backups"))
+
+
+def test_save_writes_only_changed_rows(monkeypatch):
+    path = make_legacy_db(legacy_blob())
+    db = open_db(path)
+    writes = record_writes(monkeypatch)
+    db["users"]["user1"]["points"] = 42
+    save_db(db)
+    rows = [sql for sql in writes if sql.startswith(("INSERT", "UPDATE", "DELETE")) and "db_generations" not in sql]
+    assert len(rows) == 1 and "UPDATE users" in rows[0]
+    assert open_db(path)["users"]["user1"]["points"] == 42
+
+
+def test_read_cache_is_private_and_invalidated():
+    path = make_legacy_db(legacy_blob())
+    reader = open_db(path)
+    reader["users"]["user0"]["points"] = -1  # not saved: must not leak into the cache
+    assert open_db(path)["users"]["user0"]["points"] == 0
+
+    writer = open_db(path)
+    writer["users"]["user0"]["points"] = 7
+    writer["settings"]["chat_is_muted"] = True
+    save_db(writer)
+    db = open_db(path)
+    assert db["users"]["user0"]["points"] == 7
+    assert db["settings"]["chat_is_muted"] is True
+
+
+def test_list_collections_keep_order():
+    path = make_legacy_db(legacy_blob())
+    db = open_db(path)
+    db["orders"].append({"id": "o2", "user": "user2"})
+    db["orders"].pop(0)
+    db["webhook_events"].insert(0, {"id": "e0", "status": "ignored"})
+    db["spaces"]["s1"]["templates"]["t2"] = {"id": "t2", "name": "Second"}
+    del db["users"]["user2"]
+    save_db(db)
+
+    db = open_db(path)
+    assert [o.get("id") for o in db["orders"]] == [None, "o2"]
+    assert [e["id"] for e in db["webhook_events"]] == ["e0", "e1"]
+    assert list(db["spaces"]["s1"]["templates"]) == ["t1", "t2"]
+    assert "templates" not in db["spaces"]["s2"]
+    assert list(db["users"]) == ["user0", "user1"]
+
+
+
+def test_chat_log_pages_by_cursor():
+    path = make_legacy_db(legacy_blob())
+    open_db(path)
+    seqs = [database.add_chat_message(path, "user2", f"new{i}")["seq"] for i in range(5)]
+    assert seqs == sorted(seqs) and seqs[0] > 4  # after the 4 migrated messages
+
+    page = database.get_chat_messages(path, limit=3)
+    assert [m["content"] for m in page] == ["new2", "new3", "new4"]
+    older = database.get_chat_messages(path, before=page[0]["seq"], limit=3)
+    assert [m["content"] for m in older] == ["2", "new0", "new1"]
+    assert [m["content"] for m in database.get_chat_messages(path, after=seqs[3])] == ["new4"]
+
+    assert database.delete_chat_message(path, page[0]["id"])
+    assert not database.delete_chat_message(path, page[0]["id"])
+    assert database.add_chat_message(path, "user2", "later")["seq"] > seqs[-1]  # ids are never reused
+
+    newest = database.get_chat_messages(path, limit=1)[0]
+    assert database.count_chat_messages_since(path, newest["timestamp"]) == 0
+    assert database.count_chat_messages_since(path, 0) == 5  # the migrated messages have no timestamp
+    assert database.count_chat_messages_since(path, 0, limit=3) == 3
+
+
+
+def test_backup_is_a_checked_compressed_copy_and_rotates():
+    import gzip
+    import hashlib
+    path = make_legacy_db(legacy_blob())
+    backup_dir = os.path.join(os.path.dirname(path), "db_backups")
+    os.makedirs(backup_dir)
+    for day in range(3):  # older backups, the first one past the age limit
+        old = os.path.join(backup_dir, f"db_backup_2026010{day}_000000.sqlite.gz")
+        open(old, "wb").close()
+        os.utime(old, (0, 0) if day == 0 else None)
+
+    result = database.backup_db(path, backup_dir, keep=3, max_age_days=30)
+    assert result["success"], result["message"]
+    assert sorted(result["removed"]) == ["db_backup_20260100_000000.sqlite.gz"]
+    with open(result["path"], "rb") as f:
+        assert hashlib.sha256(f.read()).hexdigest() == result["sha256"]
+    with open(result["path"] + ".sha256") as f:
+        assert f.read().split() == [result["sha256"], os.path.basename(result["path"])]
+
+    restored = os.path.join(backup_dir, "restored.sqlite")
+    with gzip.open(result["path"]) as src, open(restored, "wb") as dest:
+        dest.write(src.read())
+    assert open_db(restored)["users"]["user2"]["points"] == 2
+
+
+def test_request_scoped_db_commits_on_save():
+    from flask import Flask
+    path = make_legacy_db(legacy_blob())
+    app = Flask(__name__)
+    app.instance_path = os.path.dirname(path)
+    app.config["DB_FILE"] = os.path.basename(path)
+    app.teardown_request(database.release_request_db)
+    open_db(path)  # migrate first
+
+    with app.test_request_context("/"):
+        db = database.load_db()
+        assert database.load_db() is db
+        copy = database.load_db_copy()
+        copy["users"]["user0"]["is_pro"] = True  # derived for display, never saved
+        db["users"]["user0"]["points"] = 5
+        save_db(db)
+        assert open_db(path)["users"]["user0"]["points"] == 5  # committed before the response
+        db["settings"]["chat_is_muted"] = True
+        save_db(db)
+        db["users"]["user0"]["points"] = 6  # not saved
+
+    db = open_db(path)
+    assert db["users"]["user0"] == {"email": "user0@example.com", "points": 5}
+    assert db["settings"]["chat_is_muted"] is True
+
+
+def test_concurrent_saves_merge_instead_of_overwriting():
+    path = make_legacy_db(legacy_blob())
+    first, second = open_db(path), open_db(path)
+    first["users"]["user0"]["points"] = 10
+    first["settings"]["chat_is_muted"] = True
+    second["users"]["user0"]["email"] = "new@example.com"
+    second["settings"]["sensitive_words"] = ["spam"]
+    save_db(first)
+    save_db(second)  # loaded before first was saved
+
+    assert second["users"]["user0"] == {"email": "new@example.com", "points": 10}
+    db = open_db(path)
+    assert db["users"]["user0"] == {"email": "new@example.com", "points": 10}
+    assert db["settings"] == {"chat_is_muted": True, "sensitive_words": ["spam"]}
+
+
+def test_db_transaction_commits_or_rolls_back():
+    from flask import Flask
+    path = make_legacy_db(legacy_blob())
+    app = Flask(__name__)
+    app.instance_path = os.path.dirname(path)
+    app.config["DB_FILE"] = os.path.basename(path)
+
+    stale = open_db(path)
+    stale["users"]["user1"]["points"]
+    with app.app_context():
+        with database.db_transaction() as db:
+            db["users"]["user1"]["points"] += 1
+        try:
+            with database.db_transaction() as db:
+                db["users"]["user1"]["points"] += 100
+                raise RuntimeError
+        except RuntimeError:
+            pass
+    assert open_db(path)["users"]["user1"]["points"] == 2
+
+    stale["users"]["user1"]["email"] = "stale@example.com"
+    save_db(stale)
+    assert open_db(path)["users"]["user1"] == {"email": "stale@example.com", "points": 2}
+
+
+def test_api_key_index_follows_user_changes():
+    data = legacy_blob()
+    data["users"]["user1"]["api_key"] = "key-1"
+    path = make_legacy_db(data)
+    db = open_db(path)
+    assert database.find_username_by_api_key(db, "key-1") == "user1"
+
+    db["users"]["user1"]["api_key"] = "key-2"
+    db["users"]["user3"] = {"api_key": "key-3"}
+    del db["users"]["user0"]
+    save_db(db)
+    db = open_db(path)
+    assert database.find_username_by_api_key(db, "key-1") is None
+    assert database.find_username_by_api_key(db, "key-2") == "user1"
+    assert database.find_username_by_api_key(db, "key-3") == "user3"
+
+    del db["users"]["user3"]
+    save_db(db)
+    assert database.find_username_by_api_key(open_db(path), "key-3") is None
+
+
+def test_email_and_username_lookups():
+    path = make_legacy_db(legacy_blob())
+    db = open_db(path)
+    assert database.find_usernames_by_email(db, "user1@example.com") == ["user1"]
+    assert database.find_username_ignore_case(db, "USER2") == "user2"
+    assert database.find_username_ignore_case(db, "nobody") is None
+
+    db["users"]["user0"]["email"] = "user1@example.com"
+    save_db(db)
+    assert database.find_usernames_by_email(open_db(path), "user1@example.com") == ["user0", "user1"]
+    assert database.find_usernames_by_email(open_db(path), "user0@example.com") == []
+
+
+def test_space_and_template_lookups():
+    path = make_legacy_db(legacy_blob())
+    db = open_db(path)
+    db["spaces"]["s2"]["card_type"] = "websockets"
+    save_db(db)
+
+    db = open_db(path)
+    assert database.find_space_ids(db, name="Space") == ["s1"]
+    assert database.find_space_ids(db, name="No templates", card_type="websockets") == ["s2"]
+    assert database.find_space_ids(db, name="Space", card_type="websockets") == []
+    assert database.find_template_id(db, "s1", "Template") == "t1"
+    assert database.find_template_id(db, "s1", "Missing") is None
+
+    db["spaces"]["s1"]["templates"]["t1"]["name"] = "Renamed"
+    save_db(db)
+    assert database.find_template_id(open_db(path), "s1", "Renamed") == "t1"
+
+
+def test_activity_is_written_in_batches():
+    from datetime import datetime
+    from project.activity import ActivityTracker
+    path = make_legacy_db(legacy_blob())
+    open_db(path)
+    tracker = ActivityTracker()
+    tracker.last_flush = float("inf")  # no automatic flush
+    tracker.record(path, "user0", datetime(2026, 1, 1, 8, 0))
+    tracker.record(path, "user2", datetime(2026, 1, 1, 9, 0))
+    tracker.record(path, "user2", datetime(2026, 1, 2, 9, 0))
+    assert open_db(path)["daily_active_users"] == {"2026-01-01": ["user0", "user1"]}
+    assert tracker.get_last_seen(path)["user2"] == "2026-01-02T09:00:00"
+
+    assert tracker.flush() == 2
+    db = open_db(path)
+    assert db["daily_active_users"] == {"2026-01-01": ["user0", "user1", "user2"], "2026-01-02": ["user2"]}
+    assert database.load_last_seen(path) == {"user0": "2026-01-01T08:00:00", "user2": "2026-01-02T09:00:00"}
+
+
+def test_usage_counters_reserve_commit_release():
+    import threading
+    data = legacy_blob()
+    data["users"]["user0"]["daily_usage"] = {"date": "2026-01-01", "chat_count": 3, "websocket_count": 0}
+    path = make_legacy_db(data)
+    open_db(path)
+    assert database.get_usage_counts(path, "user0", "chat", "2026-01-01") == (3, 0)
+
+    results = []
+    def reserve():
+        results.append(database.reserve_usage_unit(path, "user1", "chat", "2026-01-01", 5))
+    threads = [threading.Thread(target=reserve) for _ in range(8)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    assert results.count(True) == 5
+    assert database.get_usage_counts(path, "user1", "chat", "2026-01-01") == (0, 5)
+
+    database.settle_usage_unit(path, "user1", "chat", "2026-01-01", used=True)
+    database.settle_usage_unit(path, "user1", "chat", "2026-01-01", used=False)
+    assert database.get_usage_counts(path, "user1", "chat", "2026-01-01") == (1, 3)
+    assert database.reserve_usage_unit(path, "user1", "chat", "2026-01-01", 5)
+    assert not database.reserve_usage_unit(path, "user1", "chat", "2026-01-01", 5)
+    assert database.reserve_usage_unit(path, "user1", "chat", "2026-01-02", 5)  # a new day, a new row
+    database.refund_usage_unit(path, "user1", "chat", "2026-01-01")
+    assert database.get_usage_counts(path, "user1", "chat", "2026-01-01") == (0, 4)
+    assert not database.reserve_usage_unit(path, "user2", "chat", "2026-01-01", 0)
+
+
+def test_rename_user_rows_moves_with_the_rename():
+    from flask import Flask
+    path = make_legacy_db(legacy_blob())
+    app = Flask(__name__)
+    app.instance_path = os.path.dirname(path)
+    app.config["DB_FILE"] = os.path.basename(path)
+    open_db(path)
+    database.add_chat_message(path, "user2", "hi")
+    for day, limit in (("2026-01-01", 5), ("2026-01-01", 5), ("2026-01-02", 5)):
+        database.reserve_usage_unit(path, "user2", "chat", day, limit)
+    database.reserve_usage_unit(path, "renamed", "chat", "2026-01-01", 5)  # left by an earlier owner of the name
+    database.settle_usage_unit(path, "user2", "chat", "2026-01-01", used=True)
+    database.write_activity(path, {"user2": "2026-01-02T09:00:00", "renamed": "2026-01-01T08:00:00"}, [])
+
+    with app.app_context():
+        try:
+            with database.db_transaction() as db:
+                db["users"]["renamed"] = db["users"].pop("user2")
+                database.rename_user_rows(db, "user2", "renamed")
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        assert database.get_usage_counts(path, "user2", "chat", "2026-01-01") == (1, 1)
+
+        with database.db_transaction() as db:
+            db["users"]["renamed"] = db["users"].pop("user2")
+            database.rename_user_rows(db, "user2", "renamed")
+    assert database.get_usage_counts(path, "user2", "chat", "2026-01-01") == (0, 0)
+    assert database.get_usage_counts(path, "renamed", "chat", "2026-01-01") == (1, 2)
+    assert database.get_usage_counts(path, "renamed", "chat", "2026-01-02") == (0, 1)
+    assert database.get_latest_chat_message(path, ["renamed"])["content"] == "hi"
+    assert database.get_latest_chat_message(path, ["user2"]) is None
+    assert database.load_last_seen(path) == {"renamed": "2026-01-02T09:00:00"}
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
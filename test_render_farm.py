@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Render farm scheduling tests (no ffmpeg or Socket.IO server needed)
+
+Drives project.render_farm.RenderFarm with fake emit/spawn hooks to check
+sharding, dispatch, retry on dead workers and SRT stitching.
+
+Run: python -m pytest -q test_render_farm.py   (or python test_render_farm.py)
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from project.render_farm import RenderFarm, check_worker_token, merge_srt, JOB_RETENTION, MAX_SHARD_ATTEMPTS
+
+
+def make_farm():
+    root = tempfile.mkdtemp(prefix="render_farm_test_")
+    sent, spawned = [], []
+    farm = RenderFarm()
+    farm.configure(root, "test-secret",
+                   emit=lambda event, data, to=None: sent.append((event, data, to)),
+                   spawn=lambda fn, *args: spawned.append((fn, args)))
+    source = os.path.join(root, "source.mp4")
+    with open(source, "wb") as f:
+        f.write(b"\0" * 16)
+    return farm, sent, spawned, source
+
+
+def scenes(n):
+    return [{"voiceover": f"scene {i}", "fragments": [{"start": i, "end": i + 1}]} for i in range(n)]
+
+
+def complete(farm, sid, payload):
+    path = farm.resolve_blob(payload["upload_url"].rsplit("/", 1)[1], "PUT")
+    with open(path, "wb") as f:
+        f.write(b"clip")
+    return farm.handle_result(sid, {
+        "job_id": payload["job_id"], "shard": payload["shard"], "attempt": payload["attempt"],
+        "status": "completed", "duration": 2.0,
+        "srt": "1\n00:00:00,000 --> 00:00:01,500\nhello\n"
+    })
+
+
+def test_shards_are_spread_across_workers():
+    farm, sent, spawned, source = make_farm()
+    farm.register_worker("sid-a", "a")
+    farm.register_worker("sid-b", "b")
+    job_id = farm.submit_job(source, scenes(5), "http://coordinator", shard_scenes=2)
+
+    assert len(farm.jobs[job_id].shards) == 3
+    assert sorted(to for _, _, to in sent) == ["sid-a", "sid-b"]
+    assert len(farm.pending) == 1
+
+    for event, payload, sid in list(sent):
+        assert complete(farm, sid, payload)
+    assert len(sent) == 3  # third shard dispatched once a worker freed up
+    complete(farm, sent[2][2], sent[2][1])
+
+    assert farm.get_job_status(job_id)["status"] == "stitching"
+    assert len(spawned) == 1
+
+
+def test_dead_worker_shard_is_retried_elsewhere():
+    farm, sent, spawned, source = make_farm()
+    farm.register_worker("sid-a", "a")
+    job_id = farm.submit_job(source, scenes(2), "http://coordinator", shard_scenes=2)
+    assert sent[-1][2] == "sid-a"
+
+    farm.register_worker("sid-b", "b")
+    farm.unregister_worker("sid-a")
+    event, payload, sid = sent[-1]
+    assert sid == "sid-b" and payload["attempt"] == 2
+
+    # A late upload or result from the dead worker's attempt is refused
+    stale_token = sent[0][1]["upload_url"].rsplit("/", 1)[1]
+    assert farm.resolve_blob(stale_token, "PUT") is None
+    assert not farm.handle_result("sid-a", {"job_id": job_id, "shard": 0, "attempt": 1, "status": "completed"})
+    assert complete(farm, sid, payload)
+    assert farm.resolve_blob(payload["upload_url"].rsplit("/", 1)[1], "PUT") is None
+
+
+def test_job_fails_after_max_attempts():
+    farm, sent, spawned, source = make_farm()
+    farm.register_worker("sid-a", "a")
+    job_id = farm.submit_job(source, scenes(1), "http://coordinator")
+    for _ in range(MAX_SHARD_ATTEMPTS):
+        event, payload, sid = sent[-1]
+        farm.handle_result(sid, {"job_id": job_id, "shard": 0, "attempt": payload["attempt"],
+                                 "status": "failed", "error": "boom"})
+    assert farm.get_job_status(job_id)["status"] == "failed"
+
+
+def test_stale_shards_are_reaped():
+    farm, sent, spawned, source = make_farm()
+    farm.register_worker("sid-a", "a")
+    farm.register_worker("sid-b", "b")
+    job_id = farm.submit_job(source, scenes(1), "http://coordinator")
+    first = sent[-1][2]
+    assert farm.reap_stale(now=farm.jobs[job_id].shards[0].dispatched_at + 10 ** 6) == 1
+    assert sent[-1][2] != first
+
+
+def test_finished_jobs_are_cleaned_up(monkeypatch):
+    import subprocess
+    from project import render_farm as render_farm_module
+    farm, sent, spawned, source = make_farm()
+    input_dir = os.path.join(farm.root_dir, "inputs", "job")
+    os.makedirs(input_dir)
+    farm.register_worker("sid-a", "a")
+    job_id = farm.submit_job(source, scenes(1), "http://coordinator", input_dir=input_dir)
+    assert complete(farm, "sid-a", sent[-1][1])
+
+    monkeypatch.setattr(render_farm_module.subprocess, "run",
+                        lambda *args, **kwargs: subprocess.CompletedProcess(args, 0, "", ""))
+    fn, args = spawned[-1]
+    fn(*args)
+    job = farm.jobs[job_id]
+    assert farm.get_job_output(job_id) == (job.output_path, job.srt_path)
+    assert sorted(os.listdir(job.job_dir)) == ["output.srt"]  # clips deleted after stitching
+
+    assert farm.expire_jobs(now=job.finished_time + JOB_RETENTION - 1) == 0
+    assert farm.expire_jobs(now=job.finished_time + JOB_RETENTION + 1) == 1
+    assert job_id not in farm.jobs and farm.get_job_output(job_id) is None
+    assert not os.path.exists(job.job_dir) and not os.path.exists(input_dir)
+
+
+def test_blob_tokens_are_method_bound():
+    farm, sent, spawned, source = make_farm()
+    url = farm.blob_url("http://coordinator", source)
+    token = url.rsplit("/", 1)[1]
+    assert farm.resolve_blob(token, "GET") == os.path.abspath(source)
+    assert farm.resolve_blob(token, "PUT") is None
+    assert farm.resolve_blob(token + "x", "GET") is None
+
+
+def test_worker_token_fails_closed():
+    assert check_worker_token(None, "anything") == "Render farm token not configured"
+    assert check_worker_token("", "") == "Render farm token not configured"
+    assert check_worker_token("s3cret", "wrong") == "Invalid token"
+    assert check_worker_token("s3cret", None) == "Invalid token"
+    assert check_worker_token("s3cret", "s3cret") is None
+
+
+def test_merge_srt_offsets_by_shard_duration():
+    srt = merge_srt([
+        ("1\n00:00:00,000 --> 00:00:02,000\na\n", 2.5),
+        ("1\n00:00:00,500 --> 00:00:01,000\nb\n", 1.0),
+    ])
+    assert "2\n00:00:03,000 --> 00:00:03,500\nb" in srt
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"✓ {name}")
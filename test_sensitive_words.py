@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Sensitive-word matcher tests (no Flask app needed)
+
+Checks project.sensitive_words.WordMatcher against the plain substring test it
+replaces and that SensitiveWordFilter follows changes to the word list.
+
+Run: python -m pytest -q test_sensitive_words.py   (or python test_sensitive_words.py)
+"""
+
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from project.sensitive_words import WordMatcher, SensitiveWordFilter
+
+
+def test_overlapping_and_nested_words():
+    matcher = WordMatcher(["he", "she", "his", "hers", "敏感", "感词", ""])
+    assert matcher.find_all("ushers") == ["she", "he", "hers"]
+    assert matcher.find_all("这是敏感词") == ["敏感", "感词"]
+    assert matcher.find_all("nothing to see") == []
+    assert WordMatcher([]).find_all("anything") == []
+
+
+def test_matches_substring_search():
+    rng = random.Random(0)
+    for _ in range(200):
+        words = ["".join(rng.choice("abc") for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))]
+        text = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 30)))
+        assert set(WordMatcher(words).find_all(text)) == {word for word in words if word in text}
+
+
+def test_filter_follows_the_word_list():
+    word_filter = SensitiveWordFilter()
+    db = {"sensitive_words": ["spam"]}
+    assert word_filter.find_all(db, "no spam please") == ["spam"]
+    matcher = word_filter.matcher
+    assert word_filter.find_all(db, "clean") == [] and word_filter.matcher is matcher  # not rebuilt
+    db["sensitive_words"].append("eggs")
+    assert word_filter.find_all(db, "spam and eggs") == ["spam", "eggs"]
+    assert word_filter.find_all({}, "spam") == []
+
+
+if __name__ == "__main__":
+    for name, fn in list(globals().items()):
+        if name.startswith("test_"):
+            fn()
+            print(f"✓ {name}")
@@ -26,26 +26,15 @@ def verify_gpu_pool(page):
     return admin_user, normal_user
 
 def promote_to_admin(username):
-    import sqlite3
-    import json
-    import os
+    from project.database import open_db, save_db
 
     # Corrected path based on ls output
     db_path = "instance/database.sqlite"
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    cursor.execute("SELECT value FROM app_data WHERE key = 'main_db'")
-    row = cursor.fetchone()
-    if row:
-        db_data = json.loads(row['value'])
-        if username in db_data['users']:
-            db_data['users'][username]['is_admin'] = True
-            new_json = json.dumps(db_data)
-            cursor.execute("UPDATE app_data SET value = ? WHERE key = 'main_db'", (new_json,))
-            conn.commit()
-    conn.close()
+    db_data = open_db(db_path)
+    if username in db_data['users']:
+        db_data['users'][username]['is_admin'] = True
+        save_db(db_data)
 
 if __name__ == "__main__":
     with sync_playwright() as p:
@@ -1,33 +1,20 @@
 import argparse
-import json
-import sqlite3
 import time
 import uuid
 from pathlib import Path
 
 from openai import OpenAI
 
+from project.database import open_db, save_db
+
 
 def _load_main_db(db_path: Path) -> dict:
-    con = sqlite3.connect(str(db_path))
-    cur = con.cursor()
-    row = cur.execute("SELECT value FROM app_data WHERE key = ?", ("main_db",)).fetchone()
-    con.close()
-    if not row:
-        return {}
-    return json.loads(row[0])
+    return open_db(str(db_path))
 
 
 def _save_main_db(db_path: Path, data: dict) -> None:
-    payload = json.dumps(data, ensure_ascii=False, indent=4)
-    con = sqlite3.connect(str(db_path))
-    cur = con.cursor()
-    cur.execute(
-        "INSERT OR REPLACE INTO app_data (key, value) VALUES (?, ?)",
-        ("main_db", payload),
-    )
-    con.commit()
-    con.close()
+    # data is the Database returned by _load_main_db(); only changed rows are written
+    save_db(data)
 
 
 def _mask_key(value: str) -> str: